@@ -0,0 +1,329 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "16"))
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "30"))
+
+# Weighted-fair share of the workers per subscription tier, e.g. "subscriber:4,free:1"
+ANALYSIS_TIER_WEIGHTS = os.getenv("ANALYSIS_TIER_WEIGHTS", "subscriber:4,free:1")
+# A request queued longer than this is served next regardless of its tier's share
+ANALYSIS_STARVATION_SECONDS = float(os.getenv("ANALYSIS_STARVATION_SECONDS", "10"))
+
+TIER_SUBSCRIBER = "subscriber"
+TIER_FREE = "free"
+
+# Starting guess for the service time of an analysis type before anything was measured
+INITIAL_SERVICE_TIME = 1.0
+# Weight of the newest measurement in the service time moving average
+SERVICE_TIME_ALPHA = 0.2
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+# Latency samples kept per tier for the percentile metrics
+LATENCY_WINDOW = 1024
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+class AdmissionRejected(Exception):
+    """The request cannot be served within its deadline; retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class ClientDisconnected(Exception):
+    pass
+
+def parse_tier_weights(spec: str) -> Dict[str, float]:
+    """"subscriber:4,free:1" -> {"subscriber": 4.0, "free": 1.0}"""
+    weights = {}
+    for part in spec.split(","):
+        tier, _, weight = part.strip().partition(":")
+        if tier:
+            weights[tier] = float(weight or 1)
+    return weights
+
+def percentile(samples: List[float], quantile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+class _Waiter:
+    __slots__ = ("future", "key", "enqueued_at")
+
+    def __init__(self, key: Tuple[str, str]):
+        self.future = asyncio.get_event_loop().create_future()
+        self.key = key
+        self.enqueued_at = time.monotonic()
+
+class AnalysisScheduler:
+    """Admission control in front of the analysis workers.
+
+    At most `workers` analyses run at once. Every (subscription tier, analysis type) pair has
+    its own bounded queue, and a request is rejected up front when its queue is full or when
+    the estimated wait (work queued ahead of it at the measured per-type service times) would
+    blow its deadline.
+
+    Free worker slots go to the tiers in proportion to their weights (stride scheduling), so
+    a flood in one tier cannot take over the workers. A request that has waited longer than
+    `starvation_seconds` is served next whatever its tier.
+    """
+
+    def __init__(
+        self,
+        workers: int = ANALYSIS_WORKERS,
+        queue_depth: int = ANALYSIS_QUEUE_DEPTH,
+        queue_depths: Optional[Dict[str, int]] = None,
+        tier_weights: Optional[Dict[str, float]] = None,
+        starvation_seconds: float = ANALYSIS_STARVATION_SECONDS
+    ):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queue_depths = queue_depths or {}
+        self.tier_weights = tier_weights or parse_tier_weights(ANALYSIS_TIER_WEIGHTS)
+        self.starvation_seconds = starvation_seconds
+        self.running = 0
+        self.queues: Dict[Tuple[str, str], Deque[_Waiter]] = {}
+        self.service_time: Dict[str, float] = {}
+        self.counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        # Stride scheduling: a tier's pass advances by 1/weight each time it gets a slot
+        self.tier_pass: Dict[str, float] = {}
+        self.virtual_time = 0.0
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.queue_waits: Dict[str, Deque[float]] = {}
+
+    def _max_depth(self, analysis_type: str) -> int:
+        env_depth = os.getenv(f"ANALYSIS_QUEUE_DEPTH_{analysis_type.upper()}")
+        if env_depth:
+            return int(env_depth)
+        return self.queue_depths.get(analysis_type, self.queue_depth)
+
+    def _weight(self, tier: str) -> float:
+        return self.tier_weights.get(tier, 1.0)
+
+    def _count(self, key: Tuple[str, str], event: str):
+        counters = self.counters.setdefault(key, {
+            "admitted": 0, "rejected_queue_full": 0, "rejected_deadline": 0,
+            "expired_in_queue": 0, "cancelled": 0, "completed": 0
+        })
+        counters[event] += 1
+
+    def _queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _remove(self, waiter: _Waiter):
+        try:
+            self.queues[waiter.key].remove(waiter)
+        except ValueError:
+            pass
+
+    def estimated_wait(self, tier: Optional[str] = None) -> float:
+        """Seconds until a request admitted now (in `tier`, if given) would start running"""
+        if self.running < self.workers and self._queued() == 0:
+            return 0.0
+        average = (
+            sum(self.service_time.values()) / len(self.service_time)
+            if self.service_time else INITIAL_SERVICE_TIME
+        )
+        backlog = self.running * average
+        for (queue_tier, analysis_type), queue in self.queues.items():
+            work = len(queue) * self.service_time.get(analysis_type, INITIAL_SERVICE_TIME)
+            if tier is not None and queue_tier != tier:
+                # Other tiers only delay this one by their share of the workers
+                work *= min(1.0, self._weight(queue_tier) / self._weight(tier))
+            backlog += work
+        return backlog / self.workers
+
+    def _oldest(self, tier: Optional[str] = None) -> Optional[_Waiter]:
+        """Oldest waiting request, across all queues or within one tier"""
+        oldest = None
+        for (queue_tier, _), queue in self.queues.items():
+            if tier is not None and queue_tier != tier:
+                continue
+            if queue and (oldest is None or queue[0].enqueued_at < oldest.enqueued_at):
+                oldest = queue[0]
+        return oldest
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        oldest = self._oldest()
+        if oldest is None:
+            return None
+        if time.monotonic() - oldest.enqueued_at >= self.starvation_seconds:
+            return oldest
+        waiting_tiers = {tier for (tier, _), queue in self.queues.items() if queue}
+        tier = min(waiting_tiers, key=lambda name: (self.tier_pass.get(name, 0.0), -self._weight(name)))
+        return self._oldest(tier)
+
+    def _dispatch(self):
+        """Hand free worker slots to waiting requests"""
+        while self.running < self.workers:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.queues[waiter.key].popleft()
+            self._charge(waiter.key[0])
+            self.running += 1
+            self._record(self.queue_waits, waiter.key[0], time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(True)
+
+    def _activate(self, tier: str):
+        """A tier that was idle rejoins at the current virtual time instead of cashing in its idle time"""
+        if not any(queue for (queue_tier, _), queue in self.queues.items() if queue_tier == tier):
+            self.tier_pass[tier] = max(self.tier_pass.get(tier, 0.0), self.virtual_time)
+
+    def _charge(self, tier: str):
+        self.virtual_time = max(self.virtual_time, self.tier_pass.get(tier, 0.0))
+        self.tier_pass[tier] = max(self.tier_pass.get(tier, 0.0), self.virtual_time) + 1.0 / self._weight(tier)
+
+    def _record(self, samples: Dict[str, Deque[float]], tier: str, value: float):
+        samples.setdefault(tier, deque(maxlen=LATENCY_WINDOW)).append(value)
+
+    def _release(self, key: Tuple[str, str], started: float, enqueued_at: float, _=None):
+        now = time.monotonic()
+        elapsed = now - started
+        analysis_type = key[1]
+        previous = self.service_time.get(analysis_type)
+        self.service_time[analysis_type] = (
+            elapsed if previous is None else SERVICE_TIME_ALPHA * elapsed + (1 - SERVICE_TIME_ALPHA) * previous
+        )
+        self.running -= 1
+        self._count(key, "completed")
+        self._record(self.latencies, key[0], now - enqueued_at)
+        self._dispatch()
+
+    async def run(
+        self,
+        analysis_type: str,
+        work: Callable[[], Awaitable[Any]],
+        deadline: Optional[float] = None,
+        tier: str = TIER_FREE
+    ) -> Any:
+        """Run work() once a worker slot is free, or raise AdmissionRejected"""
+        deadline = deadline or ANALYSIS_DEADLINE_SECONDS
+        key = (tier, analysis_type)
+        queue = self.queues.setdefault(key, deque())
+
+        if len(queue) >= self._max_depth(analysis_type):
+            self._count(key, "rejected_queue_full")
+            raise AdmissionRejected("Analysis queue is full", self.estimated_wait(tier))
+
+        wait = self.estimated_wait(tier)
+        if wait + self.service_time.get(analysis_type, INITIAL_SERVICE_TIME) > deadline:
+            self._count(key, "rejected_deadline")
+            raise AdmissionRejected("Estimated wait exceeds the request deadline", wait)
+
+        self._count(key, "admitted")
+        enqueued_at = time.monotonic()
+
+        if self.running < self.workers and self._queued() == 0:
+            self._charge(tier)
+            self.running += 1
+            self._record(self.queue_waits, tier, 0.0)
+        else:
+            self._activate(tier)
+            waiter = _Waiter(key)
+            queue.append(waiter)
+            self._dispatch()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=deadline)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.future.done():
+                    # The slot was granted just as we gave up, so pass it on
+                    self.running -= 1
+                    self._dispatch()
+                else:
+                    self._remove(waiter)
+                    waiter.future.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    self._count(key, "expired_in_queue")
+                    raise AdmissionRejected("Request deadline expired while queued", self.estimated_wait(tier))
+                self._count(key, "cancelled")
+                raise
+
+        started = time.monotonic()
+        task = asyncio.ensure_future(work())
+        # The slot is only freed when the work really finishes, even if the caller goes away
+        task.add_done_callback(lambda done: self._release(key, started, enqueued_at, done))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            self._count(key, "cancelled")
+            raise
+
+    def metrics(self) -> Dict[str, Any]:
+        tiers = sorted(set(self.tier_weights) | set(self.latencies) | {tier for tier, _ in self.counters})
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self._queued(),
+            "estimated_wait_seconds": self.estimated_wait(),
+            "queues": [
+                {
+                    "tier": tier,
+                    "analysis_type": analysis_type,
+                    "queued": len(self.queues.get((tier, analysis_type), ())),
+                    "max_queue_depth": self._max_depth(analysis_type),
+                    "avg_service_seconds": self.service_time.get(analysis_type, INITIAL_SERVICE_TIME),
+                    **counters
+                }
+                for (tier, analysis_type), counters in self.counters.items()
+            ],
+            "tiers": {
+                tier: {
+                    "weight": self._weight(tier),
+                    "estimated_wait_seconds": self.estimated_wait(tier),
+                    "latency_seconds": {
+                        str(quantile): percentile(list(self.latencies.get(tier, ())), quantile)
+                        for quantile in LATENCY_QUANTILES
+                    },
+                    "queue_wait_seconds": {
+                        str(quantile): percentile(list(self.queue_waits.get(tier, ())), quantile)
+                        for quantile in LATENCY_QUANTILES
+                    }
+                }
+                for tier in tiers
+            }
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        metrics = self.metrics()
+        lines = [
+            f"clario_analysis_workers {metrics['workers']}",
+            f"clario_analysis_running {metrics['running']}",
+            f"clario_analysis_queued {metrics['queued']}",
+            f"clario_analysis_estimated_wait_seconds {metrics['estimated_wait_seconds']:.3f}",
+        ]
+        for queue in metrics["queues"]:
+            labels = f'tier="{queue["tier"]}",analysis_type="{queue["analysis_type"]}"'
+            for name, value in queue.items():
+                if name not in ("tier", "analysis_type"):
+                    lines.append(f"clario_analysis_{name}{{{labels}}} {value}")
+        for tier, values in metrics["tiers"].items():
+            lines.append(f'clario_analysis_tier_estimated_wait_seconds{{tier="{tier}"}} {values["estimated_wait_seconds"]:.3f}')
+            for name in ("latency_seconds", "queue_wait_seconds"):
+                for quantile, value in values[name].items():
+                    lines.append(f'clario_analysis_{name}{{tier="{tier}",quantile="{quantile}"}} {value:.4f}')
+        return lines
+
+async def run_until_disconnected(request, coroutine: Awaitable[Any]) -> Any:
+    """Await coroutine, cancelling it if the HTTP client disconnects first"""
+    task = asyncio.ensure_future(coroutine)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            raise ClientDisconnected()
+
+def retry_after_header(retry_after: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
@@ -4,16 +4,31 @@ import numpy as np
 from PIL import Image
 import io
 import tempfile
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional, AsyncIterator, Iterable, Tuple
 import asyncio
 import concurrent.futures
+import threading
 import base64
 import cv2
 
+from face_detection import FACE_DETECTION_ENABLED, extract_faces
+from video_analysis import analyze_video_frames
+from metadata_analysis import METADATA_ANALYSIS_ENABLED, analyze_metadata
+from copy_move import COPY_MOVE_ENABLED, detect_copy_move
+from image_metrics import METRICS, HEURISTIC_METRICS, DISPLAY_METRICS, PROPERTIES_ONLY, compute_metrics
+from spectral_analysis import SPECTRAL_MODEL, SPECTRAL_THRESHOLD
+from heatmaps import attention_rollout
+from tiling import (
+    TILED_BATCH_SIZE, TilePlan, plan_tiles, scaled_pixels, cut_tiles, normalize_tiles, aggregate_scores, tile_heatmap, tiling_summary
+)
+
 # Try to import optional dependencies
 try:
     import torch
     from transformers import ViTImageProcessor, ViTForImageClassification
+    from token_merging import tome_logits, parse_ratios
+    from model_sharing import mmap_safetensors_weights, freeze_model
     TORCH_AVAILABLE = True
 except ImportError as e:
     print(f"PyTorch/Transformers not available: {e}")
@@ -38,15 +53,53 @@ DEEPFAKE_PROCESSOR = None
 DEEPFAKE_MODEL = None
 MODELS_AVAILABLE = False
 
+# Confidence-gated cascade: the downscaled heuristic stage answers on its own
+# only when it is at least this sure the image is benign
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.85"))
+CASCADE_MAX_SIDE = int(os.getenv("CASCADE_MAX_SIDE", "512"))
+# Downscaling raises a blurred image's sharpness many times over (and lowers a noisy one's),
+# so the fast stage clears only images whose reduced decode stays above this floor.
+# Calibrated at CASCADE_MAX_SIDE=512 on natural versus over-smoothed JPEGs, where no
+# over-smoothed image read above 230; a smaller decode needs a higher floor
+CASCADE_MIN_SHARPNESS = float(os.getenv("CASCADE_MIN_SHARPNESS", "500"))
+
+# ViT speed mode: "full" runs the unmodified models, "tome" merges similar tokens
+# between layers (TOME_RATIO is one ratio for every layer or a comma-separated list)
+VIT_SPEED_MODE = os.getenv("VIT_SPEED_MODE", "full")
+TOME_RATIO = os.getenv("TOME_RATIO", "0.1")
+
+VIT_MODEL_NAME = os.getenv("VIT_MODEL_NAME", "google/vit-base-patch16-224")
+DEEPFAKE_MODEL_NAME = os.getenv("DEEPFAKE_MODEL_NAME", "prithivMLmods/Deep-Fake-Detector-v2-Model")
+
+# Re-point the weights at the memory-mapped safetensors files so processes forked
+# after loading (gunicorn preload_app) share them instead of holding private copies
+MODEL_MMAP = os.getenv("MODEL_MMAP", "true").lower() == "true"
+
+# The spectral GAN-artifact score joins the deepfake analyses once a model has been fitted
+SPECTRAL_METRICS = ("gan_spectrum",) if SPECTRAL_MODEL is not None else ()
+
+# Analyses run concurrently on this many executor threads (admission.py admits as many)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+
+def _load_model(model_name: str) -> "ViTForImageClassification":
+    model = ViTForImageClassification.from_pretrained(model_name)
+    if MODEL_MMAP:
+        try:
+            mapped = mmap_safetensors_weights(model, model_name)
+            print(f"Memory-mapped {mapped} weight tensors of {model_name}")
+        except Exception as e:
+            print(f"Could not memory-map {model_name} weights: {e}")
+    return freeze_model(model)
+
 if TORCH_AVAILABLE:
     try:
         # ViT for image classification
-        VIT_PROCESSOR = ViTImageProcessor.from_pretrained("google/vit-base-patch16-224")
-        VIT_MODEL = ViTForImageClassification.from_pretrained("google/vit-base-patch16-224")
+        VIT_PROCESSOR = ViTImageProcessor.from_pretrained(VIT_MODEL_NAME)
+        VIT_MODEL = _load_model(VIT_MODEL_NAME)
         
         # DeepFake detection model
-        DEEPFAKE_PROCESSOR = ViTImageProcessor.from_pretrained("prithivMLmods/Deep-Fake-Detector-v2-Model")
-        DEEPFAKE_MODEL = ViTForImageClassification.from_pretrained("prithivMLmods/Deep-Fake-Detector-v2-Model")
+        DEEPFAKE_PROCESSOR = ViTImageProcessor.from_pretrained(DEEPFAKE_MODEL_NAME)
+        DEEPFAKE_MODEL = _load_model(DEEPFAKE_MODEL_NAME)
         
         MODELS_AVAILABLE = True
         print("✅ AI models loaded successfully")
@@ -54,75 +107,183 @@ if TORCH_AVAILABLE:
         print(f"AI models not available: {e}")
         MODELS_AVAILABLE = False
 
+def _is_deepfake_label(label: str) -> bool:
+    """Check for various deepfake indicators in a model label"""
+    label_lower = label.lower()
+    return (
+        "deepfake" in label_lower or 
+        "fake" in label_lower or 
+        "synthetic" in label_lower or
+        "generated" in label_lower or
+        "artificial" in label_lower
+    )
+
+def _deepfake_class_ids() -> List[int]:
+    """Class ids of DEEPFAKE_MODEL that mean the image is a deepfake"""
+    id2label = DEEPFAKE_MODEL.config.id2label
+    class_ids = [class_id for class_id, label in id2label.items() if _is_deepfake_label(label)]
+    # If the model has only 2 classes (0=real, 1=fake), class 1 is a deepfake
+    if len(id2label) == 2 and 1 not in class_ids:
+        class_ids.append(1)
+    return class_ids
+
+# Verdicts are suspicious when their indicators average above this, which takes at least
+# one indicator scoring above it
+SUSPICION_SCORE = 0.6
+
+def _heuristic_certainty(indicators: List[Dict[str, Any]], is_suspicious: bool) -> float:
+    """How sure the heuristic stage is of its own verdict"""
+    if not indicators:
+        return 0.0
+    avg_score = sum(indicator["score"] for indicator in indicators) / len(indicators)
+    return avg_score if is_suspicious else 1.0 - avg_score
+
+def _fast_benign_certainty(indicators: List[Dict[str, Any]], is_suspicious: bool, sharpness: float) -> float:
+    """How sure the fast stage is that an image is benign; 0 for anything it must escalate"""
+    # Suspicious verdicts from a reduced decode are always left to the full stage
+    if is_suspicious or sharpness < CASCADE_MIN_SHARPNESS:
+        return 0.0
+    # Weaker indicators cannot make a verdict suspicious on their own; a stronger one
+    # firing on the reduced decode may well tip it at full resolution
+    strongest = max((indicator["score"] for indicator in indicators if indicator["score"] > SUSPICION_SCORE), default=0.0)
+    return 1.0 - strongest
+
+def _input_size(processor) -> int:
+    """Side of the square input a ViT processor resizes images to"""
+    size = processor.size
+    if isinstance(size, dict):
+        return int(size.get("height") or size.get("shortest_edge"))
+    return int(size)
+
 class ImageAnalysisService:
-    def __init__(self):
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    def __init__(self, speed_mode: Optional[str] = None, tome_ratio: Optional[str] = None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS)
+        self.speed_mode = speed_mode or VIT_SPEED_MODE
+        self.tome_ratios = parse_ratios(tome_ratio or TOME_RATIO) if TORCH_AVAILABLE else 0.0
+    
+    async def model_version(self, analysis_type: str) -> str:
+        """Identifies what produces results for analysis_type; results are reusable only within a version"""
+        if analysis_type == "classification" and MODELS_AVAILABLE and VIT_MODEL:
+            model_name = VIT_MODEL_NAME
+        elif analysis_type == "deepfake" and MODELS_AVAILABLE and DEEPFAKE_MODEL:
+            model_name = DEEPFAKE_MODEL_NAME
+        else:
+            return "heuristic"
+        if self.speed_mode == "tome":
+            return f"{model_name}@tome:{self.tome_ratios}"
+        return model_name
     
-    def _basic_image_analysis(self, image_content: bytes) -> Dict[str, Any]:
-        """Basic image analysis using OpenCV and PIL when AI models are not available"""
+    def _model_logits(self, model, inputs) -> "torch.Tensor":
+        """Forward pass of a ViT model in the configured speed mode"""
+        if self.speed_mode == "tome":
+            return tome_logits(model, inputs["pixel_values"], self.tome_ratios)
+        return model(**inputs).logits
+    
+    def _tiled_probabilities(self, model, processor, image: Image.Image, plan: TilePlan) -> Tuple["torch.Tensor", int, float]:
+        """Class probabilities of the whole image (row 0) and every tile of plan, batched TILED_BATCH_SIZE at a time"""
+        pixels = scaled_pixels(image, plan)
+        # The whole-image view is resized from the scaled copy; the full-size original is never touched again
+        whole = processor(images=[pixels], return_tensors="pt")["pixel_values"]
+        tiles = torch.from_numpy(normalize_tiles(cut_tiles(pixels, plan), processor))
+        pixel_values = torch.cat([whole, tiles])
+        
+        started = time.perf_counter()
+        rows = []
+        with torch.no_grad():
+            for start in range(0, len(pixel_values), TILED_BATCH_SIZE):
+                logits = self._model_logits(model, {"pixel_values": pixel_values[start:start + TILED_BATCH_SIZE]})
+                rows.append(torch.nn.functional.softmax(logits, dim=-1))
+        return torch.cat(rows), len(rows), (time.perf_counter() - started) * 1000
+    
+    def _basic_image_analysis(
+        self, image_content: bytes, max_side: Optional[int] = None, metrics: Iterable[str] = METRICS
+    ) -> Dict[str, Any]:
+        """Basic image metrics using OpenCV and PIL, computing only those named in metrics"""
         try:
-            # Load image with PIL
-            image = Image.open(io.BytesIO(image_content))
-            
-            # Convert to OpenCV format
-            img_array = np.array(image)
-            if len(img_array.shape) == 3:
-                img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            else:
-                img_cv = img_array
-            
-            # Basic image properties
-            height, width = img_cv.shape[:2]
-            channels = img_cv.shape[2] if len(img_cv.shape) == 3 else 1
-            
-            # Calculate basic statistics
-            mean_color = np.mean(img_cv, axis=(0, 1)) if len(img_cv.shape) == 3 else np.mean(img_cv)
-            std_color = np.std(img_cv, axis=(0, 1)) if len(img_cv.shape) == 3 else np.std(img_cv)
-            
-            # Edge detection for basic analysis
-            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY) if len(img_cv.shape) == 3 else img_cv
-            edges = cv2.Canny(gray, 50, 150)
-            edge_density = np.sum(edges > 0) / (height * width)
-            
-            # Color histogram analysis
-            hist_b = cv2.calcHist([img_cv], [0], None, [256], [0, 256]) if len(img_cv.shape) == 3 else None
-            hist_g = cv2.calcHist([img_cv], [1], None, [256], [0, 256]) if len(img_cv.shape) == 3 else None
-            hist_r = cv2.calcHist([img_cv], [2], None, [256], [0, 256]) if len(img_cv.shape) == 3 else None
+            return compute_metrics(image_content, metrics, max_side)
+        except Exception as e:
+            return {"error": f"Basic analysis failed: {str(e)}"}
+    
+    async def analyze_metrics(self, image_content: bytes, metrics: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Basic metrics on demand, such as the histograms the analyses leave out"""
+        try:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                self.executor,
+                compute_metrics,
+                image_content,
+                metrics or METRICS
+            )
+            return {"success": True, "analysis_type": "metrics", **result}
+        except Exception as e:
+            return {
+                "error": str(e),
+                "success": False,
+                "analysis_type": "metrics"
+            }
+    
+    async def analyze_heatmap(self, image_content: bytes, model: str = "deepfake") -> Dict[str, Any]:
+        """Attention rollout of the classification or deepfake ViT for one image"""
+        try:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                self.executor,
+                self._analyze_heatmap_sync,
+                image_content,
+                model
+            )
+            return result
+        except Exception as e:
+            return {
+                "error": str(e),
+                "success": False,
+                "analysis_type": "heatmap"
+            }
+    
+    def _analyze_heatmap_sync(self, image_content: bytes, model: str = "deepfake") -> Dict[str, Any]:
+        """Prediction and attention-rollout grid from a single forward pass with output_attentions"""
+        try:
+            if model not in ("classification", "deepfake"):
+                raise ValueError(f"Unknown model: {model}")
+            if not MODELS_AVAILABLE:
+                raise RuntimeError("Heatmaps need the ViT models, which are not loaded")
+            vit, processor = (VIT_MODEL, VIT_PROCESSOR) if model == "classification" else (DEEPFAKE_MODEL, DEEPFAKE_PROCESSOR)
             
-            # Basic quality metrics
-            laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+            image = Image.open(io.BytesIO(image_content)).convert("RGB")
+            inputs = processor(images=image, return_tensors="pt")
+            # Always the unmodified model: merged tokens have no patch position to map back to
+            with torch.no_grad():
+                outputs = vit(**inputs, output_attentions=True)
+            probabilities = torch.nn.functional.softmax(outputs.logits[0], dim=-1)
+            predicted_class_id = int(probabilities.argmax().item())
+            grid = attention_rollout([layer[0].numpy() for layer in outputs.attentions])
             
             return {
-                "image_properties": {
-                    "width": int(width),
-                    "height": int(height),
-                    "channels": int(channels),
-                    "format": image.format,
-                    "mode": image.mode
-                },
-                "color_analysis": {
-                    "mean_color": mean_color.tolist() if hasattr(mean_color, 'tolist') else [float(mean_color)],
-                    "std_color": std_color.tolist() if hasattr(std_color, 'tolist') else [float(std_color)],
-                    "edge_density": float(edge_density),
-                    "sharpness": float(laplacian_var)
-                },
-                "histogram": {
-                    "blue": hist_b.flatten().tolist() if hist_b is not None else None,
-                    "green": hist_g.flatten().tolist() if hist_g is not None else None,
-                    "red": hist_r.flatten().tolist() if hist_r is not None else None
-                }
+                "success": True,
+                "analysis_type": "heatmap",
+                "model": model,
+                "method": "attention_rollout",
+                "predicted_label": vit.config.id2label[predicted_class_id],
+                "confidence": float(probabilities[predicted_class_id].item()),
+                "image_size": [image.width, image.height],
+                "grid": grid.astype(np.float32)
             }
         except Exception as e:
-            return {"error": f"Basic analysis failed: {str(e)}"}
+            return {
+                "error": str(e),
+                "success": False,
+                "analysis_type": "heatmap"
+            }
     
-    async def analyze_classification(self, image_content: bytes) -> Dict[str, Any]:
+    async def analyze_classification(self, image_content: bytes, high_res: bool = False) -> Dict[str, Any]:
         """Analyze image for classification"""
         try:
             loop = asyncio.get_event_loop()
             result = await loop.run_in_executor(
                 self.executor, 
                 self._analyze_classification_sync, 
-                image_content
+                image_content,
+                high_res
             )
             return result
         except Exception as e:
@@ -132,7 +293,7 @@ class ImageAnalysisService:
                 "analysis_type": "classification"
             }
     
-    def _analyze_classification_sync(self, image_content: bytes) -> Dict[str, Any]:
+    def _analyze_classification_sync(self, image_content: bytes, high_res: bool = False) -> Dict[str, Any]:
         """Synchronous classification analysis using ViT model"""
         try:
             # Load image
@@ -140,14 +301,27 @@ class ImageAnalysisService:
             
             # Use ViT model if available
             if MODELS_AVAILABLE and VIT_PROCESSOR and VIT_MODEL:
-                # Process image with ViT
-                inputs = VIT_PROCESSOR(images=image, return_tensors="pt")
-                with torch.no_grad():
-                    outputs = VIT_MODEL(**inputs)
-                    logits = outputs.logits
-                    probabilities = torch.nn.functional.softmax(logits, dim=-1)
-                    predicted_class_id = logits.argmax(-1).item()
+                plan = plan_tiles(image.width, image.height, _input_size(VIT_PROCESSOR)) if high_res else None
+                tiling = None
+                if plan is not None:
+                    started = time.perf_counter()
+                    rows, batches, forward_ms = self._tiled_probabilities(VIT_MODEL, VIT_PROCESSOR, image, plan)
+                    # The whole-image view and the mean over the tiles weigh equally
+                    probabilities = (0.5 * rows[0] + 0.5 * rows[1:].mean(dim=0)).unsqueeze(0)
+                    predicted_class_id = int(probabilities[0].argmax().item())
                     confidence = probabilities[0][predicted_class_id].item()
+                    tiling = {
+                        **tiling_summary(plan, batches, forward_ms, (time.perf_counter() - started) * 1000),
+                        "heatmap": tile_heatmap(plan, rows[1:, predicted_class_id].numpy())
+                    }
+                else:
+                    # Process image with ViT
+                    inputs = VIT_PROCESSOR(images=image, return_tensors="pt")
+                    with torch.no_grad():
+                        logits = self._model_logits(VIT_MODEL, inputs)
+                        probabilities = torch.nn.functional.softmax(logits, dim=-1)
+                        predicted_class_id = logits.argmax(-1).item()
+                        confidence = probabilities[0][predicted_class_id].item()
                 
                 # Get predicted label
                 predicted_label = VIT_MODEL.config.id2label[predicted_class_id]
@@ -161,20 +335,25 @@ class ImageAnalysisService:
                     top_predictions.append({"label": label, "confidence": conf})
                 
                 # Basic analysis for additional info
-                basic_analysis = self._basic_image_analysis(image_content)
+                basic_analysis = self._basic_image_analysis(image_content, metrics=DISPLAY_METRICS)
                 
-                return {
+                result = {
                     "success": True,
                     "analysis_type": "classification",
                     "predicted_label": predicted_label,
                     "confidence": confidence,
                     "top_predictions": top_predictions,
+                    "speed_mode": self.speed_mode,
                     "basic_analysis": basic_analysis,
                     "message": f"Image classified as '{predicted_label}' with {confidence:.1%} confidence using ViT model"
                 }
+                if high_res:
+                    # None when the image fits in a single tile
+                    result["tiling"] = tiling
+                return result
             else:
                 # Fallback to basic analysis if models not available
-                basic_analysis = self._basic_image_analysis(image_content)
+                basic_analysis = self._basic_image_analysis(image_content, metrics=DISPLAY_METRICS)
                 
                 # Simple classification based on image properties
                 width = basic_analysis.get("image_properties", {}).get("width", 0)
@@ -240,13 +419,90 @@ class ImageAnalysisService:
                 "analysis_type": "classification"
             }
     
-    async def analyze_forgery(self, image_content: bytes) -> Dict[str, Any]:
+    def _forgery_heuristics(
+        self,
+        basic_analysis: Dict[str, Any],
+        metadata: Optional[Dict[str, Any]] = None,
+        copy_move: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Forgery indicators and verdict from basic image metrics, metadata and cloned regions"""
+        edge_density = basic_analysis.get("color_analysis", {}).get("edge_density", 0)
+        sharpness = basic_analysis.get("color_analysis", {}).get("sharpness", 0)
+        mean_color = basic_analysis.get("color_analysis", {}).get("mean_color", [0, 0, 0])
+        std_color = basic_analysis.get("color_analysis", {}).get("std_color", [0, 0, 0])
+        
+        # Calculate forgery indicators
+        forgery_indicators = []
+        
+        # Edge density analysis
+        if edge_density < 0.05:
+            forgery_indicators.append({"indicator": "Very low edge density", "score": 0.8})
+        elif edge_density < 0.1:
+            forgery_indicators.append({"indicator": "Low edge density", "score": 0.6})
+        elif edge_density > 0.3:
+            forgery_indicators.append({"indicator": "High edge density", "score": 0.4})
+        
+        # Sharpness analysis
+        if sharpness < 50:
+            forgery_indicators.append({"indicator": "Very low sharpness", "score": 0.9})
+        elif sharpness < 100:
+            forgery_indicators.append({"indicator": "Low sharpness", "score": 0.7})
+        elif sharpness > 2000:
+            forgery_indicators.append({"indicator": "Very high sharpness", "score": 0.3})
+        
+        # Color consistency analysis
+        if len(mean_color) >= 3 and len(std_color) >= 3:
+            color_variance = sum(std_color) / len(std_color)
+            if color_variance < 10:
+                forgery_indicators.append({"indicator": "Low color variance", "score": 0.6})
+            elif color_variance > 100:
+                forgery_indicators.append({"indicator": "High color variance", "score": 0.4})
+        
+        # Header, EXIF and thumbnail indicators
+        if metadata:
+            forgery_indicators.extend(metadata.get("indicators", []))
+        
+        # Duplicated regions found by the copy-move detector
+        if copy_move:
+            forgery_indicators.extend(copy_move.get("indicators", []))
+        
+        return self._forgery_verdict(forgery_indicators)
+    
+    def _forgery_verdict(self, forgery_indicators: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Forgery verdict, confidence and risk level from a list of indicators"""
+        # Calculate overall confidence
+        if forgery_indicators:
+            avg_score = sum(indicator["score"] for indicator in forgery_indicators) / len(forgery_indicators)
+            is_suspicious = avg_score > SUSPICION_SCORE
+            confidence = min(avg_score, 0.9)  # Cap at 90%
+        else:
+            is_suspicious = False
+            confidence = 0.3
+        
+        # Determine risk level
+        if confidence >= 0.8:
+            risk_level = "High Risk"
+        elif confidence >= 0.6:
+            risk_level = "Medium Risk"
+        elif confidence >= 0.4:
+            risk_level = "Low Risk"
+        else:
+            risk_level = "Very Low Risk"
+        
+        return {
+            "is_forged": is_suspicious,
+            "confidence": confidence,
+            "risk_level": risk_level,
+            "forgery_indicators": forgery_indicators
+        }
+    
+    async def analyze_forgery(self, image_content: bytes, cascade: bool = False) -> Dict[str, Any]:
         """Analyze image for forgery detection"""
         try:
             loop = asyncio.get_event_loop()
             result = await loop.run_in_executor(
                 self.executor, 
-                self._analyze_forgery_sync, 
+                self._analyze_forgery_cascade_sync if cascade else self._analyze_forgery_sync, 
                 image_content
             )
             return result
@@ -257,9 +513,19 @@ class ImageAnalysisService:
                 "analysis_type": "forgery"
             }
     
-    def _analyze_forgery_sync(self, image_content: bytes) -> Dict[str, Any]:
+    def _analyze_forgery_sync(
+        self,
+        image_content: bytes,
+        metadata: Optional[Dict[str, Any]] = None,
+        copy_move: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Synchronous forgery detection analysis using Noiseprint"""
         try:
+            if metadata is None and METADATA_ANALYSIS_ENABLED:
+                metadata = analyze_metadata(image_content)
+            if copy_move is None and COPY_MOVE_ENABLED:
+                copy_move = detect_copy_move(image_content)
+            
             # Load image
             image = Image.open(io.BytesIO(image_content)).convert("RGB")
             
@@ -320,7 +586,7 @@ class ImageAnalysisService:
                         risk_level = "Very Low Risk"
                     
                     # Basic analysis for additional info
-                    basic_analysis = self._basic_image_analysis(image_content)
+                    basic_analysis = self._basic_image_analysis(image_content, metrics=HEURISTIC_METRICS)
                     
                     return {
                         "success": True,
@@ -346,59 +612,14 @@ class ImageAnalysisService:
                     pass
             
             # Fallback to basic analysis
-            basic_analysis = self._basic_image_analysis(image_content)
+            basic_analysis = self._basic_image_analysis(image_content, metrics=HEURISTIC_METRICS)
             
             # Enhanced heuristics for forgery detection
-            edge_density = basic_analysis.get("color_analysis", {}).get("edge_density", 0)
-            sharpness = basic_analysis.get("color_analysis", {}).get("sharpness", 0)
-            mean_color = basic_analysis.get("color_analysis", {}).get("mean_color", [0, 0, 0])
-            std_color = basic_analysis.get("color_analysis", {}).get("std_color", [0, 0, 0])
-            
-            # Calculate forgery indicators
-            forgery_indicators = []
-            
-            # Edge density analysis
-            if edge_density < 0.05:
-                forgery_indicators.append({"indicator": "Very low edge density", "score": 0.8})
-            elif edge_density < 0.1:
-                forgery_indicators.append({"indicator": "Low edge density", "score": 0.6})
-            elif edge_density > 0.3:
-                forgery_indicators.append({"indicator": "High edge density", "score": 0.4})
-            
-            # Sharpness analysis
-            if sharpness < 50:
-                forgery_indicators.append({"indicator": "Very low sharpness", "score": 0.9})
-            elif sharpness < 100:
-                forgery_indicators.append({"indicator": "Low sharpness", "score": 0.7})
-            elif sharpness > 2000:
-                forgery_indicators.append({"indicator": "Very high sharpness", "score": 0.3})
-            
-            # Color consistency analysis
-            if len(mean_color) >= 3 and len(std_color) >= 3:
-                color_variance = sum(std_color) / len(std_color)
-                if color_variance < 10:
-                    forgery_indicators.append({"indicator": "Low color variance", "score": 0.6})
-                elif color_variance > 100:
-                    forgery_indicators.append({"indicator": "High color variance", "score": 0.4})
-            
-            # Calculate overall confidence
-            if forgery_indicators:
-                avg_score = sum(indicator["score"] for indicator in forgery_indicators) / len(forgery_indicators)
-                is_suspicious = avg_score > 0.6
-                confidence = min(avg_score, 0.9)  # Cap at 90%
-            else:
-                is_suspicious = False
-                confidence = 0.3
-            
-            # Determine risk level
-            if confidence >= 0.8:
-                risk_level = "High Risk"
-            elif confidence >= 0.6:
-                risk_level = "Medium Risk"
-            elif confidence >= 0.4:
-                risk_level = "Low Risk"
-            else:
-                risk_level = "Very Low Risk"
+            heuristics = self._forgery_heuristics(basic_analysis, metadata, copy_move)
+            is_suspicious = heuristics["is_forged"]
+            confidence = heuristics["confidence"]
+            risk_level = heuristics["risk_level"]
+            forgery_indicators = heuristics["forgery_indicators"]
             
             return {
                 "success": True,
@@ -408,6 +629,8 @@ class ImageAnalysisService:
                 "risk_level": risk_level,
                 "forgery_indicators": forgery_indicators,
                 "basic_analysis": basic_analysis,
+                "metadata_analysis": metadata,
+                "copy_move_analysis": copy_move,
                 "message": f"Forgery analysis completed - {risk_level} ({'Suspicious' if is_suspicious else 'Normal'} image) using basic analysis"
             }
                     
@@ -418,15 +641,228 @@ class ImageAnalysisService:
                 "analysis_type": "forgery"
             }
     
-    async def analyze_deepfake(self, image_content: bytes) -> Dict[str, Any]:
+    def _analyze_forgery_cascade_sync(self, image_content: bytes, threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Forgery analysis from metadata, then a downscaled decode that clears plainly benign images, then full resolution"""
+        threshold = CASCADE_CONFIDENCE_THRESHOLD if threshold is None else threshold
+        certainty = None
+        
+        # Metadata can only prove tampering, not rule it out, so it answers alone only for suspicious images
+        metadata = analyze_metadata(image_content) if METADATA_ANALYSIS_ENABLED else None
+        if metadata and metadata.get("indicators"):
+            verdict = self._forgery_verdict(list(metadata["indicators"]))
+            metadata_certainty = _heuristic_certainty(verdict["forgery_indicators"], verdict["is_forged"])
+            if verdict["is_forged"] and metadata_certainty >= threshold:
+                return {
+                    "success": True,
+                    "analysis_type": "forgery",
+                    **verdict,
+                    "metadata_analysis": metadata,
+                    "cascade": {"stage": "metadata", "certainty": metadata_certainty, "threshold": threshold},
+                    "message": f"Forgery analysis completed - {verdict['risk_level']} (Suspicious image) using metadata stage"
+                }
+        
+        # Clones vanish at the fast stage's resolution, so the detector runs once on its own bounded decode
+        copy_move = detect_copy_move(image_content) if COPY_MOVE_ENABLED else None
+        
+        basic_analysis = self._basic_image_analysis(image_content, max_side=CASCADE_MAX_SIDE, metrics=HEURISTIC_METRICS)
+        if "error" not in basic_analysis:
+            heuristics = self._forgery_heuristics(basic_analysis, metadata, copy_move)
+            certainty = _fast_benign_certainty(
+                heuristics["forgery_indicators"], heuristics["is_forged"], basic_analysis["color_analysis"]["sharpness"]
+            )
+            if certainty >= threshold:
+                return {
+                    "success": True,
+                    "analysis_type": "forgery",
+                    **heuristics,
+                    "basic_analysis": basic_analysis,
+                    "metadata_analysis": metadata,
+                    "copy_move_analysis": copy_move,
+                    "cascade": {"stage": "fast", "certainty": certainty, "threshold": threshold},
+                    "message": f"Forgery analysis completed - {heuristics['risk_level']} (Normal image) using fast heuristic stage"
+                }
+        
+        result = self._analyze_forgery_sync(image_content, metadata, copy_move)
+        result["cascade"] = {"stage": "full", "fast_certainty": certainty, "threshold": threshold}
+        return result
+    
+    def _spectral_indicators(self, basic_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Periodic upsampling artifacts in the frequency spectrum, once a spectral model is fitted"""
+        gan_probability = (basic_analysis.get("spectral_analysis") or {}).get("gan_probability")
+        if gan_probability is not None and gan_probability >= SPECTRAL_THRESHOLD:
+            return [{"indicator": "GAN upsampling artifacts in frequency spectrum", "score": round(gan_probability, 3)}]
+        return []
+    
+    def _deepfake_heuristics(self, basic_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Deepfake indicators and verdict from basic image metrics"""
+        sharpness = basic_analysis.get("color_analysis", {}).get("sharpness", 0)
+        edge_density = basic_analysis.get("color_analysis", {}).get("edge_density", 0)
+        mean_color = basic_analysis.get("color_analysis", {}).get("mean_color", [0, 0, 0])
+        std_color = basic_analysis.get("color_analysis", {}).get("std_color", [0, 0, 0])
+        
+        # Calculate deepfake indicators
+        deepfake_indicators = []
+        
+        # Sharpness analysis for deepfake detection
+        if sharpness < 30:
+            deepfake_indicators.append({"indicator": "Very low sharpness (blurry)", "score": 0.9})
+        elif sharpness < 100:
+            deepfake_indicators.append({"indicator": "Low sharpness", "score": 0.7})
+        elif sharpness > 3000:
+            deepfake_indicators.append({"indicator": "Unusually high sharpness", "score": 0.6})
+        
+        # Edge density analysis
+        if edge_density < 0.03:
+            deepfake_indicators.append({"indicator": "Very low edge density", "score": 0.8})
+        elif edge_density < 0.08:
+            deepfake_indicators.append({"indicator": "Low edge density", "score": 0.6})
+        elif edge_density > 0.4:
+            deepfake_indicators.append({"indicator": "Unusually high edge density", "score": 0.5})
+        
+        # Color analysis for deepfake detection
+        if len(mean_color) >= 3 and len(std_color) >= 3:
+            # Check for unnatural color patterns
+            color_balance = sum(mean_color) / len(mean_color)
+            color_variance = sum(std_color) / len(std_color)
+        
+            if color_variance < 5:
+                deepfake_indicators.append({"indicator": "Very low color variance", "score": 0.7})
+            elif color_variance > 150:
+                deepfake_indicators.append({"indicator": "Very high color variance", "score": 0.6})
+        
+            # Check for unnatural color balance
+            if color_balance < 50 or color_balance > 200:
+                deepfake_indicators.append({"indicator": "Unnatural color balance", "score": 0.6})
+        
+        deepfake_indicators.extend(self._spectral_indicators(basic_analysis))
+        
+        # Calculate overall confidence
+        if deepfake_indicators:
+            avg_score = sum(indicator["score"] for indicator in deepfake_indicators) / len(deepfake_indicators)
+            is_suspicious = avg_score > SUSPICION_SCORE
+            confidence = min(avg_score, 0.85)  # Cap at 85%
+        else:
+            is_suspicious = False
+            confidence = 0.2
+        
+        # Determine risk level
+        if confidence >= 0.8:
+            risk_level = "High Risk"
+            predicted_label = "Likely DeepFake"
+        elif confidence >= 0.6:
+            risk_level = "Medium Risk"
+            predicted_label = "Suspicious"
+        elif confidence >= 0.4:
+            risk_level = "Low Risk"
+            predicted_label = "Possibly Authentic"
+        else:
+            risk_level = "Very Low Risk"
+            predicted_label = "Likely Authentic"
+        
+        return {
+            "predicted_label": predicted_label,
+            "is_deepfake": is_suspicious,
+            "confidence": confidence,
+            "risk_level": risk_level,
+            "deepfake_indicators": deepfake_indicators
+        }
+    
+    def _analyze_deepfake_cascade_sync(
+        self, image_content: bytes, threshold: Optional[float] = None, high_res: bool = False
+    ) -> Dict[str, Any]:
+        """Deepfake analysis that clears plainly benign images from a downscaled decode and runs the ViT on the rest"""
+        threshold = CASCADE_CONFIDENCE_THRESHOLD if threshold is None else threshold
+        certainty = None
+        
+        # The spectral score reads a full-resolution crop; when it fires, the image is not cleared here
+        basic_analysis = self._basic_image_analysis(
+            image_content, max_side=CASCADE_MAX_SIDE, metrics=HEURISTIC_METRICS + SPECTRAL_METRICS
+        )
+        if "error" not in basic_analysis:
+            heuristics = self._deepfake_heuristics(basic_analysis)
+            certainty = _fast_benign_certainty(
+                heuristics["deepfake_indicators"], heuristics["is_deepfake"], basic_analysis["color_analysis"]["sharpness"]
+            )
+            if certainty >= threshold:
+                return {
+                    "success": True,
+                    "analysis_type": "deepfake",
+                    **heuristics,
+                    "basic_analysis": basic_analysis,
+                    "cascade": {"stage": "fast", "certainty": certainty, "threshold": threshold},
+                    "message": f"Deepfake analysis completed - {heuristics['risk_level']} ({heuristics['predicted_label']}) using fast heuristic stage"
+                }
+        
+        result = self._analyze_deepfake_sync(image_content, high_res)
+        result["cascade"] = {"stage": "full", "fast_certainty": certainty, "threshold": threshold}
+        return result
+    
+    def _score_deepfake_batch(self, images: List[Image.Image]) -> List[Dict[str, Any]]:
+        """Score a batch of RGB images with DEEPFAKE_MODEL in a single forward pass"""
+        inputs = DEEPFAKE_PROCESSOR(images=images, return_tensors="pt")
+        with torch.no_grad():
+            logits = self._model_logits(DEEPFAKE_MODEL, inputs)
+            probabilities = torch.nn.functional.softmax(logits, dim=-1)
+        return self._deepfake_scores(probabilities)
+    
+    def _deepfake_scores(self, probabilities: "torch.Tensor") -> List[Dict[str, Any]]:
+        """Verdict for each row of DEEPFAKE_MODEL class probabilities"""
+        fake_class_ids = _deepfake_class_ids()
+        scores = []
+        for row in probabilities:
+            predicted_class_id = int(row.argmax().item())
+            predicted_label = DEEPFAKE_MODEL.config.id2label[predicted_class_id]
+            scores.append({
+                "predicted_label": predicted_label,
+                "is_deepfake": predicted_class_id in fake_class_ids,
+                "confidence": float(row[predicted_class_id].item()),
+                "fake_probability": float(sum(row[i].item() for i in fake_class_ids))
+            })
+        return scores
+    
+    def _score_deepfake_tiled(self, image: Image.Image, plan: TilePlan) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Verdict from the whole image and the plan's tiles, with the tiling report and heatmap"""
+        started = time.perf_counter()
+        rows, batches, forward_ms = self._tiled_probabilities(DEEPFAKE_MODEL, DEEPFAKE_PROCESSOR, image, plan)
+        scores = self._deepfake_scores(rows)
+        whole, tiles = scores[0], scores[1:]
+        tile_probabilities = np.array([score["fake_probability"] for score in tiles])
+        tiled_probability = aggregate_scores(tile_probabilities)
+        
+        verdict = whole
+        if tiled_probability > whole["fake_probability"]:
+            # Local evidence outweighs the whole-image view; the label comes from the most suspicious tile
+            row = rows[1 + int(tile_probabilities.argmax())]
+            is_deepfake = tiled_probability >= 0.5
+            fake_class_ids = _deepfake_class_ids()
+            candidates = [i for i in range(len(row)) if (i in fake_class_ids) == is_deepfake] or list(range(len(row)))
+            verdict = {
+                "predicted_label": DEEPFAKE_MODEL.config.id2label[max(candidates, key=lambda i: row[i].item())],
+                "is_deepfake": is_deepfake,
+                "confidence": tiled_probability if is_deepfake else 1.0 - tiled_probability,
+                "fake_probability": tiled_probability
+            }
+        
+        tiling = {
+            **tiling_summary(plan, batches, forward_ms, (time.perf_counter() - started) * 1000),
+            "whole_image_fake_probability": whole["fake_probability"],
+            "tiled_fake_probability": tiled_probability,
+            "heatmap": tile_heatmap(plan, tile_probabilities)
+        }
+        return verdict, tiling
+    
+    async def analyze_deepfake(self, image_content: bytes, cascade: bool = False, high_res: bool = False) -> Dict[str, Any]:
         """Analyze image for deepfake detection"""
         try:
             loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self.executor, 
-                self._analyze_deepfake_sync, 
-                image_content
-            )
+            if cascade:
+                result = await loop.run_in_executor(
+                    self.executor, self._analyze_deepfake_cascade_sync, image_content, None, high_res
+                )
+            else:
+                result = await loop.run_in_executor(
+                    self.executor, self._analyze_deepfake_sync, image_content, high_res
+                )
             return result
         except Exception as e:
             return {
@@ -435,7 +871,7 @@ class ImageAnalysisService:
                 "analysis_type": "deepfake"
             }
     
-    def _analyze_deepfake_sync(self, image_content: bytes) -> Dict[str, Any]:
+    def _analyze_deepfake_sync(self, image_content: bytes, high_res: bool = False) -> Dict[str, Any]:
         """Synchronous deepfake detection analysis using DeepFake model"""
         try:
             # Load image
@@ -443,39 +879,36 @@ class ImageAnalysisService:
             
             # Use DeepFake model if available
             if MODELS_AVAILABLE and DEEPFAKE_PROCESSOR and DEEPFAKE_MODEL:
-                # Process image with DeepFake model
-                inputs = DEEPFAKE_PROCESSOR(images=image, return_tensors="pt")
-                with torch.no_grad():
-                    outputs = DEEPFAKE_MODEL(**inputs)
-                    logits = outputs.logits
-                    probabilities = torch.nn.functional.softmax(logits, dim=-1)
-                    predicted_class_id = logits.argmax(-1).item()
-                    confidence = probabilities[0][predicted_class_id].item()
+                # Score each detected face instead of the whole frame so small faces
+                # are not shrunk away by the 224x224 resize
+                faces = extract_faces(np.asarray(image)) if FACE_DETECTION_ENABLED else []
+                tiling = None
                 
-                # Get predicted label
-                predicted_label = DEEPFAKE_MODEL.config.id2label[predicted_class_id]
+                if faces:
+                    face_scores = self._score_deepfake_batch([crop for _, crop in faces])
+                    # The image is as suspicious as its most suspicious face
+                    verdict = max(face_scores, key=lambda score: score["fake_probability"])
+                    scored_region = "faces"
+                else:
+                    face_scores = []
+                    # Faces are already scored at native resolution; tiling covers images without any
+                    plan = plan_tiles(image.width, image.height, _input_size(DEEPFAKE_PROCESSOR)) if high_res else None
+                    if plan is not None:
+                        verdict, tiling = self._score_deepfake_tiled(image, plan)
+                        scored_region = "tiles"
+                    else:
+                        verdict = self._score_deepfake_batch([image])[0]
+                        scored_region = "full_image"
                 
-                # Determine if it's a deepfake based on the label
-                # Check for various deepfake indicators in the label
-                label_lower = predicted_label.lower()
-                is_deepfake = (
-                    "deepfake" in label_lower or 
-                    "fake" in label_lower or 
-                    "synthetic" in label_lower or
-                    "generated" in label_lower or
-                    "artificial" in label_lower
-                )
+                predicted_label = verdict["predicted_label"]
+                is_deepfake = verdict["is_deepfake"]
+                confidence = verdict["confidence"]
                 
-                # Alternative approach: if the model has only 2 classes (0=real, 1=fake)
-                # and the predicted class is 1, then it's a deepfake
-                if len(DEEPFAKE_MODEL.config.id2label) == 2 and predicted_class_id == 1:
-                    is_deepfake = True
-                    print(f"Using class ID approach: class {predicted_class_id} = deepfake")
+                print(f"DeepFake Model Prediction: '{predicted_label}' -> is_deepfake: {is_deepfake} ({scored_region}, {len(faces)} faces)")
                 
-                # Debug: Print the actual label for troubleshooting
-                print(f"DeepFake Model Prediction: '{predicted_label}' -> is_deepfake: {is_deepfake}")
-                print(f"All available labels: {list(DEEPFAKE_MODEL.config.id2label.values())}")
-                print(f"Predicted class ID: {predicted_class_id}")
+                # Basic analysis for additional info, and the spectral score as a supplementary indicator
+                basic_analysis = self._basic_image_analysis(image_content, metrics=PROPERTIES_ONLY + SPECTRAL_METRICS)
+                deepfake_indicators = self._spectral_indicators(basic_analysis)
                 
                 # Determine risk level based on confidence and prediction
                 if is_deepfake and confidence >= 0.8:
@@ -484,88 +917,50 @@ class ImageAnalysisService:
                     risk_level = "Medium Risk"
                 elif is_deepfake and confidence >= 0.4:
                     risk_level = "Low Risk"
+                elif deepfake_indicators:
+                    # The model finds the image authentic, but its spectrum carries upsampling artifacts
+                    risk_level = "Low Risk"
                 else:
                     risk_level = "Very Low Risk"
                 
-                # Basic analysis for additional info
-                basic_analysis = self._basic_image_analysis(image_content)
-                
-                return {
+                result = {
                     "success": True,
                     "analysis_type": "deepfake",
                     "predicted_label": predicted_label,
                     "is_deepfake": is_deepfake,
                     "confidence": confidence,
                     "risk_level": risk_level,
+                    "scored_region": scored_region,
+                    "face_count": len(faces),
+                    "speed_mode": self.speed_mode,
+                    "faces": [
+                        {
+                            "box": {"x": x, "y": y, "width": w, "height": h},
+                            **score
+                        }
+                        for ((x, y, w, h), _), score in zip(faces, face_scores)
+                    ],
+                    "deepfake_indicators": deepfake_indicators,
                     "basic_analysis": basic_analysis,
-                    "message": f"Deepfake analysis completed - {risk_level} ({predicted_label}) using AI model"
+                    "message": f"Deepfake analysis completed - {risk_level} ({predicted_label}) using AI model on {len(faces)} face(s)" if faces else f"Deepfake analysis completed - {risk_level} ({predicted_label}) using AI model"
                 }
+                if high_res:
+                    # None when faces were found or the image fits in a single tile
+                    result["tiling"] = tiling
+                    if tiling:
+                        result["message"] += f" on {tiling['tile_count']} tiles"
+                return result
             else:
                 # Fallback to basic analysis if models not available
-                basic_analysis = self._basic_image_analysis(image_content)
+                basic_analysis = self._basic_image_analysis(image_content, metrics=HEURISTIC_METRICS + SPECTRAL_METRICS)
                 
                 # Enhanced heuristics for deepfake detection
-                sharpness = basic_analysis.get("color_analysis", {}).get("sharpness", 0)
-                edge_density = basic_analysis.get("color_analysis", {}).get("edge_density", 0)
-                mean_color = basic_analysis.get("color_analysis", {}).get("mean_color", [0, 0, 0])
-                std_color = basic_analysis.get("color_analysis", {}).get("std_color", [0, 0, 0])
-                
-                # Calculate deepfake indicators
-                deepfake_indicators = []
-                
-                # Sharpness analysis for deepfake detection
-                if sharpness < 30:
-                    deepfake_indicators.append({"indicator": "Very low sharpness (blurry)", "score": 0.9})
-                elif sharpness < 100:
-                    deepfake_indicators.append({"indicator": "Low sharpness", "score": 0.7})
-                elif sharpness > 3000:
-                    deepfake_indicators.append({"indicator": "Unusually high sharpness", "score": 0.6})
-                
-                # Edge density analysis
-                if edge_density < 0.03:
-                    deepfake_indicators.append({"indicator": "Very low edge density", "score": 0.8})
-                elif edge_density < 0.08:
-                    deepfake_indicators.append({"indicator": "Low edge density", "score": 0.6})
-                elif edge_density > 0.4:
-                    deepfake_indicators.append({"indicator": "Unusually high edge density", "score": 0.5})
-                
-                # Color analysis for deepfake detection
-                if len(mean_color) >= 3 and len(std_color) >= 3:
-                    # Check for unnatural color patterns
-                    color_balance = sum(mean_color) / len(mean_color)
-                    color_variance = sum(std_color) / len(std_color)
-                    
-                    if color_variance < 5:
-                        deepfake_indicators.append({"indicator": "Very low color variance", "score": 0.7})
-                    elif color_variance > 150:
-                        deepfake_indicators.append({"indicator": "Very high color variance", "score": 0.6})
-                    
-                    # Check for unnatural color balance
-                    if color_balance < 50 or color_balance > 200:
-                        deepfake_indicators.append({"indicator": "Unnatural color balance", "score": 0.6})
-                
-                # Calculate overall confidence
-                if deepfake_indicators:
-                    avg_score = sum(indicator["score"] for indicator in deepfake_indicators) / len(deepfake_indicators)
-                    is_suspicious = avg_score > 0.6
-                    confidence = min(avg_score, 0.85)  # Cap at 85%
-                else:
-                    is_suspicious = False
-                    confidence = 0.2
-                
-                # Determine risk level
-                if confidence >= 0.8:
-                    risk_level = "High Risk"
-                    predicted_label = "Likely DeepFake"
-                elif confidence >= 0.6:
-                    risk_level = "Medium Risk"
-                    predicted_label = "Suspicious"
-                elif confidence >= 0.4:
-                    risk_level = "Low Risk"
-                    predicted_label = "Possibly Authentic"
-                else:
-                    risk_level = "Very Low Risk"
-                    predicted_label = "Likely Authentic"
+                heuristics = self._deepfake_heuristics(basic_analysis)
+                predicted_label = heuristics["predicted_label"]
+                is_suspicious = heuristics["is_deepfake"]
+                confidence = heuristics["confidence"]
+                risk_level = heuristics["risk_level"]
+                deepfake_indicators = heuristics["deepfake_indicators"]
                 
                 return {
                     "success": True,
@@ -585,4 +980,75 @@ class ImageAnalysisService:
                 "success": False,
                 "analysis_type": "deepfake"
             }
-
+    
+    def _score_frames(self, frames: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """Score RGB video frames, batching the face crops of every frame into one forward pass"""
+        if not (MODELS_AVAILABLE and DEEPFAKE_PROCESSOR and DEEPFAKE_MODEL):
+            # Fallback to the basic heuristics frame by frame
+            scores = []
+            for frame in frames:
+                _, encoded = cv2.imencode(".jpg", cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                result = self._analyze_deepfake_sync(encoded.tobytes())
+                scores.append({
+                    "fake_probability": float(result.get("confidence", 0.0)),
+                    "is_deepfake": bool(result.get("is_deepfake", False)),
+                    "face_count": 0
+                })
+            return scores
+        
+        crops = []
+        owners = []
+        face_counts = []
+        for frame_index, frame in enumerate(frames):
+            faces = extract_faces(frame) if FACE_DETECTION_ENABLED else []
+            face_counts.append(len(faces))
+            if faces:
+                crops.extend(crop for _, crop in faces)
+                owners.extend([frame_index] * len(faces))
+            else:
+                crops.append(Image.fromarray(frame))
+                owners.append(frame_index)
+        
+        # Each frame takes the score of its most suspicious face
+        best = [None] * len(frames)
+        for owner, score in zip(owners, self._score_deepfake_batch(crops)):
+            if best[owner] is None or score["fake_probability"] > best[owner]["fake_probability"]:
+                best[owner] = score
+        
+        return [
+            {
+                "fake_probability": score["fake_probability"],
+                "is_deepfake": score["is_deepfake"],
+                "face_count": face_count
+            }
+            for score, face_count in zip(best, face_counts)
+        ]
+    
+    async def analyze_deepfake_video(self, video_path: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream per-segment deepfake results for a local video file, ending with a summary"""
+        stop = threading.Event()
+        records = analyze_video_frames(video_path, self._score_frames, stop=stop)
+        step = None
+        try:
+            while True:
+                # Advance the generator on the analysis executor, one record at a time
+                step = self.executor.submit(next, records, None)
+                record = await asyncio.wrap_future(step)
+                if record is None:
+                    break
+                yield record
+        except Exception as e:
+            yield {
+                "type": "error",
+                "error": str(e),
+                "success": False,
+                "analysis_type": "deepfake_video"
+            }
+        finally:
+            # Cancelling the await leaves the executor thread inside the generator; stop it at
+            # the next batch and wait for it, so the capture is released before the caller
+            # removes the file and close() does not hit a generator that is still executing
+            stop.set()
+            if step is not None and not step.done():
+                await asyncio.get_event_loop().run_in_executor(None, concurrent.futures.wait, [step])
+            records.close()
@@ -0,0 +1,205 @@
+"""
+Content-addressed store for uploads and the images derived from them: originals,
+thumbnails and explainability heatmaps.
+
+An artifact is named by the SHA-256 of its bytes plus an extension and lives under
+ARTIFACT_DIR/<first two hex digits>/, so equal artifacts are stored once and a name never
+changes meaning. A small index maps derivation keys (what was computed from which input,
+by which model version) to artifact names, so an artifact is computed once and fetched
+from disk after that.
+
+A file's mtime is its last use. Once the store grows past ARTIFACT_MAX_BYTES, maintenance
+evicts the least recently used artifacts down to ARTIFACT_GC_TARGET of that, skipping
+every artifact an analysis_results row still lists (see artifacts.py).
+
+Needs nothing but Pillow, so the Streamlit demo shares the store without loading the API's
+auth and database modules.
+"""
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from PIL import Image
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Relative to the backend, not to whichever directory the API or the demo was started from
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts"))
+# Size the store may grow to before least recently used artifacts are evicted
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(2 * 1024 ** 3)))
+# Eviction stops at this fraction of ARTIFACT_MAX_BYTES, so it does not run again at once
+ARTIFACT_GC_TARGET = float(os.getenv("ARTIFACT_GC_TARGET", "0.8"))
+# Keep each analyzed upload and a thumbnail of it, listed in the result as "artifacts"
+ARTIFACT_STORE_UPLOADS = os.getenv("ARTIFACT_STORE_UPLOADS", "true").lower() == "true"
+ARTIFACT_THUMBNAIL_SIDE = int(os.getenv("ARTIFACT_THUMBNAIL_SIDE", "256"))
+
+ARTIFACT_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,8}$")
+
+# Last use is recorded at most this often per artifact, to keep reads from writing to disk
+TOUCH_INTERVAL_SECONDS = 3600
+# Temporary files older than this were left behind by a crashed writer
+STALE_TEMPORARY_SECONDS = 3600
+INDEX_DIR = "index"
+
+UPLOAD_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "BMP": "bmp", "TIFF": "tiff"}
+
+class ArtifactStore:
+    """Artifacts on local disk, written atomically and never modified"""
+
+    def __init__(self, root: str = ARTIFACT_DIR):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        if not ARTIFACT_NAME.match(name):
+            raise ValueError(f"Invalid artifact name: {name}")
+        return os.path.join(self.root, name[:2], name)
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers only ever see a missing file or a complete one
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as handle:
+                handle.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def touch(self, path: str):
+        """Mark an artifact as used now, for LRU eviction"""
+        try:
+            if os.stat(path).st_mtime < time.time() - TOUCH_INTERVAL_SECONDS:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def put(self, data: bytes, extension: str) -> str:
+        """Store data and return its artifact name; storing the same bytes again is a no-op"""
+        name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self.path(name)
+        if os.path.exists(path):
+            self.touch(path)
+        else:
+            self._write_atomic(path, data)
+        return name
+
+    def put_upload(self, content: bytes) -> Dict[str, str]:
+        """Store an uploaded image and a JPEG thumbnail of it; returns {"original", "thumbnail"} names"""
+        image = Image.open(io.BytesIO(content))
+        names = {"original": self.put(content, UPLOAD_EXTENSIONS.get(image.format, "bin"))}
+        # JPEGs are scaled by the decoder itself, so a large photo is never decoded in full
+        image.draft("RGB", (ARTIFACT_THUMBNAIL_SIDE, ARTIFACT_THUMBNAIL_SIDE))
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((ARTIFACT_THUMBNAIL_SIDE, ARTIFACT_THUMBNAIL_SIDE), Image.BILINEAR)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, "JPEG", quality=80)
+        names["thumbnail"] = self.put(buffer.getvalue(), "jpg")
+        return names
+
+    def read(self, name: str) -> bytes:
+        """Bytes of a stored artifact; raises FileNotFoundError once it has been evicted"""
+        path = self.path(name)
+        with open(path, "rb") as artifact:
+            data = artifact.read()
+        self.touch(path)
+        return data
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def _index_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, INDEX_DIR, digest[:2], digest)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Artifact previously recorded for a derivation key, if it is still stored"""
+        try:
+            with open(self._index_path(key)) as handle:
+                name = handle.read().strip()
+        except FileNotFoundError:
+            return None
+        if not ARTIFACT_NAME.match(name) or not self.exists(name):
+            return None
+        self.touch(self.path(name))
+        return name
+
+    def remember(self, key: str, name: str):
+        self._write_atomic(self._index_path(key), name.encode())
+
+    def _shards(self) -> Iterable[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            os.path.join(self.root, entry) for entry in os.listdir(self.root)
+            if len(entry) == 2 and os.path.isdir(os.path.join(self.root, entry))
+        ]
+
+    def collect_garbage(
+        self, referenced: Iterable[str], max_bytes: int = ARTIFACT_MAX_BYTES, target: float = ARTIFACT_GC_TARGET
+    ) -> Dict[str, Any]:
+        """Evict least recently used unreferenced artifacts once the store exceeds max_bytes"""
+        referenced = set(referenced)
+        now = time.time()
+        artifacts = []
+        for shard in self._shards():
+            for entry in os.scandir(shard):
+                stat = entry.stat()
+                if entry.name.startswith(".tmp-"):
+                    if stat.st_mtime < now - STALE_TEMPORARY_SECONDS:
+                        os.unlink(entry.path)
+                elif ARTIFACT_NAME.match(entry.name):
+                    artifacts.append((stat.st_mtime, stat.st_size, entry.name, entry.path))
+
+        total = sum(size for _, size, _, _ in artifacts)
+        evicted: List[str] = []
+        evicted_bytes = 0
+        if total > max_bytes:
+            goal = max_bytes * target
+            for _, size, name, path in sorted(artifacts):
+                if total - evicted_bytes <= goal:
+                    break
+                if name in referenced:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                evicted.append(name)
+                evicted_bytes += size
+            if evicted:
+                self._drop_index_entries(set(evicted))
+
+        return {
+            "artifacts": len(artifacts) - len(evicted),
+            "artifact_bytes": total - evicted_bytes,
+            "evicted_artifacts": len(evicted),
+            "evicted_bytes": evicted_bytes
+        }
+
+    def _drop_index_entries(self, names: set):
+        """Remove derivation keys that point at evicted artifacts"""
+        index_root = os.path.join(self.root, INDEX_DIR)
+        if not os.path.isdir(index_root):
+            return
+        for shard in os.scandir(index_root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    with open(entry.path) as handle:
+                        if handle.read().strip() in names:
+                            os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,88 @@
+"""
+Signed URLs for stored artifacts, and the reference counts that keep maintenance from
+evicting any artifact an analysis_results row still lists (counted in artifact_references
+as rows are written and archived). The store itself is in artifact_store.py.
+
+Artifacts are served only through signed URLs, handed out with the analysis or heatmap
+the user asked for: an upload's name is the digest of a private image, so knowing it
+must not be enough to fetch it.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select, update
+
+from auth import SECRET_KEY
+from models import ArtifactReference
+from artifact_store import ArtifactStore, artifact_store, ARTIFACT_NAME
+
+load_dotenv()
+
+# Signed artifact URLs stay valid for between one and two of these
+ARTIFACT_URL_TTL_SECONDS = int(os.getenv("ARTIFACT_URL_TTL_SECONDS", "900"))
+
+def _artifact_signature(name: str, expires: int) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"{name}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+def signed_artifact_url(name: str, now: Optional[float] = None) -> str:
+    """Short-lived URL of an artifact, for a user the caller has checked may see it"""
+    # Expiry is rounded up to a whole TTL step, so the URL (and the browser's cached copy)
+    # stays the same for a while instead of changing on every response
+    step = ARTIFACT_URL_TTL_SECONDS
+    expires = (int(now if now is not None else time.time()) // step + 2) * step
+    return f"/artifacts/{name}?expires={expires}&signature={_artifact_signature(name, expires)}"
+
+def verify_artifact_url(name: str, expires: Optional[int], signature: Optional[str]) -> bool:
+    """Whether an artifact URL was signed by this server and has not expired"""
+    if expires is None or signature is None or expires < time.time():
+        return False
+    return hmac.compare_digest(signature, _artifact_signature(name, expires))
+
+def with_artifact_urls(result: Any) -> Any:
+    """An analysis result with a signed URL for each artifact it lists, under artifact_urls"""
+    artifacts = result.get("artifacts") if isinstance(result, dict) else None
+    if not isinstance(artifacts, dict):
+        return result
+    urls = {
+        key: signed_artifact_url(name)
+        for key, name in artifacts.items() if isinstance(name, str) and ARTIFACT_NAME.match(name)
+    }
+    return {**result, "artifact_urls": urls} if urls else result
+
+def artifact_names(result: Any) -> List[str]:
+    """Artifact names listed under the "artifacts" key of an analysis result"""
+    artifacts = result.get("artifacts") if isinstance(result, dict) else None
+    if not isinstance(artifacts, dict):
+        return []
+    return [name for name in artifacts.values() if isinstance(name, str) and ARTIFACT_NAME.match(name)]
+
+def count_references(db, results: Iterable[Any], delta: int):
+    """Add delta to the reference counts of the artifacts the results list, in the caller's transaction"""
+    counts: Dict[str, int] = {}
+    for result in results:
+        for name in artifact_names(result):
+            counts[name] = counts.get(name, 0) + delta
+    for name, count in counts.items():
+        updated = db.execute(
+            update(ArtifactReference)
+            .where(ArtifactReference.name == name)
+            .values(ref_count=ArtifactReference.ref_count + count)
+        )
+        if not updated.rowcount and count > 0:
+            db.add(ArtifactReference(name=name, ref_count=count))
+    if delta < 0 and counts:
+        db.execute(delete(ArtifactReference).where(ArtifactReference.ref_count <= 0))
+
+def collect_artifacts(session_factory, store: Optional[ArtifactStore] = None) -> Dict[str, Any]:
+    """Evict least recently used artifacts no analysis result refers to"""
+    db = session_factory()
+    try:
+        referenced = db.scalars(select(ArtifactReference.name).where(ArtifactReference.ref_count > 0)).all()
+    finally:
+        db.close()
+    return (store or artifact_store).collect_garbage(referenced)
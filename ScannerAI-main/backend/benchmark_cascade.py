@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the confidence-gated cascade against the always-full analysis path.
+
+Usage:
+    python benchmark_cascade.py DATASET_DIR [--analysis deepfake|forgery] [--threshold 0.85] [--limit N]
+
+DATASET_DIR holds one sub-folder per label, e.g. real/ and fake/ (or authentic/ and forged/).
+"""
+
+import argparse
+import itertools
+import sys
+import time
+
+from ai_services_fixed import ImageAnalysisService, CASCADE_CONFIDENCE_THRESHOLD
+from image_datasets import iter_labeled_images, is_positive_label
+
+VERDICT_KEYS = {"deepfake": "is_deepfake", "forgery": "is_forged"}
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascade vs full-path throughput and agreement")
+    parser.add_argument("dataset", help="Labeled image folder (one sub-folder per label)")
+    parser.add_argument("--analysis", choices=sorted(VERDICT_KEYS), default="deepfake")
+    parser.add_argument("--threshold", type=float, default=CASCADE_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    args = parser.parse_args()
+
+    service = ImageAnalysisService()
+    full_path = getattr(service, f"_analyze_{args.analysis}_sync")
+    cascade_path = getattr(service, f"_analyze_{args.analysis}_cascade_sync")
+    verdict_key = VERDICT_KEYS[args.analysis]
+
+    images = 0
+    full_time = 0.0
+    cascade_time = 0.0
+    fast_answers = 0
+    agreements = 0
+    labeled = 0
+    full_correct = 0
+    cascade_correct = 0
+
+    for path, label in itertools.islice(iter_labeled_images(args.dataset), args.limit):
+        with open(path, "rb") as image_file:
+            content = image_file.read()
+
+        start = time.perf_counter()
+        full_result = full_path(content)
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cascade_result = cascade_path(content, args.threshold)
+        cascade_time += time.perf_counter() - start
+
+        if not (full_result.get("success") and cascade_result.get("success")):
+            print(f"⚠️ Skipping {path}: {full_result.get('error') or cascade_result.get('error')}")
+            continue
+
+        images += 1
+        full_verdict = bool(full_result[verdict_key])
+        cascade_verdict = bool(cascade_result[verdict_key])
+        agreements += full_verdict == cascade_verdict
+        fast_answers += cascade_result["cascade"]["stage"] == "fast"
+
+        expected = is_positive_label(label)
+        if expected is not None:
+            labeled += 1
+            full_correct += full_verdict == expected
+            cascade_correct += cascade_verdict == expected
+
+    if images == 0:
+        print("❌ No images could be analyzed")
+        return 1
+
+    full_rate = images / full_time if full_time else 0.0
+    cascade_rate = images / cascade_time if cascade_time else 0.0
+
+    print(f"📊 Cascade benchmark ({args.analysis}, threshold {args.threshold})")
+    print("=" * 50)
+    print(f"   Images:              {images}")
+    print(f"   Full path:           {full_rate:.2f} images/sec")
+    print(f"   Cascade:             {cascade_rate:.2f} images/sec")
+    print(f"   Speedup:             {cascade_rate / full_rate if full_rate else 0.0:.2f}x")
+    print(f"   Answered by fast:    {fast_answers / images:.1%}")
+    print(f"   Verdict agreement:   {agreements / images:.1%}")
+    if labeled:
+        print(f"   Full accuracy:       {full_correct / labeled:.1%} ({labeled} labeled)")
+        print(f"   Cascade accuracy:    {cascade_correct / labeled:.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark sustained analysis-result write throughput: per-request commits vs the write-behind queue.
+
+Usage:
+    python benchmark_persistence.py [--writes 2000] [--concurrency 64] [--users 50]
+                                    [--modes direct,sync,group,async]
+
+Each mode writes into its own fresh SQLite file. "direct" is the old request path (a commit
+for the usage increment, then a commit plus refresh for the AnalysisResult); the other
+modes are write_behind.WriteBehindQueue durability settings.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import User, AnalysisResult, DailyUsage
+from usage_service import UsageService
+from write_behind import WriteBehindQueue
+
+SAMPLE_RESULT = {
+    "success": True,
+    "analysis_type": "deepfake",
+    "predicted_label": "Realism",
+    "is_deepfake": False,
+    "confidence": 0.93
+}
+
+def make_database(path: str, users: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = session_factory()
+    db.add_all([User(email=f"user{index}@example.com") for index in range(users)])
+    db.commit()
+    user_ids = [user.id for user in db.query(User).all()]
+    db.close()
+    return engine, session_factory, user_ids
+
+async def run_mode(mode: str, args) -> float:
+    path = tempfile.mktemp(suffix=".db")
+    engine, session_factory, user_ids = make_database(path, args.users)
+    queue = None if mode == "direct" else WriteBehindQueue(session_factory, durability=mode)
+    remaining = iter(range(args.writes))
+
+    async def direct_write(user_id: int):
+        db = session_factory()
+        try:
+            UsageService(db).increment_usage(user_id)
+            analysis = AnalysisResult(
+                user_id=user_id, analysis_type="deepfake", filename="image.jpg", result=SAMPLE_RESULT
+            )
+            db.add(analysis)
+            db.commit()
+            db.refresh(analysis)
+        finally:
+            db.close()
+
+    async def writer():
+        for _ in remaining:
+            user_id = random.choice(user_ids)
+            if queue is None:
+                await direct_write(user_id)
+            else:
+                await queue.save_analysis(user_id, "deepfake", "image.jpg", SAMPLE_RESULT)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[writer() for _ in range(args.concurrency)])
+    if queue is not None:
+        queue.close()
+    elapsed = time.perf_counter() - start
+
+    db = session_factory()
+    rows = db.scalar(select(func.count(AnalysisResult.id)))
+    usage = db.scalar(select(func.sum(DailyUsage.analysis_count)))
+    db.close()
+    engine.dispose()
+    os.unlink(path)
+
+    batches = f", {queue.metrics()['avg_batch_size']:.1f} writes/commit" if queue is not None else ""
+    print(f"  {mode:<7} {args.writes / elapsed:>8.0f} writes/s  ({rows} rows, usage {usage}{batches})")
+    return args.writes / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Write throughput of the persistence modes")
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--modes", default="direct,sync,group,async")
+    args = parser.parse_args()
+
+    print(f"💾 {args.writes} analysis writes, {args.concurrency} concurrent writers, {args.users} users")
+    throughput = {mode: asyncio.run(run_mode(mode, args)) for mode in args.modes.split(",")}
+    if "direct" in throughput:
+        for mode, value in throughput.items():
+            if mode != "direct":
+                print(f"📊 {mode}: {value / throughput['direct']:.1f}x the per-request commit path")
+
+if __name__ == "__main__":
+    main()
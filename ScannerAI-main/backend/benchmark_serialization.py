@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark serialization of an analysis response: the old path (ImageAnalysisResponse built
+in the endpoint, re-validated against response_model, dumped and encoded with the stdlib
+json module) vs responses.analysis_response (orjson, float32, no re-validation).
+
+Usage:
+    python benchmark_serialization.py [--iterations 2000] [--size 1024]
+
+Reports serialization time per response and bytes on the wire for identity, gzip and
+(if the brotli package is installed) brotli, measured through the app middleware.
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from schemas import ImageAnalysisResponse
+from responses import (
+    BROTLI_AVAILABLE, ORJSON_AVAILABLE, CompactJSONResponse, CompressionMiddleware, analysis_response
+)
+
+def sample_result(size: int) -> dict:
+    """Forgery-style result with the same layout and value types as the analyzers produce"""
+    rng = np.random.default_rng(0)
+    # Smooth photo-like image so the histograms look like real ones
+    base = cv2.GaussianBlur(rng.integers(0, 256, (size, size, 3), dtype=np.uint8), (0, 0), 8)
+    image = cv2.normalize(base, None, 0, 255, cv2.NORM_MINMAX)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    histograms = [cv2.calcHist([image], [channel], None, [256], [0, 256]) for channel in range(3)]
+    return {
+        "success": True,
+        "analysis_type": "forgery",
+        "is_forged": False,
+        "confidence": float(rng.random()),
+        "risk_level": "low",
+        "forgery_indicators": [
+            {"indicator": "Low edge density", "score": 0.6},
+            {"indicator": "Unusual color distribution", "score": float(rng.random())}
+        ],
+        "top_predictions": [
+            {"label": f"label_{index}", "confidence": float(value)}
+            for index, value in enumerate(sorted(rng.random(5), reverse=True))
+        ],
+        "basic_analysis": {
+            "image_properties": {"width": size, "height": size, "channels": 3, "format": "JPEG", "mode": "RGB"},
+            "color_analysis": {
+                "mean_color": np.mean(image, axis=(0, 1)).tolist(),
+                "std_color": np.std(image, axis=(0, 1)).tolist(),
+                "edge_density": float(np.mean(cv2.Canny(gray, 50, 150) > 0)),
+                "sharpness": float(cv2.Laplacian(gray, cv2.CV_64F).var())
+            },
+            "histogram": {
+                name: histogram.flatten().tolist() for name, histogram in zip(("blue", "green", "red"), histograms)
+            }
+        },
+        "message": "No significant signs of forgery detected"
+    }
+
+def old_response(result: dict, created_at: datetime) -> JSONResponse:
+    """What the endpoints did before: build the model, validate it again as response_model, dump, json.dumps"""
+    response = ImageAnalysisResponse(
+        id=1, analysis_type="forgery", filename="photo.jpg", result=result, created_at=created_at
+    )
+    validated = ImageAnalysisResponse.model_validate(response.model_dump())
+    return JSONResponse(jsonable_encoder(validated.model_dump(mode="json")))
+
+def new_response(result: dict, created_at: datetime) -> CompactJSONResponse:
+    return analysis_response(1, "forgery", "photo.jpg", result, created_at)
+
+def time_per_call(build, result: dict, iterations: int) -> float:
+    created_at = datetime.utcnow()
+    build(result, created_at)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build(result, created_at)
+    return (time.perf_counter() - started) / iterations
+
+def wire_sizes(build, result: dict) -> dict:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+    app.get("/result")(lambda: build(result, datetime.utcnow()))
+    client = TestClient(app)
+    encodings = ["identity", "gzip"] + (["br"] if BROTLI_AVAILABLE else [])
+    sizes = {}
+    for encoding in encodings:
+        response = client.get("/result", headers={"Accept-Encoding": encoding})
+        sizes[encoding] = int(response.headers["content-length"])
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=1024, help="Side of the synthetic image in pixels")
+    args = parser.parse_args()
+
+    result = sample_result(args.size)
+    print(f"🧪 Serializing a forgery result {args.iterations} times "
+          f"(orjson: {'yes' if ORJSON_AVAILABLE else 'no'}, brotli: {'yes' if BROTLI_AVAILABLE else 'no'})")
+
+    rows = []
+    for name, build in (("before", old_response), ("after", new_response)):
+        seconds = time_per_call(build, result, args.iterations)
+        rows.append((name, seconds, wire_sizes(build, result)))
+
+    for name, seconds, sizes in rows:
+        wire = ", ".join(f"{encoding} {size:>6} B" for encoding, size in sizes.items())
+        print(f"   {name:<7} {seconds * 1e6:>8.1f} µs/response | {wire}")
+
+    before, after = rows[0], rows[1]
+    print(f"✅ Serialization {before[1] / after[1]:.1f}x faster, "
+          f"{before[2]['identity'] / after[2]['gzip']:.1f}x fewer bytes on the wire with gzip")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Copy-move (cloned region) detection within a single image.
+
+Keypoints (ORB, or AKAZE) are detected on a reduced decode and every descriptor is matched
+against the rest of the same image through a FLANN LSH index, so matching is approximate
+and sub-quadratic instead of brute force. Pairs of keypoints that sit close together are
+the same structure rather than a copy and are dropped; the remaining pairs are grouped by
+RANSAC into sets that share one similarity transform, and each set is reported as a
+duplicated region and its copy, boxed in full-resolution pixels.
+
+Working size, keypoint count and wall time are all capped, so the cost of a 20+ MP photo
+is bounded by COPY_MOVE_MAX_SIDE / COPY_MOVE_MAX_KEYPOINTS / COPY_MOVE_TIME_BUDGET_MS
+rather than by its resolution.
+"""
+
+import io
+import math
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import cv2
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COPY_MOVE_ENABLED = os.getenv("COPY_MOVE_ENABLED", "true").lower() == "true"
+COPY_MOVE_DETECTOR = os.getenv("COPY_MOVE_DETECTOR", "orb").lower()
+# Longest side keypoints are detected at; larger images are decoded at reduced size
+COPY_MOVE_MAX_SIDE = int(os.getenv("COPY_MOVE_MAX_SIDE", "2048"))
+COPY_MOVE_MAX_KEYPOINTS = int(os.getenv("COPY_MOVE_MAX_KEYPOINTS", "5000"))
+# Wall-clock budget; stages that would start after it are skipped and the result is marked partial
+COPY_MOVE_TIME_BUDGET_MS = float(os.getenv("COPY_MOVE_TIME_BUDGET_MS", "800"))
+# Matches that must agree on one transform before a region pair is reported
+COPY_MOVE_MIN_MATCHES = int(os.getenv("COPY_MOVE_MIN_MATCHES", "10"))
+# Keypoints closer than this (working-resolution pixels) are one structure, not a copy
+COPY_MOVE_MIN_DISTANCE = float(os.getenv("COPY_MOVE_MIN_DISTANCE", "30"))
+
+MAX_REGIONS = 5
+# Neighbours fetched per descriptor: itself, its copies and the runner-up the ratio test needs
+NEIGHBOURS = 5
+# Generalized 2NN test: a neighbour is a copy while it is clearly closer than the next one
+RATIO = 0.6
+# Largest Hamming distance, as a fraction of descriptor bits, still considered the same patch
+MAX_HAMMING_FRACTION = 0.2
+RANSAC_THRESHOLD = 3.0
+# A "copy" scaled beyond these factors is a chance alignment, not a cloned region
+SCALE_RANGE = (0.5, 2.0)
+
+FLANN_INDEX_LSH = 6
+LSH_PARAMS = dict(algorithm=FLANN_INDEX_LSH, table_number=8, key_size=20, multi_probe_level=1)
+
+def _decode_gray(image_content: bytes, max_side: int) -> Tuple[np.ndarray, float]:
+    """Grayscale plane no larger than max_side and its scale relative to the original"""
+    image = Image.open(io.BytesIO(image_content))
+    width = image.width
+    # JPEGs are scaled by the decoder itself, so a 20 MP photo is never decoded in full
+    image.draft("L", (max_side, max_side))
+    image = image.convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(image), image.width / float(width)
+
+def _detect(gray: np.ndarray, max_keypoints: int):
+    if COPY_MOVE_DETECTOR == "akaze":
+        detector = cv2.AKAZE_create(threshold=0.0005)
+        # AKAZE has no keypoint cap of its own: keep the strongest responses
+        keypoints = sorted(detector.detect(gray, None), key=lambda keypoint: keypoint.response, reverse=True)
+        keypoints, descriptors = detector.compute(gray, keypoints[:max_keypoints])
+    else:
+        detector = cv2.ORB_create(nfeatures=max_keypoints)
+        keypoints, descriptors = detector.detectAndCompute(gray, None)
+    return keypoints or (), descriptors
+
+def _match_pairs(points: np.ndarray, descriptors: np.ndarray, min_distance: float) -> np.ndarray:
+    """Unique (i, j) keypoint pairs, i < j, whose descriptors match across a distance"""
+    matcher = cv2.FlannBasedMatcher(LSH_PARAMS, dict(checks=32))
+    knn = matcher.knnMatch(descriptors, descriptors, k=NEIGHBOURS)
+    # LSH may return fewer than k neighbours; missing ones are padded with -1
+    query = np.repeat(np.arange(len(knn)), NEIGHBOURS).reshape(-1, NEIGHBOURS)
+    train = np.full((len(knn), NEIGHBOURS), -1, dtype=np.int64)
+    hamming = np.full((len(knn), NEIGHBOURS), np.inf)
+    for row, neighbours in enumerate(knn):
+        for column, match in enumerate(neighbours):
+            train[row, column] = match.trainIdx
+            hamming[row, column] = match.distance
+
+    # Drop the query itself and anything right beside it, then close the gaps
+    offsets = points[np.maximum(train, 0)] - points[query]
+    valid = (train >= 0) & (train != query) & (np.hypot(offsets[..., 0], offsets[..., 1]) >= min_distance)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    train = np.take_along_axis(train, order, axis=1)
+    hamming = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(hamming, order, axis=1), np.inf)
+
+    max_hamming = descriptors.shape[1] * 8 * MAX_HAMMING_FRACTION
+    following = np.concatenate([hamming[:, 1:], np.full((len(knn), 1), np.inf)], axis=1)
+    following = np.minimum(following, max_hamming)
+    # Neighbours are copies up to the first one that fails the test
+    accepted = np.cumprod((hamming <= max_hamming) & (hamming < RATIO * following), axis=1).astype(bool)
+
+    first, second = query[accepted], train[accepted]
+    pairs = np.unique(np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1), axis=0)
+    return pairs.reshape(-1, 2)
+
+def _box(points: np.ndarray, padding: float, scale: float, width: int, height: int) -> Dict[str, int]:
+    """Bounding box of working-resolution points in full-resolution pixels"""
+    x0, y0 = np.maximum((points.min(axis=0) - padding) / scale, 0)
+    x1, y1 = (points.max(axis=0) + padding) / scale
+    x1, y1 = min(x1, width), min(y1, height)
+    return {"x": int(x0), "y": int(y0), "width": int(round(x1 - x0)), "height": int(round(y1 - y0))}
+
+def _cluster_regions(
+    points: np.ndarray, sizes: np.ndarray, pairs: np.ndarray, scale: float,
+    width: int, height: int, min_matches: int, deadline: float
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Region pairs sharing one similarity transform, strongest first, and whether the budget ran out"""
+    regions = []
+    remaining = np.arange(len(pairs))
+    while len(remaining) >= min_matches and len(regions) < MAX_REGIONS:
+        if time.perf_counter() > deadline:
+            return regions, True
+        first, second = points[pairs[remaining, 0]], points[pairs[remaining, 1]]
+        # Which keypoint of a pair is the original is unknown, so both orientations are offered
+        transform, inliers = cv2.estimateAffinePartial2D(
+            np.vstack([first, second]), np.vstack([second, first]),
+            method=cv2.RANSAC, ransacReprojThreshold=RANSAC_THRESHOLD, maxIters=2000, confidence=0.995
+        )
+        if transform is None:
+            break
+        inliers = inliers.ravel().astype(bool)
+        forward, backward = inliers[:len(remaining)], inliers[len(remaining):]
+        members = forward | backward
+        if members.sum() < min_matches:
+            break
+
+        source_index = np.where(forward, pairs[remaining, 0], pairs[remaining, 1])[members]
+        target_index = np.where(forward, pairs[remaining, 1], pairs[remaining, 0])[members]
+        remaining = remaining[~members]
+
+        transform_scale = math.hypot(transform[0, 0], transform[1, 0])
+        if not SCALE_RANGE[0] <= transform_scale <= SCALE_RANGE[1]:
+            continue
+        padding = float(np.median(sizes[np.concatenate([source_index, target_index])])) / 2
+        # Which of the two is the original cannot be told from the pixels; "source" maps onto "target"
+        regions.append({
+            "source": _box(points[source_index], padding, scale, width, height),
+            "target": _box(points[target_index], padding, scale, width, height),
+            "matches": int(len(source_index)),
+            "transform": {
+                "dx": round(float(transform[0, 2]) / scale, 1),
+                "dy": round(float(transform[1, 2]) / scale, 1),
+                "rotation_degrees": round(math.degrees(math.atan2(transform[1, 0], transform[0, 0])), 1),
+                "scale": round(transform_scale, 3)
+            }
+        })
+    return regions, False
+
+def detect_copy_move(
+    image_content: bytes,
+    max_side: int = COPY_MOVE_MAX_SIDE,
+    max_keypoints: int = COPY_MOVE_MAX_KEYPOINTS,
+    time_budget_ms: float = COPY_MOVE_TIME_BUDGET_MS,
+    min_matches: int = COPY_MOVE_MIN_MATCHES
+) -> Dict[str, Any]:
+    """Duplicated region pairs within one image, with forgery indicators"""
+    started = time.perf_counter()
+    deadline = started + time_budget_ms / 1000.0
+    timings_ms: Dict[str, float] = {}
+
+    def lap(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timings_ms[stage] = round((now - since) * 1000, 3)
+        return now
+
+    try:
+        with Image.open(io.BytesIO(image_content)) as header:
+            width, height = header.size
+        gray, scale = _decode_gray(image_content, max_side)
+        checkpoint = lap("decode", started)
+
+        regions: List[Dict[str, Any]] = []
+        keypoints, descriptors, pair_count = (), None, 0
+        budget_exhausted = time.perf_counter() > deadline
+        if not budget_exhausted:
+            keypoints, descriptors = _detect(gray, max_keypoints)
+            checkpoint = lap("detect", checkpoint)
+            budget_exhausted = time.perf_counter() > deadline
+        if not budget_exhausted and descriptors is not None and len(keypoints) > min_matches:
+            points = np.float32([keypoint.pt for keypoint in keypoints])
+            sizes = np.float32([keypoint.size for keypoint in keypoints])
+            pairs = _match_pairs(points, descriptors, COPY_MOVE_MIN_DISTANCE)
+            pair_count = len(pairs)
+            checkpoint = lap("match", checkpoint)
+            regions, budget_exhausted = _cluster_regions(
+                points, sizes, pairs, scale, width, height, min_matches, deadline
+            )
+            lap("cluster", checkpoint)
+
+        indicators = []
+        if regions:
+            strongest = max(region["matches"] for region in regions)
+            indicators.append({
+                "indicator": f"Duplicated image region (copy-move, {len(regions)} region pair{'s' if len(regions) > 1 else ''})",
+                "score": round(min(0.95, 0.75 + 0.2 * strongest / (4.0 * min_matches)), 3)
+            })
+
+        return {
+            "detected": bool(regions),
+            "regions": regions,
+            "indicators": indicators,
+            "detector": COPY_MOVE_DETECTOR,
+            "keypoints": len(keypoints),
+            "matched_pairs": pair_count,
+            "analysis_scale": round(scale, 4),
+            "budget_exhausted": budget_exhausted,
+            "stage_timings_ms": timings_ms,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    except Exception as e:
+        return {"error": f"Copy-move analysis failed: {str(e)}", "detected": False, "regions": [], "indicators": []}
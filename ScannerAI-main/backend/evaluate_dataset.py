@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Evaluate every analyzer on a labeled image folder, caching the expensive intermediates.
+
+Usage:
+    python evaluate_dataset.py DATASET_DIR [--analyses classification,deepfake,deepfake_heuristics,forgery]
+                               [--workers N] [--cache-dir DIR] [--refresh] [--limit N] [--json REPORT]
+
+DATASET_DIR holds one sub-folder per label: real/ and fake/ (or authentic/ and forged/) for the
+detectors, ImageNet class names (e.g. golden_retriever/) for classification.
+
+Images are analyzed in a pool of worker processes. Model input tensors, model logits and the
+features the heuristics read (image metrics, metadata, copy-move) are cached on disk under
+CACHE_DIR/<kind>/<version>/, keyed by the SHA-256 of the file. The version covers what
+produced the entry (processor settings, model name and speed mode, the source of the feature
+extractors), so a changed model misses the cache while a changed heuristic in
+ai_services_fixed.py reruns in seconds on cached features.
+
+Reports accuracy and ROC-AUC per analyzer (top-1/top-5 for classification) and the time
+spent in each stage.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+import ai_services_fixed
+import copy_move
+import image_metrics
+import metadata_analysis
+import spectral_analysis
+from face_detection import FACE_DETECTION_ENABLED, FACE_MARGIN, FACE_MAX_COUNT, FACE_MIN_SIZE, extract_faces
+from image_datasets import iter_labeled_images, is_positive_label
+from image_metrics import HEURISTIC_METRICS, compute_metrics
+from inference_protocol import dumps, loads
+
+load_dotenv()
+
+EVALUATION_CACHE_DIR = os.getenv("EVALUATION_CACHE_DIR", "./evaluation_cache")
+
+ANALYZERS = ("classification", "deepfake", "deepfake_heuristics", "forgery")
+MODEL_ANALYZERS = ("classification", "deepfake")
+STAGES = ("read", "decode", "faces", "preprocess", "forward", "metrics", "metadata", "copy_move", "heuristics")
+
+# The heuristics read these features; their cache entries are invalidated by any edit to these modules
+FEATURE_MODULES = (image_metrics, metadata_analysis, copy_move, spectral_analysis)
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+class FeatureCache:
+    """Files keyed by (kind, version, file hash) under one directory, written atomically"""
+
+    def __init__(self, root: str, refresh: bool = False):
+        self.root = root
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+
+    def _directory(self, kind: str, version: str) -> str:
+        directory = os.path.join(self.root, kind, _digest(version))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            # What the entries were computed with, for whoever browses the cache
+            self._write_atomic(os.path.join(directory, "VERSION"), version.encode())
+        return directory
+
+    def _path(self, kind: str, version: str, file_hash: str, extension: str) -> str:
+        return os.path.join(self._directory(kind, version), file_hash[:2], f"{file_hash}.{extension}")
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as handle:
+                handle.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def _read(self, path: str) -> Optional[bytes]:
+        if self.refresh:
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as handle:
+                data = handle.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def get_arrays(self, kind: str, version: str, file_hash: str) -> Optional[Dict[str, np.ndarray]]:
+        data = self._read(self._path(kind, version, file_hash, "npz"))
+        if data is None:
+            return None
+        with np.load(io.BytesIO(data)) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+
+    def put_arrays(self, kind: str, version: str, file_hash: str, **arrays: np.ndarray):
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        self._write_atomic(self._path(kind, version, file_hash, "npz"), buffer.getvalue())
+
+    def get_json(self, kind: str, version: str, file_hash: str) -> Optional[Any]:
+        data = self._read(self._path(kind, version, file_hash, "json"))
+        return None if data is None else loads(data)
+
+    def put_json(self, kind: str, version: str, file_hash: str, value: Any):
+        self._write_atomic(self._path(kind, version, file_hash, "json"), dumps(value))
+
+class ImageEvaluator:
+    """Runs the analyzers on one image at a time, from cache where it can"""
+
+    def __init__(self, cache: FeatureCache, analyses: List[str]):
+        self.cache = cache
+        self.analyses = analyses
+        self.service = ai_services_fixed.ImageAnalysisService()
+        self.models = {}
+        if ai_services_fixed.MODELS_AVAILABLE:
+            self.models = {
+                "classification": (ai_services_fixed.VIT_PROCESSOR, ai_services_fixed.VIT_MODEL),
+                "deepfake": (ai_services_fixed.DEEPFAKE_PROCESSOR, ai_services_fixed.DEEPFAKE_MODEL)
+            }
+        self.tensor_versions = {}
+        self.logit_versions = {}
+        for analysis, (processor, model) in self.models.items():
+            tensor_version = f"processor={processor.to_json_string()}"
+            if analysis == "deepfake":
+                # The deepfake model scores face crops, so the crops depend on the face detector settings
+                tensor_version += (
+                    f"|faces={FACE_DETECTION_ENABLED},{FACE_MAX_COUNT},{FACE_MIN_SIZE},{FACE_MARGIN}"
+                )
+            model_version = asyncio.run(self.service.model_version(analysis))
+            self.tensor_versions[analysis] = tensor_version
+            self.logit_versions[analysis] = (
+                f"model={model_version}|config={_digest(model.config.to_json_string())}|{tensor_version}"
+            )
+        sources = []
+        files = [module.__file__ for module in FEATURE_MODULES]
+        if spectral_analysis.SPECTRAL_MODEL is not None:
+            # A refitted spectral model changes the GAN-artifact feature
+            files.append(spectral_analysis.SPECTRAL_MODEL_PATH)
+        for path in files:
+            with open(path, "rb") as handle:
+                sources.append(hashlib.sha256(handle.read()).hexdigest())
+        self.feature_version = (
+            f"metrics={','.join(HEURISTIC_METRICS + ai_services_fixed.SPECTRAL_METRICS)}"
+            f"|metadata={metadata_analysis.METADATA_ANALYSIS_ENABLED}|copy_move={copy_move.COPY_MOVE_ENABLED}"
+            f"|sources={_digest(','.join(sources))}"
+        )
+
+    def evaluate(self, path: str) -> Dict[str, Any]:
+        timings = {stage: 0.0 for stage in STAGES}
+        computed = {stage: 0 for stage in STAGES}
+        state = {"image": None}
+
+        def timed(stage, compute, *args):
+            started = time.perf_counter()
+            value = compute(*args)
+            timings[stage] += time.perf_counter() - started
+            computed[stage] += 1
+            return value
+
+        content, file_hash = timed("read", _read_file, path)
+
+        def image():
+            # Decoded only when something is not cached
+            if state["image"] is None:
+                state["image"] = timed("decode", lambda: Image.open(io.BytesIO(content)).convert("RGB"))
+            return state["image"]
+
+        results = {}
+        features = None
+        for analysis in self.analyses:
+            try:
+                if analysis in MODEL_ANALYZERS:
+                    if analysis not in self.models:
+                        raise RuntimeError("AI models are not available")
+                    logits = self._logits(analysis, file_hash, image, timed)
+                    results[analysis] = timed("heuristics", self._score, analysis, logits)
+                else:
+                    if features is None:
+                        features = self._features(content, file_hash, timed)
+                    results[analysis] = timed("heuristics", self._heuristics, analysis, features)
+            except Exception as e:
+                results[analysis] = {"error": str(e)}
+
+        return {"path": path, "results": results, "timings": timings, "computed": computed}
+
+    def _logits(self, analysis: str, file_hash: str, image, timed) -> np.ndarray:
+        cached = self.cache.get_arrays(f"logits-{analysis}", self.logit_versions[analysis], file_hash)
+        if cached is not None:
+            return cached["logits"]
+
+        tensor_kind = f"tensors-{analysis}"
+        tensors = self.cache.get_arrays(tensor_kind, self.tensor_versions[analysis], file_hash)
+        if tensors is None:
+            processor, _ = self.models[analysis]
+            crops = [image()]
+            if analysis == "deepfake" and FACE_DETECTION_ENABLED:
+                faces = timed("faces", extract_faces, np.asarray(image()))
+                crops = [crop for _, crop in faces] or crops
+            pixel_values = timed("preprocess", lambda: processor(images=crops, return_tensors="np")["pixel_values"])
+            tensors = {"pixel_values": pixel_values.astype(np.float32)}
+            self.cache.put_arrays(tensor_kind, self.tensor_versions[analysis], file_hash, **tensors)
+
+        _, model = self.models[analysis]
+        logits = timed("forward", self._forward, model, tensors["pixel_values"])
+        self.cache.put_arrays(f"logits-{analysis}", self.logit_versions[analysis], file_hash, logits=logits)
+        return logits
+
+    def _forward(self, model, pixel_values: np.ndarray) -> np.ndarray:
+        torch = ai_services_fixed.torch
+        with torch.no_grad():
+            logits = self.service._model_logits(model, {"pixel_values": torch.from_numpy(pixel_values)})
+        return logits.numpy()
+
+    def _score(self, analysis: str, logits: np.ndarray) -> Dict[str, Any]:
+        """Verdict from cached logits, the way the analysis endpoints reach it"""
+        torch = ai_services_fixed.torch
+        probabilities = torch.nn.functional.softmax(torch.from_numpy(logits), dim=-1)
+        if analysis == "classification":
+            id2label = ai_services_fixed.VIT_MODEL.config.id2label
+            top = torch.topk(probabilities[0], k=min(5, probabilities.shape[-1])).indices.tolist()
+            return {"top_predictions": [id2label[class_id] for class_id in top]}
+        # The image is as suspicious as its most suspicious face
+        verdict = max(self.service._deepfake_scores(probabilities), key=lambda score: score["fake_probability"])
+        return {"verdict": bool(verdict["is_deepfake"]), "score": verdict["fake_probability"]}
+
+    def _features(self, content: bytes, file_hash: str, timed) -> Dict[str, Any]:
+        features = self.cache.get_json("features", self.feature_version, file_hash)
+        if features is not None:
+            return features
+        features = {
+            "basic_analysis": timed(
+                "metrics", compute_metrics, content, HEURISTIC_METRICS + ai_services_fixed.SPECTRAL_METRICS
+            ),
+            "metadata": timed("metadata", metadata_analysis.analyze_metadata, content)
+            if metadata_analysis.METADATA_ANALYSIS_ENABLED else None,
+            "copy_move": timed("copy_move", copy_move.detect_copy_move, content)
+            if copy_move.COPY_MOVE_ENABLED else None
+        }
+        # Round-tripped so a first run sees exactly what a cached rerun will
+        features = loads(dumps(features))
+        self.cache.put_json("features", self.feature_version, file_hash, features)
+        return features
+
+    def _heuristics(self, analysis: str, features: Dict[str, Any]) -> Dict[str, Any]:
+        if analysis == "forgery":
+            verdict = self.service._forgery_heuristics(features["basic_analysis"], features["metadata"], features["copy_move"])
+            return {"verdict": bool(verdict["is_forged"]), "score": _indicator_score(verdict["forgery_indicators"])}
+        verdict = self.service._deepfake_heuristics(features["basic_analysis"])
+        return {"verdict": bool(verdict["is_deepfake"]), "score": _indicator_score(verdict["deepfake_indicators"])}
+
+def _read_file(path: str) -> Tuple[bytes, str]:
+    """File bytes and their SHA-256, the cache key"""
+    with open(path, "rb") as image_file:
+        content = image_file.read()
+    return content, hashlib.sha256(content).hexdigest()
+
+def _indicator_score(indicators: List[Dict[str, Any]]) -> float:
+    """Average indicator score, which the heuristics threshold at 0.6 for their verdict"""
+    if not indicators:
+        return 0.0
+    return sum(indicator["score"] for indicator in indicators) / len(indicators)
+
+def roc_auc(labels: List[bool], scores: List[float]) -> Optional[float]:
+    """Area under the ROC curve from the rank-sum statistic, ties counted as half; None without both classes"""
+    labels = np.asarray(labels, dtype=bool)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    if positives == 0 or negatives == 0:
+        return None
+    values, inverse, counts = np.unique(np.asarray(scores, dtype=np.float64), return_inverse=True, return_counts=True)
+    # Tied scores share the average of the ranks they span
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    return float((ranks[labels].sum() - positives * (positives + 1) / 2.0) / (positives * negatives))
+
+def _normalize_label(label: str) -> str:
+    return label.strip().lower().replace("_", " ").replace("-", " ")
+
+def class_names(id2label: Dict[int, str]) -> set:
+    """Every name a class of the classification model goes by ("tabby, tabby cat" is two)"""
+    return {_normalize_label(name) for label in id2label.values() for name in label.split(",")}
+
+def matches_class(label: str, predicted_label: str) -> bool:
+    return _normalize_label(label) in {_normalize_label(name) for name in predicted_label.split(",")}
+
+# One evaluator per worker process, built once by the pool initializer
+_evaluator: Optional[ImageEvaluator] = None
+
+def _init_worker(cache_dir: str, refresh: bool, analyses: List[str], threads: int):
+    global _evaluator
+    if ai_services_fixed.TORCH_AVAILABLE:
+        # Each worker gets its share of the cores instead of every worker using all of them
+        ai_services_fixed.torch.set_num_threads(threads)
+    _evaluator = ImageEvaluator(FeatureCache(cache_dir, refresh), analyses)
+
+def _evaluate_image(task: Tuple[str, str]) -> Dict[str, Any]:
+    path, label = task
+    try:
+        record = _evaluator.evaluate(path)
+    except Exception as e:
+        record = {"path": path, "error": str(e)}
+    record["label"] = label
+    record["cache_hits"], record["cache_misses"] = _evaluator.cache.hits, _evaluator.cache.misses
+    _evaluator.cache.hits = _evaluator.cache.misses = 0
+    return record
+
+def summarize(records: List[Dict[str, Any]], analyses: List[str]) -> Dict[str, Any]:
+    """Accuracy and ROC-AUC per analyzer over the labeled images"""
+    summary = {}
+    known_classes = class_names(ai_services_fixed.VIT_MODEL.config.id2label) if ai_services_fixed.MODELS_AVAILABLE else set()
+    for analysis in analyses:
+        outcomes = [record["results"][analysis] for record in records if "results" in record]
+        errors = sum(1 for outcome in outcomes if "error" in outcome)
+        if analysis == "classification":
+            # Only folders named after one of the model's classes can be scored
+            scored = [
+                (record["label"], record["results"][analysis]["top_predictions"])
+                for record in records
+                if "top_predictions" in record.get("results", {}).get(analysis, {})
+                and _normalize_label(record["label"]) in known_classes
+            ]
+            summary[analysis] = {
+                "images": len(outcomes) - errors,
+                "errors": errors,
+                "labeled": len(scored),
+                "top1_accuracy": sum(matches_class(label, top[0]) for label, top in scored) / len(scored) if scored else None,
+                "top5_accuracy": sum(any(matches_class(label, name) for name in top) for label, top in scored) / len(scored) if scored else None
+            }
+            continue
+
+        scored = [
+            (is_positive_label(record["label"]), record["results"][analysis])
+            for record in records
+            if "verdict" in record.get("results", {}).get(analysis, {}) and is_positive_label(record["label"]) is not None
+        ]
+        labels = [expected for expected, _ in scored]
+        verdicts = [outcome["verdict"] for _, outcome in scored]
+        true_positives = sum(1 for expected, verdict in zip(labels, verdicts) if expected and verdict)
+        summary[analysis] = {
+            "images": len(outcomes) - errors,
+            "errors": errors,
+            "labeled": len(scored),
+            "positives": sum(labels),
+            "accuracy": sum(expected == verdict for expected, verdict in zip(labels, verdicts)) / len(scored) if scored else None,
+            "precision": true_positives / sum(verdicts) if sum(verdicts) else None,
+            "recall": true_positives / sum(labels) if sum(labels) else None,
+            "roc_auc": roc_auc(labels, [outcome["score"] for _, outcome in scored])
+        }
+    return summary
+
+def stage_throughput(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Runs of each stage that were not served from cache, and the worker time they took"""
+    stages = {}
+    for stage in STAGES:
+        computed = sum(record.get("computed", {}).get(stage, 0) for record in records)
+        seconds = sum(record.get("timings", {}).get(stage, 0.0) for record in records)
+        if computed:
+            stages[stage] = {
+                "computed": computed,
+                "seconds": seconds,
+                "ms_per_run": seconds * 1000 / computed,
+                "runs_per_second": computed / seconds if seconds else 0.0
+            }
+    return stages
+
+def _percent(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.1%}"
+
+def print_report(report: Dict[str, Any]):
+    print(f"📊 Evaluation of {report['images']} images from {report['dataset']}")
+    print("=" * 60)
+    print(f"   Wall time:           {report['wall_seconds']:.2f}s ({report['images_per_second']:.2f} images/sec, {report['workers']} workers)")
+    print(f"   Cache:               {report['cache_hits']} hits, {report['cache_misses']} misses")
+    if report["failed"]:
+        print(f"   Unreadable images:   {report['failed']}")
+
+    for analysis, summary in report["analyses"].items():
+        print(f"\n{analysis}: {summary['images']} analyzed, {summary['errors']} errors, {summary['labeled']} labeled")
+        if analysis == "classification":
+            print(f"   Top-1 accuracy:      {_percent(summary['top1_accuracy'])}")
+            print(f"   Top-5 accuracy:      {_percent(summary['top5_accuracy'])}")
+            continue
+        roc_auc_text = "n/a" if summary["roc_auc"] is None else f"{summary['roc_auc']:.3f}"
+        print(f"   Accuracy:            {_percent(summary['accuracy'])} ({summary['positives']} positive)")
+        print(f"   Precision / recall:  {_percent(summary['precision'])} / {_percent(summary['recall'])}")
+        print(f"   ROC-AUC:             {roc_auc_text}")
+
+    print("\n⏱️ Stages (worker time, cache misses only)")
+    for stage, throughput in report["stages"].items():
+        print(
+            f"   {stage:<12} {throughput['computed']:>6} runs  {throughput['ms_per_run']:>9.2f} ms/run  "
+            f"{throughput['runs_per_second']:>9.1f} runs/sec"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy, ROC-AUC and stage throughput of every analyzer")
+    parser.add_argument("dataset", help="Labeled image folder (one sub-folder per label)")
+    parser.add_argument("--analyses", default=",".join(ANALYZERS), help="Comma-separated analyzers to evaluate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--cache-dir", default=EVALUATION_CACHE_DIR, help="Where tensors, logits and features are cached")
+    parser.add_argument("--refresh", action="store_true", help="Recompute everything, overwriting the cache")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    analyses = [analysis.strip() for analysis in args.analyses.split(",") if analysis.strip()]
+    unknown = set(analyses) - set(ANALYZERS)
+    if unknown:
+        print(f"❌ Unknown analyzers: {', '.join(sorted(unknown))} (choose from {', '.join(ANALYZERS)})")
+        return 1
+
+    tasks = list(itertools.islice(iter_labeled_images(args.dataset), args.limit))
+    if not tasks:
+        print("❌ No labeled images found")
+        return 1
+
+    workers = max(1, min(args.workers, len(tasks)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    started = time.perf_counter()
+    if workers == 1:
+        _init_worker(args.cache_dir, args.refresh, analyses, threads)
+        records = [_evaluate_image(task) for task in tasks]
+    else:
+        # Forked workers share the models the parent loaded on import
+        with multiprocessing.Pool(workers, _init_worker, (args.cache_dir, args.refresh, analyses, threads)) as pool:
+            records = list(pool.imap_unordered(_evaluate_image, tasks, chunksize=4))
+    wall_seconds = time.perf_counter() - started
+
+    for record in records:
+        if "error" in record:
+            print(f"⚠️ Skipping {record['path']}: {record['error']}")
+
+    report = {
+        "dataset": args.dataset,
+        "images": len(records),
+        "failed": sum(1 for record in records if "error" in record),
+        "workers": workers,
+        "wall_seconds": wall_seconds,
+        "images_per_second": len(records) / wall_seconds if wall_seconds else 0.0,
+        "cache_hits": sum(record["cache_hits"] for record in records),
+        "cache_misses": sum(record["cache_misses"] for record in records),
+        "analyses": summarize(records, analyses),
+        "stages": stage_throughput(records)
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Compare token-merging speed mode against the unmodified ViT models.
+
+Usage:
+    python evaluate_token_merging.py [--images DIR] [--ratios 0.05,0.1,0.15,0.2] [--limit N]
+
+Reports per-image latency, the latency reduction, top-1 agreement for VIT_MODEL and
+deepfake-label agreement for DEEPFAKE_MODEL. Without --images, random noise images are used,
+which is enough for latency but not a meaningful agreement figure.
+"""
+
+import argparse
+import itertools
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import ai_services_fixed
+from ai_services_fixed import _deepfake_class_ids
+from image_datasets import iter_image_files
+
+def load_images(directory, limit):
+    if directory:
+        paths = itertools.islice(iter_image_files(directory), limit)
+        return [Image.open(path).convert("RGB") for path in paths]
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8))
+        for _ in range(limit or 16)
+    ]
+
+def run(model, pixel_batches, logits_fn):
+    """Return (predictions, per-image latencies) for one model and one logits function"""
+    predictions = []
+    latencies = []
+    for pixel_values in pixel_batches:
+        start = time.perf_counter()
+        with ai_services_fixed.torch.no_grad():
+            logits = logits_fn(model, pixel_values)
+        latencies.append(time.perf_counter() - start)
+        predictions.append(int(logits.argmax(-1).item()))
+    return predictions, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Token merging latency and agreement report")
+    parser.add_argument("--images", help="Folder of images to evaluate on (searched recursively)")
+    parser.add_argument("--ratios", default="0.05,0.1,0.15,0.2", help="Comma-separated merge ratios to sweep")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    args = parser.parse_args()
+
+    if not ai_services_fixed.MODELS_AVAILABLE:
+        print("❌ AI models are not available; token merging needs VIT_MODEL and DEEPFAKE_MODEL")
+        return 1
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        print("❌ No images found")
+        return 1
+
+    models = {
+        "classification": (ai_services_fixed.VIT_PROCESSOR, ai_services_fixed.VIT_MODEL),
+        "deepfake": (ai_services_fixed.DEEPFAKE_PROCESSOR, ai_services_fixed.DEEPFAKE_MODEL),
+    }
+    ratios = [float(ratio) for ratio in args.ratios.split(",") if ratio.strip()]
+    fake_class_ids = set(_deepfake_class_ids())
+
+    print(f"📊 Token merging evaluation on {len(images)} images")
+    print("=" * 60)
+
+    for name, (processor, model) in models.items():
+        pixel_batches = [processor(images=image, return_tensors="pt")["pixel_values"] for image in images]
+        baseline, baseline_latencies = run(model, pixel_batches, lambda m, x: m(pixel_values=x).logits)
+        baseline_ms = statistics.mean(baseline_latencies) * 1000
+
+        print(f"\n{name}: unmodified {baseline_ms:.1f} ms/image")
+        for ratio in ratios:
+            merged, latencies = run(
+                model, pixel_batches,
+                lambda m, x: ai_services_fixed.tome_logits(m, x, ratio)
+            )
+            merged_ms = statistics.mean(latencies) * 1000
+            if name == "deepfake":
+                agreement = statistics.mean(
+                    (a in fake_class_ids) == (b in fake_class_ids) for a, b in zip(baseline, merged)
+                )
+                agreement_name = "deepfake-label agreement"
+            else:
+                agreement = statistics.mean(a == b for a, b in zip(baseline, merged))
+                agreement_name = "top-1 agreement"
+            print(
+                f"   ratio {ratio:.2f}: {merged_ms:.1f} ms/image "
+                f"({1 - merged_ms / baseline_ms:.1%} faster), {agreement_name} {agreement:.1%}"
+            )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""
+Streaming export of analysis history as NDJSON, CSV or Parquet.
+
+Rows are read through a server-side cursor (yield_per) and serialized in chunks, so memory
+use does not depend on how many analyses are exported. Archived analyses are included
+with their full result, read frame by frame from the archive partitions.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import AnalysisResult, ArchivedAnalysis
+from maintenance import read_frame_lines
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows fetched per round trip from the database cursor
+EXPORT_FETCH_ROWS = 1000
+# Serialized bytes collected before a chunk is handed to the response
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Rows per Parquet row group
+PARQUET_ROW_GROUP = 10000
+
+CSV_COLUMNS = [
+    "id", "user_id", "analysis_type", "filename", "created_at", "archived",
+    "success", "predicted_label", "confidence", "is_forged", "is_deepfake", "risk_level", "result"
+]
+
+def _filters(model, user_id: Optional[int], start: Optional[datetime], end: Optional[datetime],
+             analysis_types: Optional[List[str]]):
+    conditions = []
+    if user_id is not None:
+        conditions.append(model.user_id == user_id)
+    if start is not None:
+        conditions.append(model.created_at >= start)
+    if end is not None:
+        conditions.append(model.created_at < end)
+    if analysis_types:
+        conditions.append(model.analysis_type.in_(analysis_types))
+    return conditions
+
+def iter_export_rows(
+    db: Session,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    analysis_types: Optional[List[str]] = None,
+    include_archived: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """Matching analyses one at a time: live rows by id, then archived rows in archive order"""
+    live = select(
+        AnalysisResult.id, AnalysisResult.user_id, AnalysisResult.analysis_type,
+        AnalysisResult.filename, AnalysisResult.created_at, AnalysisResult.result
+    ).where(*_filters(AnalysisResult, user_id, start, end, analysis_types)).order_by(AnalysisResult.id)
+
+    for row in db.execute(live.execution_options(yield_per=EXPORT_FETCH_ROWS)):
+        yield {
+            "id": row.id,
+            "user_id": row.user_id,
+            "analysis_type": row.analysis_type,
+            "filename": row.filename,
+            "created_at": row.created_at,
+            "archived": False,
+            "result": row.result
+        }
+
+    if not include_archived:
+        return
+
+    archived = select(ArchivedAnalysis).where(
+        *_filters(ArchivedAnalysis, user_id, start, end, analysis_types)
+    ).order_by(ArchivedAnalysis.archive_path, ArchivedAnalysis.frame_offset, ArchivedAnalysis.frame_line)
+
+    # Consecutive rows share frames, so each frame is read and decompressed once
+    frame_key = None
+    frame_lines: List[str] = []
+    for (entry,) in db.execute(archived.execution_options(yield_per=EXPORT_FETCH_ROWS)):
+        key = (entry.archive_path, entry.frame_offset)
+        if key != frame_key:
+            frame_lines = read_frame_lines(entry.archive_path, entry.frame_offset, entry.frame_length)
+            frame_key = key
+        yield {
+            "id": entry.id,
+            "user_id": entry.user_id,
+            "analysis_type": entry.analysis_type,
+            "filename": entry.filename,
+            "created_at": entry.created_at,
+            "archived": True,
+            "result": json.loads(frame_lines[entry.frame_line])["result"]
+        }
+
+def _chunked(pieces: Iterator[bytes]) -> Iterator[bytes]:
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def stream_ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    return _chunked(
+        (json.dumps({**row, "created_at": _iso(row["created_at"])}, default=str) + "\n").encode()
+        for row in rows
+    )
+
+def stream_csv(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    def lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for row in rows:
+            result = row["result"] if isinstance(row["result"], dict) else {}
+            writer.writerow([
+                row["id"], row["user_id"], row["analysis_type"], row["filename"], _iso(row["created_at"]),
+                row["archived"], result.get("success"), result.get("predicted_label"), result.get("confidence"),
+                result.get("is_forged"), result.get("is_deepfake"), result.get("risk_level"),
+                json.dumps(row["result"], default=str)
+            ])
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    return _chunked(lines())
+
+class _ChunkSink:
+    """Write-only file object for ParquetWriter whose bytes are taken out as they are written"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_parquet(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("analysis_type", pa.string()),
+        ("filename", pa.string()), ("created_at", pa.timestamp("us")), ("archived", pa.bool_()),
+        ("result", pa.string())
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    columns: Dict[str, list] = {name: [] for name in schema.names}
+
+    def write_row_group():
+        writer.write_table(pa.table(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    for row in rows:
+        for name in ("id", "user_id", "analysis_type", "filename", "created_at", "archived"):
+            columns[name].append(row[name])
+        columns["result"].append(json.dumps(row["result"], default=str))
+        if len(columns["id"]) >= PARQUET_ROW_GROUP:
+            write_row_group()
+            yield sink.drain()
+    if columns["id"]:
+        write_row_group()
+    writer.close()
+    yield sink.drain()
+
+def stream_export(export_format: str, rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    if export_format == "ndjson":
+        return stream_ndjson(rows)
+    if export_format == "csv":
+        return stream_csv(rows)
+    if export_format == "parquet":
+        return stream_parquet(rows)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    from database import SessionLocal
+
+    # Usage: python export.py --format csv --output all.csv [--user-id N] [--start 2024-01-01] [--end ...] [--type deepfake]
+    parser = argparse.ArgumentParser(description="Export analysis history of one or all users")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--output", default="-", help="File to write, or - for stdout")
+    parser.add_argument("--user-id", type=int, default=None, help="Only this user (default: everyone)")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--type", action="append", dest="analysis_types", help="Analysis type; repeat for several")
+    parser.add_argument("--live-only", action="store_true", help="Leave out archived analyses")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    started = time.perf_counter()
+    written = 0
+    try:
+        rows = iter_export_rows(db, args.user_id, args.start, args.end, args.analysis_types, not args.live_only)
+        for chunk in stream_export(args.format, rows):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        db.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"✅ Exported {written / 1024 / 1024:.1f} MB in {time.perf_counter() - started:.1f}s", file=sys.stderr)
@@ -0,0 +1,125 @@
+import os
+import math
+import threading
+from typing import List, Tuple
+
+import numpy as np
+import cv2
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FACE_DETECTION_ENABLED = os.getenv("FACE_DETECTION_ENABLED", "true").lower() == "true"
+FACE_MAX_COUNT = int(os.getenv("FACE_MAX_COUNT", "8"))
+FACE_MIN_SIZE = int(os.getenv("FACE_MIN_SIZE", "40"))
+FACE_MARGIN = float(os.getenv("FACE_MARGIN", "0.25"))
+FACE_DETECT_MAX_SIDE = int(os.getenv("FACE_DETECT_MAX_SIDE", "1024"))
+
+# Tilt beyond this is more likely a bad eye detection than a tilted head
+MAX_ALIGN_ANGLE = 30.0
+
+Box = Tuple[int, int, int, int]
+
+# cv2.CascadeClassifier is not thread-safe, so every executor thread gets its own pair
+_local = threading.local()
+
+def _get_cascades():
+    if not hasattr(_local, "face"):
+        _local.face = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        )
+        _local.eye = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, "haarcascade_eye.xml")
+        )
+    return _local.face, _local.eye
+
+def to_gray(image_np: np.ndarray) -> np.ndarray:
+    """Grayscale plane of an RGB or already-gray array"""
+    return cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY) if image_np.ndim == 3 else image_np
+
+def detect_faces(
+    gray: np.ndarray,
+    max_faces: int = FACE_MAX_COUNT,
+    min_size: int = FACE_MIN_SIZE
+) -> List[Box]:
+    """Detect faces on a downscaled copy and return (x, y, w, h) boxes in full-resolution pixels.
+
+    Boxes are ordered largest first and capped at max_faces so crowd photos stay bounded.
+    """
+    face_cascade, _ = _get_cascades()
+    height, width = gray.shape[:2]
+    scale = min(1.0, FACE_DETECT_MAX_SIDE / float(max(height, width)))
+    small = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    small = cv2.equalizeHist(small)
+
+    scaled_min = max(12, int(round(min_size * scale)))
+    detections = face_cascade.detectMultiScale(
+        small, scaleFactor=1.1, minNeighbors=5, minSize=(scaled_min, scaled_min)
+    )
+    if len(detections) == 0:
+        return []
+
+    boxes = [
+        (int(x / scale), int(y / scale), int(w / scale), int(h / scale))
+        for (x, y, w, h) in detections
+    ]
+    boxes = [box for box in boxes if min(box[2], box[3]) >= min_size]
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    return boxes[:max_faces]
+
+def _eye_angle(gray: np.ndarray, box: Box) -> float:
+    """Roll angle in degrees from the two most prominent eyes, 0 when they cannot be found"""
+    _, eye_cascade = _get_cascades()
+    x, y, w, h = box
+    roi = gray[y:y + h // 2, x:x + w]
+    min_eye = max(8, w // 8)
+    eyes = eye_cascade.detectMultiScale(roi, scaleFactor=1.1, minNeighbors=5, minSize=(min_eye, min_eye))
+    if len(eyes) < 2:
+        return 0.0
+
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    eyes = sorted(eyes, key=lambda e: e[0])
+    (lx, ly, lw, lh), (rx, ry, rw, rh) = eyes
+    dx = (rx + rw / 2.0) - (lx + lw / 2.0)
+    dy = (ry + rh / 2.0) - (ly + lh / 2.0)
+    if dx <= 0:
+        return 0.0
+    angle = math.degrees(math.atan2(dy, dx))
+    return angle if abs(angle) <= MAX_ALIGN_ANGLE else 0.0
+
+def crop_aligned_face(
+    image_np: np.ndarray,
+    gray: np.ndarray,
+    box: Box,
+    margin: float = FACE_MARGIN
+) -> Image.Image:
+    """Cut a square patch around the face, rotated so the eyes are level.
+
+    Rotation and cropping happen in a single warpAffine that only renders the output patch.
+    """
+    x, y, w, h = box
+    angle = _eye_angle(gray, box)
+    cx, cy = x + w / 2.0, y + h / 2.0
+    side = int(max(w, h) * (1.0 + 2.0 * margin))
+
+    matrix = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    matrix[0, 2] += side / 2.0 - cx
+    matrix[1, 2] += side / 2.0 - cy
+    patch = cv2.warpAffine(
+        image_np, matrix, (side, side),
+        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT
+    )
+    return Image.fromarray(patch)
+
+def extract_faces(
+    image_np: np.ndarray,
+    max_faces: int = FACE_MAX_COUNT,
+    min_size: int = FACE_MIN_SIZE
+) -> List[Tuple[Box, Image.Image]]:
+    """Detect, crop and align every face in an RGB array"""
+    gray = to_gray(image_np)
+    return [
+        (box, crop_aligned_face(image_np, gray, box))
+        for box in detect_faces(gray, max_faces=max_faces, min_size=min_size)
+    ]
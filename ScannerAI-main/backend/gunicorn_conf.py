@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for the preload-then-fork serving mode.
+
+    gunicorn -c gunicorn_conf.py main:app
+
+The master imports main, and with it both ViT models, exactly once. Workers are forked
+afterwards and share the weight pages copy-on-write. Each worker logs its resident vs
+shared memory shortly after it starts (MEMORY_REPORT_DELAY seconds, 0 to disable).
+"""
+
+import os
+import threading
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+MEMORY_REPORT_DELAY = float(os.getenv("MEMORY_REPORT_DELAY", "10"))
+
+def when_ready(server):
+    from model_sharing import prepare_for_fork
+    prepare_for_fork()
+
+def post_fork(server, worker):
+    from model_sharing import configure_worker_threads
+    threads = configure_worker_threads(workers)
+    server.log.info(f"Worker {worker.pid}: torch using {threads} threads")
+
+def post_worker_init(worker):
+    if MEMORY_REPORT_DELAY <= 0:
+        return
+
+    def report():
+        from model_sharing import memory_usage
+        usage = memory_usage(worker.pid)
+        worker.log.info(
+            f"Worker {worker.pid} memory: rss {usage['rss'] / 1024:.0f} MB, "
+            f"shared {usage['shared'] / 1024:.0f} MB, private {usage['private'] / 1024:.0f} MB, "
+            f"pss {usage['pss'] / 1024:.0f} MB"
+        )
+
+    timer = threading.Timer(MEMORY_REPORT_DELAY, report)
+    timer.daemon = True
+    timer.start()
@@ -0,0 +1,72 @@
+"""
+Explainability heatmaps for the ViT models.
+
+Attention rollout (Abnar & Zuidema, 2020) multiplies the head-averaged attention of every
+layer, with the residual connection mixed in as an identity, to see how much each input
+patch flows into the CLS token that the classifier reads. It needs nothing but the
+attentions of the same forward pass that produced the prediction.
+
+The patch grid is rendered as a small RGBA PNG at the image's aspect ratio: colormapped
+heat whose opacity rises with it, meant to be laid over the original in the browser. The
+rendering needs only Pillow and NumPy, so API workers that leave inference to a separate
+server (INFERENCE_SERVER_ADDRESS) never load OpenCV.
+"""
+
+import io
+import math
+import os
+from typing import Sequence
+
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Longest side of the rendered overlay. The map has one value per 16x16 patch, so 8 pixels
+# per patch is plenty; the browser's bilinear upscaling keeps it smooth over the image
+HEATMAP_MAX_SIDE = int(os.getenv("HEATMAP_MAX_SIDE", "112"))
+# Opacity of the hottest patch
+HEATMAP_MAX_ALPHA = float(os.getenv("HEATMAP_MAX_ALPHA", "0.7"))
+# Fraction of the weakest attention links dropped in every layer, which sharpens the map
+HEATMAP_DISCARD_RATIO = float(os.getenv("HEATMAP_DISCARD_RATIO", "0.9"))
+
+def attention_rollout(attentions: Sequence[np.ndarray], discard_ratio: float = HEATMAP_DISCARD_RATIO) -> np.ndarray:
+    """Square patch-grid map in [0, 1] from per-layer (heads, tokens, tokens) attention of one image"""
+    tokens = attentions[0].shape[-1]
+    identity = np.eye(tokens)
+    rollout = identity
+    for layer in attentions:
+        fused = np.asarray(layer, dtype=np.float64).mean(axis=0)
+        if discard_ratio > 0:
+            # Drop the weakest links, but never the CLS token's own column
+            threshold = np.quantile(fused[:, 1:], discard_ratio, axis=1, keepdims=True)
+            weak = fused < threshold
+            weak[:, 0] = False
+            fused = np.where(weak, 0.0, fused)
+        fused = 0.5 * fused + 0.5 * identity
+        fused /= fused.sum(axis=-1, keepdims=True)
+        rollout = fused @ rollout
+
+    # CLS row over the patch tokens (any extra leading tokens are skipped)
+    side = math.isqrt(tokens - 1)
+    patches = rollout[0, tokens - side * side:]
+    grid = patches.reshape(side, side)
+    span = grid.max() - grid.min()
+    return (grid - grid.min()) / span if span > 0 else np.zeros_like(grid)
+
+def _jet(heat: np.ndarray) -> np.ndarray:
+    """RGB jet colormap (blue through green to red) of values in [0, 1]"""
+    channels = [np.clip(1.5 - np.abs(4.0 * heat - offset), 0.0, 1.0) for offset in (3.0, 2.0, 1.0)]
+    return (np.dstack(channels) * 255).astype(np.uint8)
+
+def render_overlay(grid: np.ndarray, width: int, height: int, max_side: int = HEATMAP_MAX_SIDE) -> bytes:
+    """RGBA PNG of grid stretched to the image's aspect ratio"""
+    scale = min(1.0, max_side / float(max(width, height)))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    heat = Image.fromarray(np.asarray(grid, dtype=np.float32), mode="F").resize(size, Image.BICUBIC)
+    heat = np.asarray(heat).clip(0.0, 1.0)
+    rgba = np.dstack([_jet(heat), (heat * HEATMAP_MAX_ALPHA * 255).astype(np.uint8)])
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, "PNG", compress_level=6)
+    return buffer.getvalue()
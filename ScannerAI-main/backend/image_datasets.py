@@ -0,0 +1,52 @@
+import os
+from typing import Iterator, Optional, Sequence, Tuple
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+
+# Folder names that mark the positive (manipulated) and negative (authentic) class
+POSITIVE_LABELS = {"fake", "fakes", "deepfake", "deepfakes", "forged", "tampered", "manipulated", "synthetic", "generated"}
+NEGATIVE_LABELS = {"real", "reals", "authentic", "original", "pristine", "genuine"}
+
+def iter_image_files(root: str, after: Optional[Sequence[str]] = None) -> Iterator[str]:
+    """Walk a directory tree lazily and yield image paths in a stable, sorted order
+
+    after is the relative path of an image, split into its components: only images that come
+    later in the walk are yielded, and directories wholly before it are not even listed.
+    """
+    try:
+        with os.scandir(root) as scanner:
+            entries = sorted(scanner, key=lambda entry: entry.name)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return
+
+    for entry in entries:
+        if after:
+            if entry.name < after[0]:
+                continue
+            if entry.name == after[0]:
+                if len(after) > 1 and entry.is_dir(follow_symlinks=False):
+                    yield from iter_image_files(entry.path, after[1:])
+                continue
+            # Past the resume point, so the rest of this directory is all new
+            after = None
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_image_files(entry.path)
+        elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+            yield entry.path
+
+def iter_labeled_images(root: str) -> Iterator[Tuple[str, str]]:
+    """Yield (path, label) for a dataset laid out as root/<label>/.../<image>"""
+    for path in iter_image_files(root):
+        relative = os.path.relpath(path, root)
+        parts = relative.split(os.sep)
+        if len(parts) > 1:
+            yield path, parts[0]
+
+def is_positive_label(label: str) -> Optional[bool]:
+    """True for manipulated classes, False for authentic ones, None for anything else"""
+    label = label.lower()
+    if label in POSITIVE_LABELS:
+        return True
+    if label in NEGATIVE_LABELS:
+        return False
+    return None
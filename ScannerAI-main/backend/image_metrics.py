@@ -0,0 +1,167 @@
+"""
+Basic image metrics as a small dependency graph.
+
+Every node names the nodes it is computed from: the header, the decoded pixels, the
+grayscale plane, and the metrics on top of them. An analyzer asks only for the metrics it
+reads; MetricContext computes each node at most once, skips everything nothing asked
+for, and records how long each node took. Metrics nobody reads by default (the color
+histograms) are served on demand by /analysis/metrics.
+"""
+
+import io
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from spectral_analysis import analyze_gray
+
+# Metrics a caller can ask for, in the order they appear in the result
+METRICS = ("image_properties", "mean_color", "std_color", "edge_density", "sharpness", "histogram", "gan_spectrum")
+
+# What each analyzer reads
+HEURISTIC_METRICS = ("image_properties", "mean_color", "std_color", "edge_density", "sharpness")
+# Shown next to the classification result in the frontend
+DISPLAY_METRICS = ("image_properties", "edge_density", "sharpness")
+PROPERTIES_ONLY = ("image_properties",)
+
+COLOR_ANALYSIS_METRICS = ("mean_color", "std_color", "edge_density", "sharpness")
+GRAY_MODES = ("L", "1", "I", "I;16", "F")
+
+class _Node:
+    __slots__ = ("name", "requires", "compute")
+
+    def __init__(self, name: str, requires: Tuple[str, ...], compute: Callable):
+        self.name = name
+        self.requires = requires
+        self.compute = compute
+
+NODES: Dict[str, _Node] = {}
+
+def node(name: str, *requires: str):
+    """Register a graph node computed from the values of `requires`"""
+    def register(compute: Callable) -> Callable:
+        NODES[name] = _Node(name, requires, compute)
+        return compute
+    return register
+
+class MetricContext:
+    """Lazily evaluated metric graph for one image"""
+
+    def __init__(self, image_content: bytes, max_side: Optional[int] = None):
+        self.image_content = image_content
+        self.max_side = max_side
+        self.values: Dict[str, Any] = {}
+        self.timings_ms: Dict[str, float] = {}
+
+    def get(self, name: str) -> Any:
+        if name not in self.values:
+            current = NODES[name]
+            inputs = [self.get(dependency) for dependency in current.requires]
+            started = time.perf_counter()
+            self.values[name] = current.compute(self, *inputs)
+            self.timings_ms[name] = round((time.perf_counter() - started) * 1000, 3)
+        return self.values[name]
+
+@node("header")
+def _header(context: MetricContext) -> Dict[str, Any]:
+    # Image.open only parses the header; pixels are decoded by the "pixels" node
+    image = Image.open(io.BytesIO(context.image_content))
+    return {"image": image, "width": image.width, "height": image.height, "format": image.format, "mode": image.mode}
+
+@node("pixels", "header")
+def _pixels(context: MetricContext, header: Dict[str, Any]) -> np.ndarray:
+    image = header["image"]
+    # Reduced decode for the cascade fast stage (JPEGs are scaled during decoding)
+    if context.max_side:
+        image.draft("RGB", (context.max_side, context.max_side))
+        image.thumbnail((context.max_side, context.max_side))
+    if image.mode != "L":
+        image = image.convert("L" if image.mode in GRAY_MODES else "RGB")
+    pixels = np.asarray(image)
+    # OpenCV channel order, as the thresholds were tuned on
+    return cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR) if pixels.ndim == 3 else pixels
+
+@node("gray", "pixels")
+def _gray(context: MetricContext, pixels: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(pixels, cv2.COLOR_BGR2GRAY) if pixels.ndim == 3 else pixels
+
+@node("color_stats", "pixels")
+def _color_stats(context: MetricContext, pixels: np.ndarray) -> Tuple[List[float], List[float]]:
+    mean, std = cv2.meanStdDev(pixels)
+    return mean.flatten().tolist(), std.flatten().tolist()
+
+@node("image_properties", "header")
+def _image_properties(context: MetricContext, header: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "width": int(header["width"]),
+        "height": int(header["height"]),
+        "channels": 1 if header["mode"] in GRAY_MODES else 3,
+        "format": header["format"],
+        "mode": header["mode"]
+    }
+
+@node("mean_color", "color_stats")
+def _mean_color(context: MetricContext, color_stats) -> List[float]:
+    return color_stats[0]
+
+@node("std_color", "color_stats")
+def _std_color(context: MetricContext, color_stats) -> List[float]:
+    return color_stats[1]
+
+@node("edge_density", "gray")
+def _edge_density(context: MetricContext, gray: np.ndarray) -> float:
+    edges = cv2.Canny(gray, 50, 150)
+    return cv2.countNonZero(edges) / edges.size
+
+@node("sharpness", "gray")
+def _sharpness(context: MetricContext, gray: np.ndarray) -> float:
+    # Variance of the Laplacian; 8-bit input fits int16 exactly, so no float64 plane is needed
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return float(std[0, 0] ** 2)
+
+@node("histogram", "pixels")
+def _histogram(context: MetricContext, pixels: np.ndarray) -> Dict[str, Optional[List[float]]]:
+    if pixels.ndim != 3:
+        return {"blue": None, "green": None, "red": None}
+    return {
+        name: cv2.calcHist([pixels], [channel], None, [256], [0, 256]).flatten().tolist()
+        for channel, name in enumerate(("blue", "green", "red"))
+    }
+
+@node("gan_spectrum")
+def _gan_spectrum(context: MetricContext) -> Dict[str, Any]:
+    # Resampling wipes out upsampling artifacts, so a reduced decode is not good enough
+    if context.max_side:
+        return analyze_gray(MetricContext(context.image_content).get("gray"))
+    return analyze_gray(context.get("gray"))
+
+def compute_metrics(
+    image_content: bytes, metrics: Iterable[str] = METRICS, max_side: Optional[int] = None
+) -> Dict[str, Any]:
+    """Requested metrics in the basic_analysis layout, with per-node timings"""
+    requested = [name for name in METRICS if name in set(metrics)]
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+    context = MetricContext(image_content, max_side)
+    values = {name: context.get(name) for name in requested}
+
+    result: Dict[str, Any] = {}
+    if "image_properties" in values:
+        properties = dict(values["image_properties"])
+        if max_side and "pixels" in context.values:
+            properties["analysis_scale"] = float(context.values["pixels"].shape[1]) / properties["width"]
+        result["image_properties"] = properties
+    color_analysis = {name: values[name] for name in COLOR_ANALYSIS_METRICS if name in values}
+    if color_analysis:
+        result["color_analysis"] = color_analysis
+    if "histogram" in values:
+        result["histogram"] = values["histogram"]
+    if "gan_spectrum" in values:
+        result["spectral_analysis"] = values["gan_spectrum"]
+    result["metric_timings_ms"] = context.timings_ms
+    return result
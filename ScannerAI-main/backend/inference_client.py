@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import os
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+from inference_protocol import (
+    ANALYSIS_OPCODES, OP_PING, OP_DEEPFAKE_VIDEO, OP_VIDEO_CHUNK, OP_ERROR, FLAG_END, FLAG_ABORT,
+    VIDEO_CHUNK_BYTES, dumps, loads, encode_frame, encode_request, read_frame, open_connection
+)
+
+class RemoteImageAnalysisService:
+    """Drop-in replacement for ImageAnalysisService that forwards work to inference_server.py.
+
+    Keeps one multiplexed connection per API worker and never imports torch or the models.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self._writer = None
+        self._pending: Dict[int, asyncio.Queue] = {}
+        self._request_ids = itertools.count(1)
+        self._connect_lock = None
+        self._write_lock = None
+        self._model_versions = None
+
+    async def _ensure_connection(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            reader, self._writer = await open_connection(self.address)
+            asyncio.ensure_future(self._read_responses(reader, self._writer))
+
+    async def _read_responses(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Route every response frame to the queue of the request that is waiting for it"""
+        try:
+            while True:
+                opcode, flags, request_id, payload = await read_frame(reader)
+                queue = self._pending.get(request_id)
+                if queue is not None:
+                    queue.put_nowait((opcode, flags, payload))
+        except Exception:
+            pass
+        finally:
+            if self._writer is writer:
+                self._writer = None
+                # The server may come back with different models
+                self._model_versions = None
+            writer.close()
+            lost = dumps({"error": "Lost connection to inference server"})
+            for queue in self._pending.values():
+                queue.put_nowait((OP_ERROR, FLAG_END, lost))
+
+    async def _send(self, opcode: int, options: Dict[str, Any], content: bytes) -> Tuple[int, asyncio.Queue]:
+        await self._ensure_connection()
+        request_id = next(self._request_ids) & 0xFFFFFFFF
+        queue = asyncio.Queue()
+        self._pending[request_id] = queue
+        try:
+            async with self._write_lock:
+                self._writer.write(encode_request(opcode, request_id, options, content))
+                await self._writer.drain()
+        except Exception:
+            self._pending.pop(request_id, None)
+            raise
+        return request_id, queue
+
+    async def _send_file(self, request_id: int, path: str):
+        """Send a file as OP_VIDEO_CHUNK frames, so neither side holds more than one chunk of it"""
+        loop = asyncio.get_event_loop()
+        sent = False
+        try:
+            with open(path, "rb") as upload:
+                while not sent:
+                    chunk = await loop.run_in_executor(None, upload.read, VIDEO_CHUNK_BYTES)
+                    sent = len(chunk) < VIDEO_CHUNK_BYTES
+                    # The lock is taken per chunk, so other requests keep flowing during a long upload
+                    async with self._write_lock:
+                        self._writer.write(encode_frame(OP_VIDEO_CHUNK, request_id, chunk, FLAG_END if sent else 0))
+                        await self._writer.drain()
+        finally:
+            if not sent and self._writer is not None and not self._writer.is_closing():
+                self._writer.write(encode_frame(OP_VIDEO_CHUNK, request_id, b"", FLAG_ABORT))
+
+    async def _call(self, opcode: int, options: Dict[str, Any], content: bytes = b"") -> Dict[str, Any]:
+        request_id, queue = await self._send(opcode, options, content)
+        try:
+            response_opcode, _, payload = await queue.get()
+        finally:
+            self._pending.pop(request_id, None)
+        result = loads(payload)
+        if response_opcode == OP_ERROR:
+            raise RuntimeError(result.get("error", "Inference server error"))
+        return result
+
+    async def _analyze(self, analysis_type: str, image_content: bytes, **options) -> Dict[str, Any]:
+        try:
+            return await self._call(ANALYSIS_OPCODES[analysis_type], options, image_content)
+        except Exception as e:
+            return {
+                "error": str(e),
+                "success": False,
+                "analysis_type": analysis_type
+            }
+
+    async def ping(self) -> Dict[str, Any]:
+        """Check that the inference server is reachable"""
+        return await self._call(OP_PING, {})
+
+    async def model_version(self, analysis_type: str) -> str:
+        """Model version the inference server reports for analysis_type"""
+        if self._model_versions is None:
+            self._model_versions = (await self.ping())["model_versions"]
+        return self._model_versions[analysis_type]
+
+    async def analyze_classification(self, image_content: bytes, high_res: bool = False) -> Dict[str, Any]:
+        """Analyze image for classification"""
+        return await self._analyze("classification", image_content, high_res=high_res)
+
+    async def analyze_forgery(self, image_content: bytes, cascade: bool = False) -> Dict[str, Any]:
+        """Analyze image for forgery detection"""
+        return await self._analyze("forgery", image_content, cascade=cascade)
+
+    async def analyze_deepfake(self, image_content: bytes, cascade: bool = False, high_res: bool = False) -> Dict[str, Any]:
+        """Analyze image for deepfake detection"""
+        return await self._analyze("deepfake", image_content, cascade=cascade, high_res=high_res)
+
+    async def analyze_metrics(self, image_content: bytes, metrics: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Basic metrics on demand, such as the histograms the analyses leave out"""
+        return await self._analyze("metrics", image_content, metrics=metrics)
+
+    async def analyze_heatmap(self, image_content: bytes, model: str = "deepfake") -> Dict[str, Any]:
+        """Attention rollout of the classification or deepfake ViT for one image"""
+        return await self._analyze("heatmap", image_content, model=model)
+
+    async def analyze_deepfake_video(self, video_path: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream per-segment deepfake results for a local video file, ending with a summary"""
+        request_id = None
+        try:
+            request_id, queue = await self._send(OP_DEEPFAKE_VIDEO, {"suffix": os.path.splitext(video_path)[1]}, b"")
+            await self._send_file(request_id, video_path)
+            while True:
+                opcode, flags, payload = await queue.get()
+                if opcode == OP_ERROR:
+                    raise RuntimeError(loads(payload).get("error", "Inference server error"))
+                if payload:
+                    yield loads(payload)
+                if flags & FLAG_END:
+                    break
+        except Exception as e:
+            yield {
+                "type": "error",
+                "error": str(e),
+                "success": False,
+                "analysis_type": "deepfake_video"
+            }
+        finally:
+            if request_id is not None:
+                self._pending.pop(request_id, None)
@@ -0,0 +1,111 @@
+"""
+Wire format shared by inference_server.py and inference_client.py.
+
+Every message is a 16-byte header followed by a payload:
+
+    magic (4s) | version (B) | opcode (B) | flags (H) | request id (I) | payload length (I)
+
+Requests carry a length-prefixed JSON options block followed by the raw file bytes, so
+images travel unencoded. Responses carry a JSON result. A connection multiplexes many
+requests; responses are matched to requests by request id.
+
+Videos are too large for one frame: the OP_DEEPFAKE_VIDEO request carries only the
+options and the file follows in OP_VIDEO_CHUNK frames of at most VIDEO_CHUNK_BYTES with
+the same request id, the last one flagged FLAG_END (or FLAG_ABORT if the sender gave up).
+"""
+
+import asyncio
+import json
+import struct
+from typing import Any, Dict, Tuple
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+MAGIC = b"CLRI"
+VERSION = 1
+HEADER = struct.Struct("!4sBBHII")
+OPTIONS_LENGTH = struct.Struct("!H")
+MAX_PAYLOAD = 1 << 31
+
+# Request opcodes
+OP_PING = 0x01
+OP_CLASSIFICATION = 0x02
+OP_FORGERY = 0x03
+OP_DEEPFAKE = 0x04
+OP_DEEPFAKE_VIDEO = 0x05
+OP_METRICS = 0x06
+OP_HEATMAP = 0x07
+OP_VIDEO_CHUNK = 0x08
+
+# Response opcodes
+OP_RESULT = 0x81
+OP_STREAM_ITEM = 0x82
+OP_ERROR = 0x83
+
+# Flags: the last frame of a response or of a chunked upload, and an upload given up on
+FLAG_END = 0x0001
+FLAG_ABORT = 0x0002
+
+VIDEO_CHUNK_BYTES = 1 << 20
+
+ANALYSIS_OPCODES = {
+    "classification": OP_CLASSIFICATION,
+    "forgery": OP_FORGERY,
+    "deepfake": OP_DEEPFAKE,
+    "metrics": OP_METRICS,
+    "heatmap": OP_HEATMAP,
+}
+
+class ProtocolError(Exception):
+    pass
+
+def dumps(value: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY, default=str)
+    return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+def encode_frame(opcode: int, request_id: int, payload: bytes = b"", flags: int = 0) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, opcode, flags, request_id, len(payload)) + payload
+
+def encode_request(opcode: int, request_id: int, options: Dict[str, Any], content: bytes = b"") -> bytes:
+    encoded_options = dumps(options)
+    return encode_frame(opcode, request_id, OPTIONS_LENGTH.pack(len(encoded_options)) + encoded_options + content)
+
+def decode_request_payload(payload: bytes) -> Tuple[Dict[str, Any], bytes]:
+    (options_length,) = OPTIONS_LENGTH.unpack_from(payload)
+    start = OPTIONS_LENGTH.size
+    options = loads(payload[start:start + options_length]) if options_length else {}
+    return options, payload[start + options_length:]
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, int, bytes]:
+    """Read one message and return (opcode, flags, request id, payload)"""
+    header = await reader.readexactly(HEADER.size)
+    magic, version, opcode, flags, request_id, length = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError("Unexpected inference protocol header")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError("Inference payload too large")
+    payload = await reader.readexactly(length) if length else b""
+    return opcode, flags, request_id, payload
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """"unix:/path/to.sock" -> ("unix", path); "tcp://host:port" or "host:port" -> ("tcp", (host, port))"""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+async def open_connection(address: str):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target)
+    return await asyncio.open_connection(*target)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Standalone inference server that owns the AI models.
+
+Usage:
+    python inference_server.py [--address unix:/tmp/clario-inference.sock]
+
+API workers started with INFERENCE_SERVER_ADDRESS set talk to this process through
+inference_client.RemoteImageAnalysisService instead of loading torch and the models
+themselves, so both tiers can be scaled and restarted independently.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+from inference_protocol import (
+    ANALYSIS_OPCODES, OP_PING, OP_DEEPFAKE_VIDEO, OP_VIDEO_CHUNK, OP_RESULT, OP_STREAM_ITEM, OP_ERROR,
+    FLAG_END, FLAG_ABORT, MAX_PAYLOAD, ProtocolError, dumps, encode_frame, decode_request_payload,
+    read_frame, parse_address
+)
+from ai_services_fixed import ImageAnalysisService, MODELS_AVAILABLE
+
+load_dotenv()
+
+DEFAULT_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "unix:/tmp/clario-inference.sock")
+
+ANALYSIS_METHODS = {opcode: f"analyze_{name}" for name, opcode in ANALYSIS_OPCODES.items()}
+
+class InferenceServer:
+    def __init__(self, service: ImageAnalysisService):
+        self.service = service
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one client connection; requests on it are processed concurrently"""
+        loop = asyncio.get_event_loop()
+        write_lock = asyncio.Lock()
+        tasks = set()
+        # Videos still arriving in chunks: request id -> (spool file, bytes so far)
+        uploads = {}
+
+        async def send(opcode: int, request_id: int, payload: bytes, flags: int = 0):
+            async with write_lock:
+                writer.write(encode_frame(opcode, request_id, payload, flags))
+                await writer.drain()
+
+        def start(coroutine):
+            task = asyncio.ensure_future(coroutine)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        try:
+            while True:
+                opcode, flags, request_id, payload = await read_frame(reader)
+                if opcode == OP_DEEPFAKE_VIDEO:
+                    # The video decoder needs a file, so the chunks are spooled to disk as they come
+                    options, _ = decode_request_payload(payload)
+                    spool = tempfile.NamedTemporaryFile(delete=False, suffix=options.get("suffix", ""))
+                    uploads[request_id] = (spool, 0)
+                elif opcode == OP_VIDEO_CHUNK:
+                    if request_id not in uploads:
+                        continue
+                    spool, received = uploads[request_id]
+                    received += len(payload)
+                    if flags & FLAG_ABORT or received > MAX_PAYLOAD:
+                        del uploads[request_id]
+                        spool.close()
+                        os.unlink(spool.name)
+                        if not flags & FLAG_ABORT:
+                            await send(OP_ERROR, request_id, dumps({"error": "Video too large"}), FLAG_END)
+                        continue
+                    await loop.run_in_executor(None, spool.write, payload)
+                    uploads[request_id] = (spool, received)
+                    if flags & FLAG_END:
+                        del uploads[request_id]
+                        spool.close()
+                        start(self.stream_video(request_id, spool.name, send))
+                else:
+                    start(self.handle_request(opcode, request_id, payload, send))
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        except ProtocolError as e:
+            print(f"Inference protocol error: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            for spool, _ in uploads.values():
+                spool.close()
+                os.unlink(spool.name)
+            writer.close()
+
+    async def handle_request(self, opcode: int, request_id: int, payload: bytes, send):
+        try:
+            options, content = decode_request_payload(payload)
+
+            if opcode == OP_PING:
+                model_versions = {
+                    name: await self.service.model_version(name) for name in ANALYSIS_OPCODES
+                }
+                await send(OP_RESULT, request_id, dumps({
+                    "status": "ok", "models_available": MODELS_AVAILABLE, "model_versions": model_versions
+                }), FLAG_END)
+            elif opcode in ANALYSIS_METHODS:
+                analyze = getattr(self.service, ANALYSIS_METHODS[opcode])
+                result = await analyze(content, **options)
+                await send(OP_RESULT, request_id, dumps(result), FLAG_END)
+            else:
+                await send(OP_ERROR, request_id, dumps({"error": f"Unknown opcode {opcode}"}), FLAG_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await send(OP_ERROR, request_id, dumps({"error": str(e)}), FLAG_END)
+
+    async def stream_video(self, request_id: int, video_path: str, send):
+        """Stream per-segment results for a fully received video, then remove its spool file"""
+        try:
+            async for record in self.service.analyze_deepfake_video(video_path):
+                await send(OP_STREAM_ITEM, request_id, dumps(record))
+            await send(OP_STREAM_ITEM, request_id, b"", FLAG_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await send(OP_ERROR, request_id, dumps({"error": str(e)}), FLAG_END)
+        finally:
+            os.unlink(video_path)
+
+async def serve(address: str):
+    server = InferenceServer(ImageAnalysisService())
+    kind, target = parse_address(address)
+    if kind == "unix":
+        if os.path.exists(target):
+            os.unlink(target)
+        listener = await asyncio.start_unix_server(server.handle_connection, path=target)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, *target)
+
+    print(f"✅ Inference server listening on {address} (models available: {MODELS_AVAILABLE})")
+    async with listener:
+        await listener.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clario inference server")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="unix:/path.sock or tcp://127.0.0.1:8765")
+    args = parser.parse_args()
+    asyncio.run(serve(args.address))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Load test for the tiered admission scheduler: subscriber latency under a free-tier flood.
+
+Usage:
+    python load_test_priority.py [--workers 2] [--service-ms 50] [--duration 10]
+                                 [--subscriber-rps 10] [--free-rps 200]
+
+Runs the same steady subscriber stream three times through admission.AnalysisScheduler:
+alone, next to a free-tier flood with tier weights, and next to the flood with every
+request in one tier (plain first-come first-served). Work is a sleep on a thread pool
+of --workers threads, standing in for a model call of --service-ms.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import random
+import time
+from typing import Dict, List
+
+from admission import (
+    AnalysisScheduler, AdmissionRejected, TIER_SUBSCRIBER, TIER_FREE,
+    parse_tier_weights, percentile, ANALYSIS_TIER_WEIGHTS
+)
+
+async def drive(scheduler, executor, tier: str, label: str, rps: float, duration: float,
+                service: float, deadline: float, latencies: Dict[str, List[float]], rejected: Dict[str, int]):
+    """Poisson arrivals at `rps` for `duration` seconds, recording end-to-end latency under `label`"""
+    loop = asyncio.get_event_loop()
+    requests = []
+
+    async def one():
+        start = time.perf_counter()
+        try:
+            await scheduler.run(
+                "deepfake", lambda: loop.run_in_executor(executor, time.sleep, service),
+                deadline=deadline, tier=tier
+            )
+            latencies[label].append(time.perf_counter() - start)
+        except AdmissionRejected:
+            rejected[label] += 1
+
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        requests.append(asyncio.ensure_future(one()))
+        await asyncio.sleep(random.expovariate(rps))
+    await asyncio.gather(*requests)
+
+async def run_phase(name: str, args, flood: bool, weights: Dict[str, float], one_tier: bool):
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+    scheduler = AnalysisScheduler(workers=args.workers, queue_depth=args.queue_depth, tier_weights=weights)
+    latencies = {"subscriber": [], "free": []}
+    rejected = {"subscriber": 0, "free": 0}
+    service = args.service_ms / 1000
+
+    drivers = [drive(
+        scheduler, executor, TIER_FREE if one_tier else TIER_SUBSCRIBER, "subscriber",
+        args.subscriber_rps, args.duration, service, args.deadline, latencies, rejected
+    )]
+    if flood:
+        drivers.append(drive(
+            scheduler, executor, TIER_FREE, "free",
+            args.free_rps, args.duration, service, args.deadline, latencies, rejected
+        ))
+    await asyncio.gather(*drivers)
+    executor.shutdown()
+
+    print(f"\n{name}")
+    for label in ("subscriber", "free"):
+        samples = latencies[label]
+        if samples or rejected[label]:
+            print(
+                f"  {label:<11} served {len(samples):>5}  rejected {rejected[label]:>5}  "
+                f"p50 {percentile(samples, 0.5) * 1000:>7.0f} ms  p99 {percentile(samples, 0.99) * 1000:>7.0f} ms"
+            )
+    return percentile(latencies["subscriber"], 0.99)
+
+def main():
+    parser = argparse.ArgumentParser(description="Subscriber p99 latency under a free-tier flood")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--service-ms", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--subscriber-rps", type=float, default=10)
+    parser.add_argument("--free-rps", type=float, default=200)
+    parser.add_argument("--queue-depth", type=int, default=64)
+    parser.add_argument("--deadline", type=float, default=30)
+    parser.add_argument("--weights", default=ANALYSIS_TIER_WEIGHTS)
+    args = parser.parse_args()
+
+    weights = parse_tier_weights(args.weights)
+    print(f"🚦 {args.workers} workers x {args.service_ms:.0f} ms, subscribers {args.subscriber_rps:.0f} rps, "
+          f"free flood {args.free_rps:.0f} rps, weights {weights}")
+
+    baseline = asyncio.run(run_phase("Subscribers alone", args, False, weights, False))
+    tiered = asyncio.run(run_phase("Free-tier flood, tiered scheduling", args, True, weights, False))
+    fifo = asyncio.run(run_phase("Free-tier flood, first-come first-served", args, True, weights, True))
+
+    print(f"\n📊 Subscriber p99: alone {baseline * 1000:.0f} ms, "
+          f"tiered {tiered * 1000:.0f} ms, first-come first-served {fifo * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,61 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import uvicorn
 import os
+import json
+import math
+import asyncio
+import tempfile
+import mimetypes
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
 
-from database import get_db, engine
-from models import Base
+from database import get_db, engine, SessionLocal
+from migrations import upgrade_schema
 from auth import get_current_user, create_access_token, verify_token
 from schemas import UserCreate, UserLogin, Token, UserResponse, ImageAnalysisResponse
 from services import (
     create_user, authenticate_user, send_verification_email, 
-    verify_user_email, get_user_history, save_analysis_result
+    verify_user_email, get_user_history, get_analysis
 )
-from ai_services_fixed import ImageAnalysisService
 from usage_service import UsageService
+from admission import (
+    AnalysisScheduler, AdmissionRejected, ClientDisconnected, TIER_SUBSCRIBER, TIER_FREE,
+    run_until_disconnected, retry_after_header
+)
+from single_flight import SingleFlight, content_key
+from shared_state import shared_state
+from write_behind import persistence
+from export import EXPORT_FORMATS, PYARROW_AVAILABLE, iter_export_rows, stream_export
+from maintenance import run_maintenance, MAINTENANCE_ENABLED, MAINTENANCE_INTERVAL_HOURS
+from responses import CompactJSONResponse, CompressionMiddleware, analysis_response
+from artifact_store import artifact_store, ARTIFACT_STORE_UPLOADS
+from artifacts import signed_artifact_url, verify_artifact_url, with_artifact_urls
+from heatmaps import render_overlay
+from uploads import upload_capabilities, describe_upload, upload_stats, with_original_properties
 from fastapi import HTTPException
 
 # Load environment variables
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables, and add indexes missing from databases created by older versions
+upgrade_schema(engine)
 
 app = FastAPI(
     title="Clario - AI Image Analysis",
     description="AI-powered image analysis with forgery detection and classification",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=CompactJSONResponse
 )
 
+# gzip/brotli for large JSON bodies; registered first so it sits inside CORS
+app.add_middleware(CompressionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -41,8 +67,142 @@ app.add_middleware(
 
 security = HTTPBearer()
 
-# Initialize AI service
-ai_service = ImageAnalysisService()
+# Initialize AI service: either in-process, or a lightweight client of inference_server.py
+# so this worker never loads torch or the models
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS")
+if INFERENCE_SERVER_ADDRESS:
+    from inference_client import RemoteImageAnalysisService
+    ai_service = RemoteImageAnalysisService(INFERENCE_SERVER_ADDRESS)
+else:
+    from ai_services_fixed import ImageAnalysisService
+    ai_service = ImageAnalysisService()
+
+# Bounded admission in front of the analysis workers, so overload is shed with a fast 503
+scheduler = AnalysisScheduler()
+# Concurrent uploads of the same image share one analysis, across nodes when the state is shared
+single_flight = SingleFlight(shared_state)
+
+def request_deadline(request: Request) -> Optional[float]:
+    """Seconds the client is willing to wait, from X-Request-Timeout; 400 if the header is malformed"""
+    header = request.headers.get("X-Request-Timeout")
+    if header is None:
+        return None
+    try:
+        deadline = float(header)
+    except ValueError:
+        deadline = float("nan")
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise HTTPException(
+            status_code=400, detail="X-Request-Timeout must be a positive number of seconds"
+        )
+    return deadline
+
+async def run_admitted(
+    request: Request, analysis_type: str, analyze, content: bytes, usage_check, queue: Optional[str] = None, **options
+):
+    """Run an analysis through the admission queue, cancelling it if the client goes away
+
+    queue names a separate admission queue (with its own service-time estimate) for
+    variants of analysis_type that cost much more, such as high-res tiling.
+    """
+    deadline = request_deadline(request)
+    # Subscribers get the larger share of the workers
+    tier = TIER_SUBSCRIBER if usage_check.get("is_subscribed") else TIER_FREE
+    key = content_key(analysis_type, await ai_service.model_version(analysis_type), content, **options)
+    work = lambda: analyze(content, **options)
+    try:
+        return await run_until_disconnected(request, single_flight.do(
+            key, lambda: scheduler.run(queue or analysis_type, work, deadline=deadline, tier=tier), deadline=deadline
+        ))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "Server busy", "message": e.reason, "retry_after": e.retry_after},
+            headers=retry_after_header(e.retry_after)
+        )
+    except ClientDisconnected:
+        # Nobody is left to read the response; 499 only shows up in the access log
+        raise HTTPException(status_code=499, detail="Client closed request")
+
+def daily_limit_exceeded(usage_check: dict) -> HTTPException:
+    """429 for a user who has used up today's analyses"""
+    return HTTPException(
+        status_code=429, 
+        detail={
+            "error": "Daily limit exceeded",
+            "message": usage_check.get("message", "You have reached your daily limit"),
+            "usage_count": usage_check.get("usage_count", 0),
+            "limit": usage_check.get("limit", 7),
+            "subscription_required": True
+        }
+    )
+
+@contextmanager
+def reserved_analysis(db: Session, user_id: int):
+    """Reserve one of the user's analyses for today, or raise 429; the block failing gives it back"""
+    usage_service = UsageService(db)
+    usage_check = usage_service.reserve_analysis(user_id)
+    if not usage_check["can_analyze"]:
+        raise daily_limit_exceeded(usage_check)
+    try:
+        yield usage_check
+    except BaseException:
+        usage_service.release_analysis(user_id, usage_check)
+        raise
+
+async def store_upload(content: bytes) -> Optional[dict]:
+    """Original and thumbnail artifact names of an upload, or None if it is not stored"""
+    if not ARTIFACT_STORE_UPLOADS:
+        return None
+    try:
+        return await asyncio.get_event_loop().run_in_executor(None, artifact_store.put_upload, content)
+    except Exception as e:
+        print(f"⚠️ Could not store upload: {e}")
+        return None
+
+async def with_upload_artifacts(analysis, content: bytes, upload: dict) -> dict:
+    """Await an analysis while the upload is stored next to it; the result records the upload and its artifacts"""
+    result, names = await asyncio.gather(analysis, store_upload(content))
+    result = {**with_original_properties(result, upload), "upload": upload}
+    return {**result, "artifacts": names} if names else result
+
+async def analyzed_upload(db: Session, user_id: int, analysis_id: int) -> bytes:
+    """The upload behind one of the user's analyses, read back from the artifact store"""
+    try:
+        analysis = await get_analysis(db, user_id, analysis_id)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    name = (analysis["result"].get("artifacts") or {}).get("original")
+    try:
+        if name:
+            return await asyncio.get_event_loop().run_in_executor(None, artifact_store.read, name)
+    except FileNotFoundError:
+        pass
+    # Not stored (ARTIFACT_STORE_UPLOADS off) or evicted after the analysis was archived
+    raise HTTPException(status_code=409, detail="The upload of this analysis is no longer stored")
+
+async def maintenance_loop():
+    """Archive expired results and compact the database every MAINTENANCE_INTERVAL_HOURS"""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            # Only one worker gets the maintenance lock; the others skip this round
+            report = await loop.run_in_executor(None, run_maintenance)
+            if report is not None:
+                print(f"🗄️ Maintenance: {report}")
+        except Exception as e:
+            print(f"❌ Maintenance failed: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_HOURS * 3600)
+
+@app.on_event("startup")
+async def start_maintenance():
+    if MAINTENANCE_ENABLED:
+        asyncio.ensure_future(maintenance_loop())
+
+@app.on_event("shutdown")
+def flush_pending_writes():
+    """Commit whatever the write-behind queue still holds before the process exits"""
+    persistence.close()
 
 @app.get("/")
 async def root():
@@ -52,6 +212,28 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "Backend is running properly"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Analysis queue metrics in Prometheus text format"""
+    return "\n".join(
+        scheduler.prometheus_lines() + single_flight.prometheus_lines() + persistence.prometheus_lines()
+        + upload_stats.prometheus_lines()
+    ) + "\n"
+
+@app.get("/metrics/analysis-queues")
+async def analysis_queue_metrics():
+    """Analysis queue depth, estimated wait, admission and coalescing counters"""
+    return {
+        **scheduler.metrics(), "single_flight": single_flight.metrics(), "persistence": persistence.metrics(),
+        "uploads": upload_stats.metrics()
+    }
+
+@app.get("/capabilities")
+async def capabilities(response: Response):
+    """How clients should prepare uploads per analysis type: the size and formats to downscale to, or the original"""
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return upload_capabilities()
+
 @app.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user - simplified without verification"""
@@ -81,53 +263,39 @@ async def get_current_user_info(current_user = Depends(get_current_user)):
 
 @app.post("/analysis/classification", response_model=ImageAnalysisResponse)
 async def analyze_classification(
+    request: Request,
     file: UploadFile = File(...),
+    upload_info: Optional[str] = Form(None),
+    high_res: bool = False,
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Analyze image for classification using main_extraction.py logic"""
     try:
-        # Check usage limit
-        usage_service = UsageService(db)
-        usage_check = usage_service.check_usage_limit(current_user.id)
-        
-        if not usage_check["can_analyze"]:
-            raise HTTPException(
-                status_code=429, 
-                detail={
-                    "error": "Daily limit exceeded",
-                    "message": usage_check.get("message", "You have reached your daily limit"),
-                    "usage_count": usage_check.get("usage_count", 0),
-                    "limit": usage_check.get("limit", 7),
-                    "subscription_required": True
-                }
-            )
-        
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+        # Takes one of today's analyses; given back if the request fails before it is counted
+        with reserved_analysis(db, current_user.id) as usage_check:
+            # Validate file type
+            if not file.content_type.startswith('image/'):
+                raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read file content
-        content = await file.read()
+            # Read file content
+            content = await file.read()
         
-        # Analyze image
-        result = await ai_service.analyze_classification(content)
+            # Analyze image
+            result = await with_upload_artifacts(run_admitted(
+                request, "classification", ai_service.analyze_classification, content, usage_check,
+                queue="classification_high_res" if high_res else None, high_res=high_res
+            ), content, describe_upload(upload_info, content, file.content_type))
         
-        # Increment usage count
-        usage_service.increment_usage(current_user.id)
-        
-        # Save result to database
-        analysis_record = await save_analysis_result(
-            db, current_user.id, "classification", file.filename, result
-        )
+            # Save result and count usage (group-committed by the write-behind queue)
+            analysis_record = await persistence.save_analysis(
+                current_user.id, "classification", file.filename, result
+            )
         
-        return ImageAnalysisResponse(
-            id=analysis_record.id,
-            analysis_type="classification",
-            filename=file.filename,
-            result=result,
-            created_at=analysis_record.created_at
-        )
+            # Rendered directly rather than re-validating the free-form result against ImageAnalysisResponse
+            return analysis_response(
+                analysis_record.id, "classification", file.filename, with_artifact_urls(result), analysis_record.created_at
+            )
     except HTTPException:
         raise
     except Exception as e:
@@ -135,53 +303,38 @@ async def analyze_classification(
 
 @app.post("/analysis/forgery", response_model=ImageAnalysisResponse)
 async def analyze_forgery(
+    request: Request,
     file: UploadFile = File(...),
+    upload_info: Optional[str] = Form(None),
+    cascade: bool = False,
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Analyze image for forgery detection using main_blind.py logic"""
     try:
-        # Check usage limit
-        usage_service = UsageService(db)
-        usage_check = usage_service.check_usage_limit(current_user.id)
-        
-        if not usage_check["can_analyze"]:
-            raise HTTPException(
-                status_code=429, 
-                detail={
-                    "error": "Daily limit exceeded",
-                    "message": usage_check.get("message", "You have reached your daily limit"),
-                    "usage_count": usage_check.get("usage_count", 0),
-                    "limit": usage_check.get("limit", 7),
-                    "subscription_required": True
-                }
-            )
+        # Takes one of today's analyses; given back if the request fails before it is counted
+        with reserved_analysis(db, current_user.id) as usage_check:
+            # Validate file type
+            if not file.content_type.startswith('image/'):
+                raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+            # Read file content
+            content = await file.read()
         
-        # Read file content
-        content = await file.read()
+            # Analyze image
+            result = await with_upload_artifacts(run_admitted(
+                request, "forgery", ai_service.analyze_forgery, content, usage_check, cascade=cascade
+            ), content, describe_upload(upload_info, content, file.content_type))
         
-        # Analyze image
-        result = await ai_service.analyze_forgery(content)
-        
-        # Increment usage count
-        usage_service.increment_usage(current_user.id)
-        
-        # Save result to database
-        analysis_record = await save_analysis_result(
-            db, current_user.id, "forgery", file.filename, result
-        )
+            # Save result and count usage (group-committed by the write-behind queue)
+            analysis_record = await persistence.save_analysis(
+                current_user.id, "forgery", file.filename, result
+            )
         
-        return ImageAnalysisResponse(
-            id=analysis_record.id,
-            analysis_type="forgery",
-            filename=file.filename,
-            result=result,
-            created_at=analysis_record.created_at
-        )
+            # Rendered directly rather than re-validating the free-form result against ImageAnalysisResponse
+            return analysis_response(
+                analysis_record.id, "forgery", file.filename, with_artifact_urls(result), analysis_record.created_at
+            )
     except HTTPException:
         raise
     except Exception as e:
@@ -189,57 +342,207 @@ async def analyze_forgery(
 
 @app.post("/analysis/deepfake", response_model=ImageAnalysisResponse)
 async def analyze_deepfake(
+    request: Request,
     file: UploadFile = File(...),
+    upload_info: Optional[str] = Form(None),
+    cascade: bool = False,
+    high_res: bool = False,
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Analyze image for deepfake detection using ViT model"""
     try:
-        # Check usage limit
-        usage_service = UsageService(db)
-        usage_check = usage_service.check_usage_limit(current_user.id)
+        # Takes one of today's analyses; given back if the request fails before it is counted
+        with reserved_analysis(db, current_user.id) as usage_check:
+            # Validate file type
+            if not file.content_type.startswith('image/'):
+                raise HTTPException(status_code=400, detail="File must be an image")
         
-        if not usage_check["can_analyze"]:
-            raise HTTPException(
-                status_code=429, 
-                detail={
-                    "error": "Daily limit exceeded",
-                    "message": usage_check.get("message", "You have reached your daily limit"),
-                    "usage_count": usage_check.get("usage_count", 0),
-                    "limit": usage_check.get("limit", 7),
-                    "subscription_required": True
-                }
+            # Read file content
+            content = await file.read()
+        
+            # Analyze image
+            result = await with_upload_artifacts(run_admitted(
+                request, "deepfake", ai_service.analyze_deepfake, content, usage_check,
+                queue="deepfake_high_res" if high_res else None, cascade=cascade, high_res=high_res
+            ), content, describe_upload(upload_info, content, file.content_type))
+        
+            # Save result and count usage (group-committed by the write-behind queue)
+            analysis_record = await persistence.save_analysis(
+                current_user.id, "deepfake", file.filename, result
             )
         
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+            # Rendered directly rather than re-validating the free-form result against ImageAnalysisResponse
+            return analysis_response(
+                analysis_record.id, "deepfake", file.filename, with_artifact_urls(result), analysis_record.created_at
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analysis/metrics")
+async def analyze_metrics(
+    request: Request,
+    analysis_id: int,
+    metrics: str = "histogram",
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Compute basic image metrics (comma-separated), e.g. the color histograms, for the upload of one of the user's analyses"""
+    try:
+        # Supplements an analysis the user already ran, so it is not counted, but it is only
+        # computed for users still within today's limit
+        usage_check = UsageService(db).check_usage_limit(current_user.id)
+        if not usage_check["can_analyze"]:
+            raise daily_limit_exceeded(usage_check)
         
-        # Read file content
-        content = await file.read()
+        content = await analyzed_upload(db, current_user.id, analysis_id)
+        names = sorted({name.strip() for name in metrics.split(",") if name.strip()})
+        result = await run_admitted(request, "metrics", ai_service.analyze_metrics, content, usage_check, metrics=names)
+        if not result.get("success"):
+            raise HTTPException(status_code=400, detail=result.get("error", "Metric computation failed"))
+        return {**result, "analysis_id": analysis_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analysis/heatmap")
+async def analysis_heatmap(
+    request: Request,
+    analysis_id: int,
+    model: str = "deepfake",
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Attention-rollout heatmap of the classification or deepfake model for the upload of one of the user's analyses"""
+    try:
+        if model not in ("classification", "deepfake"):
+            raise HTTPException(status_code=400, detail="model must be 'classification' or 'deepfake'")
         
-        # Analyze image
-        result = await ai_service.analyze_deepfake(content)
+        content = await analyzed_upload(db, current_user.id, analysis_id)
+        model_version = await ai_service.model_version(model)
+        # Computed once per image and model version; later requests are a file lookup
+        key = content_key("heatmap", model_version, content, model=model)
+        name = artifact_store.lookup(key)
+        cached = name is not None
+        if name is None:
+            # Explains an analysis the user already ran, so it is not counted, but the forward
+            # pass is only run for users still within today's limit
+            usage_check = UsageService(db).check_usage_limit(current_user.id)
+            if not usage_check["can_analyze"]:
+                raise daily_limit_exceeded(usage_check)
+            result = await run_admitted(request, "heatmap", ai_service.analyze_heatmap, content, usage_check, model=model)
+            if not result.get("success"):
+                raise HTTPException(
+                    status_code=503 if model_version == "heuristic" else 400,
+                    detail=result.get("error", "Heatmap computation failed")
+                )
+            width, height = result["image_size"]
+            name = artifact_store.put(render_overlay(result["grid"], width, height), "png")
+            artifact_store.remember(key, name)
         
-        # Increment usage count
-        usage_service.increment_usage(current_user.id)
+        return {
+            "analysis_id": analysis_id,
+            "model": model,
+            "method": "attention_rollout",
+            "artifact": name,
+            "url": signed_artifact_url(name),
+            "cached": cached
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Artifacts never change, so the browser's copy stays valid for good; shared caches must not
+# keep one, as the signed URL is all that stands between an upload and other users
+ARTIFACT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+@app.api_route("/artifacts/{name}", methods=["GET", "HEAD"])
+async def get_artifact(
+    name: str,
+    request: Request,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None
+):
+    """Serve a stored artifact from a signed URL, with Range and conditional requests"""
+    # Signed rather than bearer-authenticated, since <img> tags cannot send a token; the URL
+    # is only handed out with an analysis or heatmap of the user's own upload
+    try:
+        path = artifact_store.path(name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    if not verify_artifact_url(name, expires, signature):
+        raise HTTPException(status_code=403, detail="Artifact URL is invalid or has expired")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    # The name is the digest of the bytes, which makes it a strong validator
+    headers = {"ETag": f'"{name.split(".")[0]}"', "Cache-Control": ARTIFACT_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or headers["ETag"] in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    ):
+        return Response(status_code=304, headers=headers)
+    artifact_store.touch(path)
+    # FileResponse answers Range and If-Range requests against this ETag
+    return FileResponse(
+        path, media_type=mimetypes.guess_type(name)[0] or "application/octet-stream", headers=headers
+    )
+
+@app.post("/analysis/deepfake/video")
+async def analyze_deepfake_video(
+    file: UploadFile = File(...),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Analyze a video for deepfakes, streaming per-segment results as NDJSON"""
+    try:
+        # Takes one of today's analyses; given back if the request fails before it is counted
+        with reserved_analysis(db, current_user.id):
+            # Validate file type
+            if not file.content_type.startswith('video/'):
+                raise HTTPException(status_code=400, detail="File must be a video")
         
-        # Save result to database
-        analysis_record = await save_analysis_result(
-            db, current_user.id, "deepfake", file.filename, result
-        )
+            # cv2.VideoCapture decodes from a path, so spool the upload to disk in chunks
+            suffix = os.path.splitext(file.filename or "")[1]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as video_file:
+                while True:
+                    chunk = await file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    video_file.write(chunk)
+                video_path = video_file.name
         
-        return ImageAnalysisResponse(
-            id=analysis_record.id,
-            analysis_type="deepfake",
-            filename=file.filename,
-            result=result,
-            created_at=analysis_record.created_at
-        )
+            # Increment usage count
+            await persistence.increment_usage(current_user.id)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    user_id = current_user.id
+    filename = file.filename
+    
+    async def stream_results():
+        records = ai_service.analyze_deepfake_video(video_path)
+        try:
+            async for record in records:
+                if record["type"] in ("summary", "error"):
+                    # Usage was already counted when the upload was accepted
+                    analysis_record = await persistence.save_analysis(
+                        user_id, "deepfake_video", filename, record, count_usage=False
+                    )
+                    record = {**record, "id": analysis_record.id}
+                yield json.dumps(record, default=str) + "\n"
+        finally:
+            # The analysis must let go of the file before it is removed
+            await records.aclose()
+            os.unlink(video_path)
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 @app.get("/analysis/history")
 async def get_history(
@@ -249,10 +552,55 @@ async def get_history(
     """Get user's analysis history"""
     try:
         history = await get_user_history(db, current_user.id)
-        return {"history": history}
+        return {"history": [{**item, "result": with_artifact_urls(item["result"])} for item in history]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analysis/export")
+async def export_history(
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    analysis_type: Optional[str] = None,
+    include_archived: bool = True,
+    current_user = Depends(get_current_user)
+):
+    """Stream the user's whole analysis history as NDJSON, CSV or Parquet"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=400, detail="Parquet export is not available on this server")
+    
+    user_id = current_user.id
+    analysis_types = analysis_type.split(",") if analysis_type else None
+    
+    def rows():
+        # The cursor outlives the request's session, so the export reads with its own
+        db = SessionLocal()
+        try:
+            yield from iter_export_rows(db, user_id, start, end, analysis_types, include_archived)
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        stream_export(format, rows()),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="clario-history.{format}"'}
+    )
+
+@app.get("/analysis/history/{analysis_id}")
+async def get_history_item(
+    analysis_id: int,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get one analysis with its full result, including archived ones"""
+    try:
+        analysis = await get_analysis(db, current_user.id, analysis_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {**analysis, "result": with_artifact_urls(analysis["result"])}
+
 @app.get("/usage/stats")
 async def get_usage_stats(
     current_user = Depends(get_current_user),
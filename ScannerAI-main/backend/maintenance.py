@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Retention, archival and compaction for analysis_results and daily_usage.
+
+Usage:
+    python maintenance.py [--convert-vacuum]
+
+One run:
+  * moves analysis results older than the retention of their owner's tier into monthly
+    archive partitions (compressed NDJSON, zstd if installed, gzip otherwise) and keeps a
+    small summary of each in archived_analyses, so history can still list them and load
+    the full result on demand
+  * rolls daily_usage rows older than USAGE_ROLLUP_DAYS up into monthly_usage
+  * evicts least recently used artifacts no analysis result refers to once the artifact
+    store exceeds ARTIFACT_MAX_BYTES
+  * hands freed SQLite pages back to the filesystem with incremental vacuum
+
+--convert-vacuum switches a database created before auto_vacuum=INCREMENTAL was the
+default over to it (a one-time full VACUUM).
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.orm import sessionmaker
+
+from artifacts import collect_artifacts, count_references
+from database import engine as default_engine
+from models import AnalysisResult, ArchivedAnalysis, DailyUsage, MonthlyUsage, Subscription
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # Windows: the maintenance lock is a byte-range lock instead
+    import msvcrt
+    FCNTL_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+load_dotenv()
+
+RETENTION_DAYS_FREE = int(os.getenv("RETENTION_DAYS_FREE", "90"))
+RETENTION_DAYS_SUBSCRIBER = int(os.getenv("RETENTION_DAYS_SUBSCRIBER", "365"))
+USAGE_ROLLUP_DAYS = int(os.getenv("USAGE_ROLLUP_DAYS", "62"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+
+# Records per compressed frame: larger frames compress better, smaller ones load faster
+ARCHIVE_FRAME_RECORDS = 64
+ARCHIVE_ZSTD_LEVEL = 9
+
+# Result fields kept in archived_analyses for the history list
+SUMMARY_FIELDS = (
+    "success", "error", "analysis_type", "predicted_label", "confidence",
+    "is_forged", "is_deepfake", "risk_level", "qf", "image_mode"
+)
+
+ARCHIVE_SUFFIX = ".ndjson.zst" if ZSTD_AVAILABLE else ".ndjson.gz"
+
+def _compress(data: bytes) -> bytes:
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(data)
+    return gzip.compress(data)
+
+def _decompress(data: bytes, archive_path: str) -> bytes:
+    if archive_path.endswith(".zst"):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to read zstd archives (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def _summary(result: Any) -> Dict[str, Any]:
+    if not isinstance(result, dict):
+        return {}
+    return {field: result[field] for field in SUMMARY_FIELDS if field in result}
+
+def _partition(created_at: Optional[datetime]) -> str:
+    month = created_at.strftime("%Y-%m") if created_at else "undated"
+    return os.path.join("analysis_results", month + ARCHIVE_SUFFIX)
+
+def _append_frames(relative_path: str, rows: List[AnalysisResult]) -> List[Dict[str, Any]]:
+    """Append rows to a partition as compressed frames; returns their archived_analyses entries"""
+    path = os.path.join(ARCHIVE_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entries = []
+    with open(path, "ab") as archive:
+        for start in range(0, len(rows), ARCHIVE_FRAME_RECORDS):
+            frame_rows = rows[start:start + ARCHIVE_FRAME_RECORDS]
+            lines = [
+                json.dumps({
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "analysis_type": row.analysis_type,
+                    "filename": row.filename,
+                    "result": row.result,
+                    "created_at": row.created_at.isoformat() if row.created_at else None
+                }, default=str)
+                for row in frame_rows
+            ]
+            frame = _compress(("\n".join(lines) + "\n").encode())
+            offset = archive.tell()
+            archive.write(frame)
+            for line, row in enumerate(frame_rows):
+                entries.append({
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "analysis_type": row.analysis_type,
+                    "filename": row.filename,
+                    "summary": _summary(row.result),
+                    "created_at": row.created_at,
+                    "archive_path": relative_path,
+                    "frame_offset": offset,
+                    "frame_length": len(frame),
+                    "frame_line": line
+                })
+        archive.flush()
+        # The frames must be on disk before the rows they replace are deleted
+        os.fsync(archive.fileno())
+    return entries
+
+def read_frame_lines(archive_path: str, frame_offset: int, frame_length: int) -> List[str]:
+    """NDJSON lines of one compressed frame of an archive partition"""
+    with open(os.path.join(ARCHIVE_DIR, archive_path), "rb") as archive:
+        archive.seek(frame_offset)
+        frame = archive.read(frame_length)
+    return _decompress(frame, archive_path).decode().splitlines()
+
+def load_archived_result(archived: ArchivedAnalysis) -> Dict[str, Any]:
+    """Full record of an archived analysis, read from its frame in the archive partition"""
+    lines = read_frame_lines(archived.archive_path, archived.frame_offset, archived.frame_length)
+    return json.loads(lines[archived.frame_line])
+
+def archive_old_results(session_factory, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Move results past their tier's retention into the archive, one batch per transaction"""
+    now = now or datetime.utcnow()
+    subscriber_cutoff = now - timedelta(days=RETENTION_DAYS_SUBSCRIBER)
+    free_cutoff = now - timedelta(days=RETENTION_DAYS_FREE)
+    subscribers = select(Subscription.user_id).where(
+        Subscription.status == "active", Subscription.end_date > datetime.now()
+    )
+    expired = or_(
+        AnalysisResult.created_at < subscriber_cutoff,
+        and_(AnalysisResult.created_at < free_cutoff, AnalysisResult.user_id.not_in(subscribers))
+    )
+
+    archived = 0
+    archived_bytes = 0
+    partitions = set()
+    while True:
+        db = session_factory()
+        try:
+            rows = db.query(AnalysisResult).filter(expired).order_by(AnalysisResult.id).limit(ARCHIVE_BATCH_SIZE).all()
+            if not rows:
+                break
+            by_partition: Dict[str, List[AnalysisResult]] = {}
+            for row in rows:
+                by_partition.setdefault(_partition(row.created_at), []).append(row)
+
+            entries = []
+            for relative_path, partition_rows in by_partition.items():
+                partition_entries = _append_frames(relative_path, partition_rows)
+                frames = {entry["frame_offset"]: entry["frame_length"] for entry in partition_entries}
+                archived_bytes += sum(frames.values())
+                entries.extend(partition_entries)
+                partitions.add(relative_path)
+
+            db.execute(ArchivedAnalysis.__table__.insert(), entries)
+            db.query(AnalysisResult).filter(
+                AnalysisResult.id.in_([row.id for row in rows])
+            ).delete(synchronize_session=False)
+            # Archived results no longer hold on to their uploads; eviction may take them
+            count_references(db, [row.result for row in rows], -1)
+            db.commit()
+            archived += len(rows)
+        except Exception:
+            # Frames already appended stay in the partition unreferenced; the rows are archived again next run
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    return {"archived_results": archived, "archived_bytes": archived_bytes, "partitions": len(partitions)}
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def roll_up_daily_usage(session_factory, today: Optional[date] = None) -> Dict[str, int]:
+    """Fold daily_usage rows older than USAGE_ROLLUP_DAYS into per-month totals"""
+    cutoff = (today or date.today()) - timedelta(days=USAGE_ROLLUP_DAYS)
+    db = session_factory()
+    try:
+        rows = db.query(DailyUsage).filter(DailyUsage.usage_date < cutoff).all()
+        if not rows:
+            return {"rolled_up_days": 0, "monthly_rows": 0}
+
+        totals: Dict[tuple, int] = {}
+        for row in rows:
+            key = (row.user_id, _month_start(row.usage_date))
+            totals[key] = totals.get(key, 0) + (row.analysis_count or 0)
+
+        for (user_id, month), count in totals.items():
+            updated = db.execute(
+                update(MonthlyUsage)
+                .where(MonthlyUsage.user_id == user_id, MonthlyUsage.month == month)
+                .values(analysis_count=MonthlyUsage.analysis_count + count)
+            )
+            if not updated.rowcount:
+                db.add(MonthlyUsage(user_id=user_id, month=month, analysis_count=count))
+        db.query(DailyUsage).filter(DailyUsage.usage_date < cutoff).delete(synchronize_session=False)
+        db.commit()
+        return {"rolled_up_days": len(rows), "monthly_rows": len(totals)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _database_size(connection) -> Dict[str, int]:
+    page_size = connection.execute(text("PRAGMA page_size")).scalar()
+    return {
+        "bytes": connection.execute(text("PRAGMA page_count")).scalar() * page_size,
+        "free_bytes": connection.execute(text("PRAGMA freelist_count")).scalar() * page_size
+    }
+
+def compact(engine, convert: bool = False) -> Dict[str, Any]:
+    """Return free pages to the filesystem; SQLite only (Postgres autovacuum handles this itself)"""
+    if engine.dialect.name != "sqlite":
+        return {"vacuum": "skipped"}
+
+    with engine.connect() as connection:
+        before = _database_size(connection)
+        auto_vacuum = connection.execute(text("PRAGMA auto_vacuum")).scalar()
+        if auto_vacuum != 2 and convert:
+            # auto_vacuum can only be changed on an existing database by a full VACUUM
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+            mode = "converted"
+        elif auto_vacuum == 2:
+            connection.exec_driver_sql("PRAGMA incremental_vacuum")
+            mode = "incremental"
+        else:
+            mode = "unavailable (run with --convert-vacuum once)"
+        connection.commit()
+        after = _database_size(connection)
+
+    return {
+        "vacuum": mode,
+        "database_bytes": after["bytes"],
+        "free_bytes": after["free_bytes"],
+        "reclaimed_bytes": before["bytes"] - after["bytes"]
+    }
+
+@contextmanager
+def maintenance_lock():
+    """Yields whether this process got the maintenance lock, held until the block exits"""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, ".maintenance.lock"), "w") as lock:
+        if FCNTL_AVAILABLE:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            # Released when the file is closed
+            yield True
+            return
+        try:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+def run_maintenance(engine=default_engine, convert_vacuum: bool = False) -> Optional[Dict[str, Any]]:
+    """One maintenance pass; returns None if another process is already running one"""
+    with maintenance_lock() as locked:
+        if not locked:
+            return None
+
+        started = time.perf_counter()
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        report = {}
+        report.update(archive_old_results(session_factory))
+        report.update(roll_up_daily_usage(session_factory))
+        report.update(collect_artifacts(session_factory))
+        report.update(compact(engine, convert_vacuum))
+        report["seconds"] = round(time.perf_counter() - started, 2)
+        return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old analysis results and compact the database")
+    parser.add_argument("--convert-vacuum", action="store_true", help="Switch the database to incremental auto_vacuum")
+    args = parser.parse_args()
+
+    report = run_maintenance(convert_vacuum=args.convert_vacuum)
+    if report is None:
+        print("⚠️ Another maintenance run holds the lock")
+    else:
+        print(f"🗄️ Archived {report['archived_results']} results into {report['partitions']} partitions "
+              f"({report['archived_bytes'] / 1024:.0f} KB compressed)")
+        print(f"🖼️ Evicted {report['evicted_artifacts']} artifacts ({report['evicted_bytes'] / 1024:.0f} KB), "
+              f"{report['artifacts']} left ({report['artifact_bytes'] / 1024 ** 2:.0f} MB)")
+        print(f"📅 Rolled {report['rolled_up_days']} daily usage rows into {report['monthly_rows']} monthly rows")
+        if "reclaimed_bytes" in report:
+            print(f"🧹 Vacuum {report['vacuum']}: reclaimed {report['reclaimed_bytes'] / 1024:.0f} KB, "
+                  f"database now {report['database_bytes'] / 1024:.0f} KB")
+        print(f"✅ Done in {report['seconds']}s")
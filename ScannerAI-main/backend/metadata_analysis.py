@@ -0,0 +1,365 @@
+"""
+Metadata forensics that read headers instead of pixels.
+
+JPEG files are walked marker by marker up to the start of the compressed data: EXIF (with
+its embedded thumbnail), XMP, Photoshop resource blocks and quantization tables are parsed
+in tens of microseconds. Other formats fall back to Pillow's lazy open, which also stops
+at the header. The only pixels ever decoded are the embedded thumbnail and a DCT-scaled
+reduced decode of the main image (1/8 size) to compare it against.
+"""
+
+import io
+import os
+import re
+import struct
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METADATA_ANALYSIS_ENABLED = os.getenv("METADATA_ANALYSIS_ENABLED", "true").lower() == "true"
+# Correlation between the embedded thumbnail and the image below which they are different pictures
+THUMBNAIL_MIN_CORRELATION = float(os.getenv("THUMBNAIL_MIN_CORRELATION", "0.85"))
+# Largest mean difference (in standard deviations) of one 8x8 grid cell before a local edit is reported
+THUMBNAIL_MAX_CELL_DIFF = float(os.getenv("THUMBNAIL_MAX_CELL_DIFF", "0.5"))
+
+# Capture and modification timestamps further apart than this mean the file was re-saved
+MODIFIED_AFTER_CAPTURE_SECONDS = 60
+
+EDITING_SOFTWARE = (
+    "photoshop", "lightroom", "gimp", "affinity", "pixelmator", "paint.net", "snapseed", "picsart",
+    "canva", "facetune", "luminar", "capture one", "darktable", "photopea", "fotor", "meitu",
+    "acdsee", "corel", "photoscape", "befunky", "krita"
+)
+
+# Natural (row-major) position of each coefficient in JPEG's zigzag order
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63
+])
+
+# Annex K tables that libjpeg (and everything built on it) scales by the quality setting
+STANDARD_LUMINANCE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99
+])
+STANDARD_CHROMINANCE = np.array([
+    17, 18, 24, 47, 99, 99, 99, 99, 18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99, 47, 66, 99, 99, 99, 99, 99, 99
+] + [99] * 32)
+
+def _ijg_tables(standard: np.ndarray) -> np.ndarray:
+    """The table libjpeg writes for every quality 1..100, one row each"""
+    qualities = np.arange(1, 101)
+    scale = np.where(qualities < 50, 5000 // qualities, 200 - 2 * qualities)[:, None]
+    return np.clip((standard[None, :] * scale + 50) // 100, 1, 255)
+
+IJG_LUMINANCE = _ijg_tables(STANDARD_LUMINANCE)
+IJG_CHROMINANCE = _ijg_tables(STANDARD_CHROMINANCE)
+
+# EXIF tags read from IFD0, the Exif sub-IFD and IFD1 (the thumbnail)
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_SOFTWARE = 0x0131
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_EXPOSURE_TIME = 0x829A
+TAG_FNUMBER = 0x829D
+TAG_ISO = 0x8827
+TAG_PIXEL_X = 0xA002
+TAG_PIXEL_Y = 0xA003
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+_TIFF_TYPE_FORMATS = {1: "B", 3: "H", 4: "I", 9: "i"}
+
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+_XMP_CREATOR_TOOL = re.compile(r'CreatorTool(?:="([^"]*)"|>([^<]*)<)')
+_XMP_SAVED = re.compile(r'stEvt:action(?:="saved"|>saved<)')
+_XMP_AGENT = re.compile(r'stEvt:softwareAgent(?:="([^"]*)"|>([^<]*)<)')
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> Tuple[Dict[int, Any], int]:
+    """Tags of the IFD at offset and the offset of the next IFD (0 when there is none)"""
+    if offset <= 0 or offset + 2 > len(tiff):
+        return {}, 0
+    (count,) = struct.unpack_from(endian + "H", tiff, offset)
+    tags = {}
+    for index in range(min(count, 512)):
+        entry = offset + 2 + index * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, kind, n = struct.unpack_from(endian + "HHI", tiff, entry)
+        size = _TIFF_TYPE_SIZES.get(kind)
+        if size is None:
+            continue
+        position = entry + 8
+        if size * n > 4:
+            (position,) = struct.unpack_from(endian + "I", tiff, entry + 8)
+        if position + size * n > len(tiff):
+            continue
+        if kind == 2:
+            tags[tag] = tiff[position:position + n].split(b"\x00", 1)[0].decode("latin-1").strip()
+        elif kind in (5, 10):
+            numerator, denominator = struct.unpack_from(endian + ("II" if kind == 5 else "ii"), tiff, position)
+            tags[tag] = numerator / denominator if denominator else 0.0
+        elif kind in _TIFF_TYPE_FORMATS and n:
+            values = struct.unpack_from(f"{endian}{n}{_TIFF_TYPE_FORMATS[kind]}", tiff, position)
+            tags[tag] = values[0] if n == 1 else values
+    next_entry = offset + 2 + count * 12
+    next_offset = struct.unpack_from(endian + "I", tiff, next_entry)[0] if next_entry + 4 <= len(tiff) else 0
+    return tags, next_offset
+
+def parse_exif(tiff: bytes) -> Dict[str, Any]:
+    """IFD0, Exif sub-IFD and thumbnail of a TIFF-structured EXIF block"""
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return {}
+    endian = "<" if tiff[:2] == b"II" else ">"
+    (ifd0_offset,) = struct.unpack_from(endian + "I", tiff, 4)
+    ifd0, ifd1_offset = _read_ifd(tiff, ifd0_offset, endian)
+    exif_ifd = {}
+    if isinstance(ifd0.get(TAG_EXIF_IFD), int):
+        exif_ifd, _ = _read_ifd(tiff, ifd0[TAG_EXIF_IFD], endian)
+    ifd1, _ = _read_ifd(tiff, ifd1_offset, endian) if ifd1_offset != ifd0_offset else ({}, 0)
+
+    thumbnail = None
+    offset, length = ifd1.get(TAG_THUMBNAIL_OFFSET), ifd1.get(TAG_THUMBNAIL_LENGTH)
+    if isinstance(offset, int) and isinstance(length, int) and 0 < length and offset + length <= len(tiff):
+        thumbnail = tiff[offset:offset + length]
+    return {"ifd0": ifd0, "exif": exif_ifd, "thumbnail": thumbnail}
+
+def parse_jpeg_headers(data: bytes) -> Optional[Dict[str, Any]]:
+    """Markers of a JPEG up to the first scan; None when data is not a JPEG"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    headers = {
+        "width": None, "height": None, "components": None, "progressive": False, "sampling": None,
+        "quantization": {}, "exif": None, "xmp": None, "photoshop": False, "adobe": False, "comments": []
+    }
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            break
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte before the marker
+            position += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            position += 2
+            continue
+        if marker in (0xDA, 0xD9):
+            break
+        (length,) = struct.unpack_from(">H", data, position + 2)
+        payload = data[position + 4:position + 2 + length]
+        position += 2 + length
+
+        if marker == 0xDB:
+            offset = 0
+            while offset < len(payload):
+                precision, table_id = payload[offset] >> 4, payload[offset] & 0x0F
+                size = 128 if precision else 64
+                raw = payload[offset + 1:offset + 1 + size]
+                if len(raw) < size:
+                    break
+                zigzag = np.frombuffer(raw, dtype=">u2" if precision else np.uint8).astype(np.int64)
+                table = np.empty(64, dtype=np.int64)
+                table[ZIGZAG] = zigzag
+                headers["quantization"][table_id] = table
+                offset += 1 + size
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC) and len(payload) >= 6:
+            headers["height"], headers["width"] = struct.unpack_from(">HH", payload, 1)
+            headers["components"] = payload[5]
+            headers["progressive"] = marker in (0xC2, 0xC6, 0xCA, 0xCE)
+            if payload[5] >= 1 and len(payload) >= 9:
+                headers["sampling"] = f"{payload[7] >> 4}x{payload[7] & 0x0F}"
+        elif marker == 0xE1 and payload.startswith(b"Exif\x00\x00") and headers["exif"] is None:
+            headers["exif"] = payload[6:]
+        elif marker == 0xE1 and payload.startswith(XMP_HEADER):
+            headers["xmp"] = payload[len(XMP_HEADER):].decode("utf-8", "replace")
+        elif marker == 0xED and payload.startswith(b"Photoshop 3.0"):
+            headers["photoshop"] = True
+        elif marker == 0xEE and payload.startswith(b"Adobe"):
+            headers["adobe"] = True
+        elif marker == 0xFE:
+            headers["comments"].append(payload.decode("latin-1", "replace").strip("\x00 "))
+    return headers
+
+def _pillow_headers(data: bytes) -> Dict[str, Any]:
+    """Headers of non-JPEG formats; Image.open reads the header only"""
+    image = Image.open(io.BytesIO(data))
+    exif_bytes = image.info.get("exif")
+    if isinstance(exif_bytes, bytes) and exif_bytes.startswith(b"Exif\x00\x00"):
+        exif_bytes = exif_bytes[6:]
+    xmp = image.info.get("xmp") or image.info.get("XML:com.adobe.xmp")
+    if isinstance(xmp, bytes):
+        xmp = xmp.decode("utf-8", "replace")
+    software = image.info.get("Software") or image.info.get("software")
+    return {
+        "format": image.format, "width": image.width, "height": image.height, "progressive": False,
+        "sampling": None, "quantization": {}, "exif": exif_bytes if isinstance(exif_bytes, bytes) else None,
+        "xmp": xmp, "photoshop": False, "adobe": False,
+        "comments": [software] if isinstance(software, str) else []
+    }
+
+def estimate_jpeg_quality(quantization: Dict[int, np.ndarray]) -> Optional[Dict[str, Any]]:
+    """Closest libjpeg quality setting, and whether the tables are exactly libjpeg's"""
+    luminance = quantization.get(0)
+    if luminance is None:
+        return None
+    errors = np.abs(IJG_LUMINANCE - luminance[None, :]).sum(axis=1)
+    chrominance = quantization.get(1)
+    if chrominance is not None:
+        errors = errors + np.abs(IJG_CHROMINANCE - chrominance[None, :]).sum(axis=1)
+    best = int(np.argmin(errors))
+    return {"estimated": best + 1, "standard_tables": bool(errors[best] == 0)}
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    try:
+        return datetime.strptime(str(value)[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+def _editing_software(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    lowered = value.lower()
+    return next((value for name in EDITING_SOFTWARE if name in lowered), None)
+
+def _gray(image: Image.Image) -> np.ndarray:
+    return np.asarray(image.convert("L"), dtype=np.float32)
+
+def compare_thumbnail(data: bytes, thumbnail: bytes, width: int, height: int) -> Dict[str, Any]:
+    """Compare the embedded thumbnail with a 1/8-scale decode of the image"""
+    thumb = _gray(Image.open(io.BytesIO(thumbnail)))
+    thumb_height, thumb_width = thumb.shape
+    comparison = {"width": thumb_width, "height": thumb_height}
+
+    # Thumbnails of a different aspect ratio are letterboxed; only the picture area is compared
+    scale = min(thumb_width / width, thumb_height / height)
+    content_width, content_height = max(1, round(width * scale)), max(1, round(height * scale))
+    left, top = (thumb_width - content_width) // 2, (thumb_height - content_height) // 2
+    content = thumb[top:top + content_height, left:left + content_width]
+    bars = np.concatenate([thumb[:top].ravel(), thumb[top + content_height:].ravel(),
+                           thumb[:, :left].ravel(), thumb[:, left + content_width:].ravel()])
+    if bars.size > 0.04 * thumb.size and (bars.std() > 8 or bars.mean() > 40):
+        # The bars hold picture: the thumbnail shows more than the image (cropped after capture)
+        comparison["aspect_mismatch"] = True
+        return comparison
+    comparison["aspect_mismatch"] = False
+
+    # JPEG decodes at 1/8 scale straight from the DC coefficients
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (max(1, width // 8), max(1, height // 8)))
+    main = _gray(image)
+    size = (min(content_width, main.shape[1]), min(content_height, main.shape[0]))
+    main = cv2.resize(main, size, interpolation=cv2.INTER_AREA)
+    content = cv2.resize(content, size, interpolation=cv2.INTER_AREA)
+
+    # Normalized so the thumbnail encoder's tone and contrast changes do not count
+    a = cv2.GaussianBlur(content, (3, 3), 0)
+    b = cv2.GaussianBlur(main, (3, 3), 0)
+    a = (a - a.mean()) / (a.std() + 1e-6)
+    b = (b - b.mean()) / (b.std() + 1e-6)
+    comparison["correlation"] = round(float((a * b).mean()), 4)
+    cells = cv2.resize(np.abs(a - b), (8, 8), interpolation=cv2.INTER_AREA)
+    comparison["max_cell_difference"] = round(float(cells.max()), 4)
+    return comparison
+
+def analyze_metadata(image_content: bytes, thumbnail_check: bool = True) -> Dict[str, Any]:
+    """Forensic indicators from headers, EXIF, XMP and quantization tables without a full decode"""
+    started = time.perf_counter()
+    try:
+        headers = parse_jpeg_headers(image_content)
+        if headers is not None:
+            headers["format"] = "JPEG"
+        else:
+            headers = _pillow_headers(image_content)
+        exif = parse_exif(headers["exif"]) if headers["exif"] else {}
+        ifd0, exif_ifd = exif.get("ifd0", {}), exif.get("exif", {})
+
+        make, model = ifd0.get(TAG_MAKE), ifd0.get(TAG_MODEL)
+        software = ifd0.get(TAG_SOFTWARE)
+        modified = _parse_datetime(ifd0.get(TAG_DATETIME)) if TAG_DATETIME in ifd0 else None
+        captured = _parse_datetime(exif_ifd.get(TAG_DATETIME_ORIGINAL)) if TAG_DATETIME_ORIGINAL in exif_ifd else None
+
+        xmp = headers["xmp"] or ""
+        creator_tool = next((m.group(1) or m.group(2) for m in _XMP_CREATOR_TOOL.finditer(xmp)), None)
+        xmp_saves = len(_XMP_SAVED.findall(xmp))
+        xmp_agents = sorted({(m.group(1) or m.group(2)).strip() for m in _XMP_AGENT.finditer(xmp)})
+        derived = "xmpMM:DerivedFrom" in xmp
+
+        quality = estimate_jpeg_quality(headers["quantization"])
+        indicators: List[Dict[str, Any]] = []
+
+        editor = _editing_software(software) or _editing_software(creator_tool) or next(
+            (agent for agent in xmp_agents if _editing_software(agent)), None
+        )
+        if editor:
+            indicators.append({"indicator": f"Edited with {editor}", "score": 0.7})
+        elif headers["photoshop"]:
+            indicators.append({"indicator": "Photoshop resource block present", "score": 0.6})
+        if xmp_saves or derived:
+            indicators.append({"indicator": f"XMP edit history ({xmp_saves} saves)", "score": 0.6})
+        if modified and captured and abs((modified - captured).total_seconds()) > MODIFIED_AFTER_CAPTURE_SECONDS:
+            indicators.append({"indicator": "Modified after capture", "score": 0.6})
+
+        camera_fields = any(tag in exif_ifd for tag in (TAG_DATETIME_ORIGINAL, TAG_EXPOSURE_TIME, TAG_FNUMBER, TAG_ISO))
+        if camera_fields and not (make or model):
+            indicators.append({"indicator": "Camera make and model missing from EXIF", "score": 0.5})
+        if (make or model) and quality and quality["standard_tables"]:
+            # Cameras use their own tables; libjpeg's mean the file was re-encoded by software
+            indicators.append({"indicator": f"Camera EXIF but re-encoded with standard tables (quality ~{quality['estimated']})", "score": 0.6})
+        elif quality and quality["estimated"] < 70:
+            indicators.append({"indicator": f"Low JPEG quality (~{quality['estimated']})", "score": 0.4})
+
+        width, height = headers["width"], headers["height"]
+        exif_size = (exif_ifd.get(TAG_PIXEL_X), exif_ifd.get(TAG_PIXEL_Y))
+        if width and all(isinstance(value, int) and value > 0 for value in exif_size):
+            if exif_size not in ((width, height), (height, width)):
+                indicators.append({"indicator": "EXIF dimensions differ from image (resized or cropped)", "score": 0.6})
+
+        thumbnail = None
+        if exif.get("thumbnail") and thumbnail_check and width and height:
+            try:
+                thumbnail = compare_thumbnail(image_content, exif["thumbnail"], width, height)
+            except Exception as e:
+                thumbnail = {"error": f"Thumbnail comparison failed: {str(e)}"}
+            if thumbnail.get("aspect_mismatch"):
+                indicators.append({"indicator": "Embedded thumbnail shows a different crop", "score": 0.8})
+            elif thumbnail.get("correlation", 1.0) < THUMBNAIL_MIN_CORRELATION:
+                indicators.append({"indicator": "Embedded thumbnail does not match image", "score": 0.9})
+            elif thumbnail.get("max_cell_difference", 0.0) > THUMBNAIL_MAX_CELL_DIFF:
+                indicators.append({"indicator": "Part of the image differs from its embedded thumbnail", "score": 0.8})
+
+        return {
+            "format": headers["format"],
+            "width": width,
+            "height": height,
+            "progressive": headers["progressive"],
+            "chroma_sampling": headers["sampling"],
+            "exif_present": bool(exif),
+            "camera": {"make": make, "model": model} if make or model else None,
+            "software": software,
+            "datetime": modified.isoformat() if modified else None,
+            "datetime_original": captured.isoformat() if captured else None,
+            "xmp": {"creator_tool": creator_tool, "saves": xmp_saves, "software_agents": xmp_agents, "derived": derived} if xmp else None,
+            "jpeg_quality": quality,
+            "thumbnail": thumbnail,
+            "indicators": indicators,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    except Exception as e:
+        return {"error": f"Metadata analysis failed: {str(e)}", "indicators": []}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Bring an existing database up to the current schema.
+
+Usage:
+    python migrations.py        # uses DATABASE_URL, e.g. an older ./clario.db
+
+Base.metadata.create_all only creates missing tables, so indexes added to existing tables
+since a database was created are added here. Safe to run any number of times, and from
+several workers at once.
+"""
+
+from sqlalchemy import func, inspect
+from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, engine as default_engine
+from models import DailyUsage
+
+def merge_duplicate_daily_usage(engine) -> int:
+    """Fold duplicate (user_id, usage_date) counters into one row so the unique index can be built"""
+    db = sessionmaker(bind=engine)()
+    try:
+        duplicates = db.query(
+            DailyUsage.user_id, DailyUsage.usage_date,
+            func.sum(DailyUsage.analysis_count), func.min(DailyUsage.id)
+        ).group_by(DailyUsage.user_id, DailyUsage.usage_date).having(func.count(DailyUsage.id) > 1).all()
+
+        for user_id, usage_date, total, keep_id in duplicates:
+            db.query(DailyUsage).filter(DailyUsage.id == keep_id).update({"analysis_count": total})
+            db.query(DailyUsage).filter(
+                DailyUsage.user_id == user_id,
+                DailyUsage.usage_date == usage_date,
+                DailyUsage.id != keep_id
+            ).delete()
+        db.commit()
+        return len(duplicates)
+    finally:
+        db.close()
+
+def _existing_indexes(engine, table_name: str):
+    return {index["name"] for index in inspect(engine).get_indexes(table_name)}
+
+def upgrade_schema(engine=default_engine):
+    """Create missing tables and indexes; returns the names of the indexes that were added"""
+    Base.metadata.create_all(bind=engine)
+
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = _existing_indexes(engine, table.name)
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique and table.name == DailyUsage.__tablename__:
+                merged = merge_duplicate_daily_usage(engine)
+                if merged:
+                    print(f"🔧 Merged {merged} duplicate daily usage counters")
+            try:
+                index.create(bind=engine)
+                created.append(index.name)
+            except (OperationalError, ProgrammingError, IntegrityError):
+                # Another worker created it in the meantime
+                if index.name not in _existing_indexes(engine, table.name):
+                    raise
+    return created
+
+if __name__ == "__main__":
+    created = upgrade_schema()
+    if created:
+        print(f"✅ Added indexes: {', '.join(created)}")
+    else:
+        print("✅ Schema is up to date")
@@ -0,0 +1,93 @@
+"""
+Helpers for the preload-then-fork serving mode (see gunicorn_conf.py).
+
+Models are loaded once in the master process. Their weights are re-pointed at
+memory-mapped safetensors files and frozen, so forked workers share the pages copy-on-write
+instead of each holding a private copy.
+"""
+
+import gc
+import os
+from typing import Dict
+
+import torch
+
+def _safetensors_path(repo_id: str) -> str:
+    if os.path.isdir(repo_id):
+        return os.path.join(repo_id, "model.safetensors")
+    from huggingface_hub import hf_hub_download
+    # from_pretrained has already downloaded the file, so this resolves from the local cache
+    return hf_hub_download(repo_id, "model.safetensors")
+
+def mmap_safetensors_weights(model: torch.nn.Module, repo_id: str) -> int:
+    """Swap the model's parameters for tensors backed by a memory-mapped safetensors file.
+
+    Returns the number of tensors that now live in file-backed pages. Checkpoint keys that
+    do not match the model are left as loaded by from_pretrained.
+    """
+    from safetensors import safe_open
+
+    path = _safetensors_path(repo_id)
+    model_state = model.state_dict()
+    mapped: Dict[str, torch.Tensor] = {}
+    with safe_open(path, framework="pt") as weights:
+        for key in weights.keys():
+            if key in model_state:
+                tensor = weights.get_tensor(key)
+                if tensor.shape == model_state[key].shape and tensor.dtype == model_state[key].dtype:
+                    mapped[key] = tensor
+
+    model.load_state_dict(mapped, strict=False, assign=True)
+    return len(mapped)
+
+def freeze_model(model: torch.nn.Module) -> torch.nn.Module:
+    """Inference-only model: no autograd state is ever written next to the shared weights"""
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    return model
+
+def prepare_for_fork():
+    """Call in the master right before forking workers.
+
+    gc.freeze moves every object loaded so far out of the collector's generations, so
+    collections in the workers do not touch (and thereby copy) the pages holding them.
+    """
+    gc.collect()
+    gc.freeze()
+
+def configure_worker_threads(workers: int) -> int:
+    """Give each forked worker its share of the CPU cores for torch intra-op parallelism"""
+    threads = int(os.getenv("TORCH_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // max(1, workers))
+    torch.set_num_threads(threads)
+    return threads
+
+def memory_usage(pid: int) -> Dict[str, int]:
+    """Resident, proportional, shared and private memory of a process in kB (Linux only)"""
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                usage[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": usage.get("Rss", 0),
+        "pss": usage.get("Pss", 0),
+        "shared": usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0),
+        "private": usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0),
+    }
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python model_sharing.py MASTER_PID  -> memory of the master and every forked worker
+    master = int(sys.argv[1])
+    with open(f"/proc/{master}/task/{master}/children") as children:
+        pids = [master] + [int(pid) for pid in children.read().split()]
+    print(f"{'pid':>8} {'rss MB':>8} {'shared MB':>10} {'private MB':>11} {'pss MB':>8}")
+    for pid in pids:
+        usage = memory_usage(pid)
+        print(
+            f"{pid:>8} {usage['rss'] / 1024:>8.0f} {usage['shared'] / 1024:>10.0f} "
+            f"{usage['private'] / 1024:>11.0f} {usage['pss'] / 1024:>8.0f}"
+        )
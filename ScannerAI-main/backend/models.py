@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Date, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Date, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -33,6 +33,11 @@ class AnalysisResult(Base):
     
     # Relationship
     user = relationship("User", back_populates="analyses")
+    
+    __table_args__ = (
+        # History: WHERE user_id = ? ORDER BY created_at DESC
+        Index("ix_analysis_results_user_created", "user_id", "created_at"),
+    )
 
 class DailyUsage(Base):
     __tablename__ = "daily_usage"
@@ -46,6 +51,11 @@ class DailyUsage(Base):
     
     # Relationship
     user = relationship("User", back_populates="daily_usage")
+    
+    __table_args__ = (
+        # One counter per user and day; also serves WHERE user_id = ? AND usage_date = ?
+        Index("uq_daily_usage_user_date", "user_id", "usage_date", unique=True),
+    )
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -64,5 +74,54 @@ class Subscription(Base):
     
     # Relationship
     user = relationship("User", back_populates="subscriptions")
+    
+    __table_args__ = (
+        # Active subscription: WHERE user_id = ? AND status = 'active' AND end_date > now
+        Index("ix_subscriptions_user_status_end", "user_id", "status", "end_date"),
+    )
 
 
+
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+    
+    name = Column(String, primary_key=True)  # Table the ids are handed out for
+    next_value = Column(Integer, nullable=False)  # First id not yet reserved by any process
+
+class ArchivedAnalysis(Base):
+    __tablename__ = "archived_analyses"
+    
+    id = Column(Integer, primary_key=True)  # Id the row had in analysis_results
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    analysis_type = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    summary = Column(JSON, nullable=False)  # Verdict fields, enough for the history list
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Where the full record lives: a compressed frame of NDJSON lines in a monthly partition
+    archive_path = Column(String, nullable=False)
+    frame_offset = Column(Integer, nullable=False)
+    frame_length = Column(Integer, nullable=False)
+    frame_line = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_archived_analyses_user_created", "user_id", "created_at"),
+    )
+
+class MonthlyUsage(Base):
+    __tablename__ = "monthly_usage"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(Date, nullable=False)  # First day of the month
+    analysis_count = Column(Integer, default=0)
+    
+    __table_args__ = (
+        Index("uq_monthly_usage_user_month", "user_id", "month", unique=True),
+    )
+
+class ArtifactReference(Base):
+    __tablename__ = "artifact_references"
+    
+    name = Column(String, primary_key=True)  # Artifact name in the artifact store
+    ref_count = Column(Integer, nullable=False, default=0)  # analysis_results rows listing it
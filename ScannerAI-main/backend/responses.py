@@ -0,0 +1,182 @@
+"""
+Compact JSON responses for analysis payloads.
+
+Analysis results are rendered straight from the result dict with orjson (the stdlib json
+module is the fallback), without a second pass through Pydantic validation. Floats are
+written at float32 precision: the histograms, scores and probabilities come out of float32
+tensors and OpenCV arrays, so the extra float64 digits carry no information.
+
+CompressionMiddleware gzip- or brotli-compresses complete JSON/text responses above
+RESPONSE_COMPRESSION_MIN_BYTES when the client accepts it; streamed responses (video
+NDJSON, exports) pass through untouched so they still reach the client chunk by chunk.
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+load_dotenv()
+
+# Smaller bodies are sent as they are; compressing them costs more than it saves
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+# Set to false to keep full float64 precision in JSON responses
+RESPONSE_FLOAT32 = os.getenv("RESPONSE_FLOAT32", "true").lower() == "true"
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson", "application/javascript", "image/svg+xml")
+
+def float32_values(value: Any) -> Any:
+    """Copy of a JSON-like value with every float narrowed to float32"""
+    if type(value) is float:
+        return np.float32(value)
+    if isinstance(value, dict):
+        return {key: float32_values(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Histograms and probability vectors become one array, serialized in a single call
+        if value and all(type(item) is float for item in value):
+            return np.asarray(value, dtype=np.float32)
+        return [float32_values(item) for item in value]
+    if isinstance(value, np.ndarray) and value.dtype == np.float64:
+        return value.astype(np.float32)
+    if isinstance(value, np.float64):
+        return np.float32(value)
+    return value
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.floating):
+        # Shortest decimal that reads back as the same float32 / float64
+        return float(str(value))
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return [_default(item) for item in value] if value.dtype.kind == "f" else value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any, float32: bool = RESPONSE_FLOAT32) -> bytes:
+    """Serialize to compact UTF-8 JSON"""
+    if float32:
+        content = float32_values(content)
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class CompactJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson at float32 precision"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def analysis_response(
+    analysis_id: int, analysis_type: str, filename: str, result: Dict[str, Any], created_at: datetime
+) -> CompactJSONResponse:
+    """ImageAnalysisResponse body, serialized directly instead of being re-validated by the response model"""
+    return CompactJSONResponse({
+        "id": analysis_id,
+        "analysis_type": analysis_type,
+        "filename": filename,
+        "result": result,
+        "created_at": created_at
+    })
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best content coding we can produce for an Accept-Encoding header: br, gzip or None"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+
+    wildcard = weights.get("*", 0.0)
+    candidates = (["br"] if BROTLI_AVAILABLE else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = weights.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli compression of complete responses larger than minimum_size"""
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the first body message shows whether the body is complete
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=list(start["headers"]))
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
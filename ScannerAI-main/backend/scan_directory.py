@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Scan a directory tree of images with the analyzers, without going through the HTTP API.
+
+Usage:
+    python scan_directory.py ROOT OUTPUT [--analyses classification,deepfake,forgery] [--format ndjson|parquet]
+                             [--workers N] [--batch-size N] [--checkpoint-every N] [--restart]
+
+The tree is walked lazily in a stable order. A pool of worker processes reads, hashes and
+decodes each image, detects faces and resizes the model inputs, and runs the forgery
+heuristics; this process normalizes the inputs and runs the ViT models on batches of them.
+Results are written in walk order, one row per image, to OUTPUT: a file of JSON lines
+(ndjson) or a directory of Parquet part files (parquet, needs pyarrow).
+
+Every --checkpoint-every images the output is flushed to disk and OUTPUT.checkpoint.json
+records how far the scan got. An interrupted scan (Ctrl-C, SIGTERM, a crash) resumes from
+there when the same command is run again; rows written after the last checkpoint are
+discarded and scanned again, so each image appears exactly once.
+"""
+
+import argparse
+import asyncio
+import collections
+import io
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from dotenv import load_dotenv
+
+import ai_services_fixed
+from ai_services_fixed import ImageAnalysisService, _input_size
+from face_detection import FACE_DETECTION_ENABLED, extract_faces
+from image_datasets import iter_image_files
+from inference_protocol import dumps
+from tiling import normalize_tiles
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+load_dotenv()
+
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "32"))
+SCAN_CHECKPOINT_EVERY = int(os.getenv("SCAN_CHECKPOINT_EVERY", "5000"))
+SCAN_PROGRESS_SECONDS = float(os.getenv("SCAN_PROGRESS_SECONDS", "10"))
+
+ANALYSES = ("classification", "deepfake", "forgery")
+MODEL_ANALYSES = ("classification", "deepfake")
+FORMATS = ("ndjson", "parquet")
+
+# Images decoded ahead of the batch being scored, per worker
+PREFETCH_PER_WORKER = 8
+
+# Row layout of the output; analyses that were not run leave their columns empty
+COLUMNS = (
+    ("path", "string"),
+    ("sha256", "string"),
+    ("bytes", "int64"),
+    ("width", "int32"),
+    ("height", "int32"),
+    ("classification_label", "string"),
+    ("classification_confidence", "float64"),
+    ("deepfake_label", "string"),
+    ("is_deepfake", "bool"),
+    ("deepfake_confidence", "float64"),
+    ("fake_probability", "float64"),
+    ("face_count", "int32"),
+    ("is_forged", "bool"),
+    ("forgery_confidence", "float64"),
+    ("forgery_risk_level", "string"),
+    ("error", "string")
+)
+
+class NdjsonOutput:
+    """Rows as JSON lines appended to one file"""
+
+    def __init__(self, path: str, state: Optional[Dict[str, Any]]):
+        self.path = path
+        self.handle = open(path, "ab")
+        # Rows written after the last checkpoint are scanned again
+        self.handle.truncate(state["output_bytes"] if state else 0)
+        self.handle.seek(0, os.SEEK_END)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.handle.write(b"".join(dumps(row) + b"\n" for row in rows))
+
+    def flush(self) -> Dict[str, Any]:
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        return {"output_bytes": self.handle.tell()}
+
+    def close(self):
+        self.handle.close()
+
+class ParquetOutput:
+    """Rows as a directory of Parquet files, one written per checkpoint"""
+
+    def __init__(self, path: str, state: Optional[Dict[str, Any]]):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.parts = state["parts"] if state else 0
+        self.rows: List[Dict[str, Any]] = []
+        self.schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in COLUMNS])
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            # Parts written after the last checkpoint are scanned again
+            if name.startswith("part-") and name.endswith(".parquet") and int(name[5:-8]) >= self.parts:
+                os.unlink(os.path.join(path, name))
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.rows.extend(rows)
+
+    def flush(self) -> Dict[str, Any]:
+        if self.rows:
+            table = pa.Table.from_pylist(self.rows, schema=self.schema)
+            descriptor, temporary = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+            os.close(descriptor)
+            try:
+                pq.write_table(table, temporary)
+                os.replace(temporary, os.path.join(self.path, f"part-{self.parts:06d}.parquet"))
+            except BaseException:
+                os.unlink(temporary)
+                raise
+            self.parts += 1
+            self.rows = []
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+OUTPUTS = {"ndjson": NdjsonOutput, "parquet": ParquetOutput}
+
+def checkpoint_path(output: str) -> str:
+    return f"{output.rstrip(os.sep)}.checkpoint.json"
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    checkpoint["updated_at"] = datetime.now(timezone.utc).isoformat()
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    with os.fdopen(descriptor, "w") as handle:
+        json.dump(checkpoint, handle, indent=2)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+def _model_input(crops: List[Image.Image], processor) -> np.ndarray:
+    """(count, side, side, 3) uint8 crops resized the way processor resizes them; normalized later, in batches"""
+    side = _input_size(processor)
+    return np.stack([np.asarray(crop.resize((side, side), processor.resample)) for crop in crops])
+
+# Set in each worker process by the pool initializer
+_service: Optional[ImageAnalysisService] = None
+_analyses: List[str] = []
+
+def _init_worker(analyses: List[str]):
+    global _service, _analyses
+    # The parent handles Ctrl-C and shuts the pool down, which terminates workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Parallelism comes from the worker processes
+    cv2.setNumThreads(1)
+    _service = ImageAnalysisService()
+    _analyses = analyses
+
+def _prepare(path: str) -> Dict[str, Any]:
+    """Everything for one image short of the model forward passes"""
+    row: Dict[str, Any] = {"path": path}
+    inputs: Dict[str, np.ndarray] = {}
+    try:
+        with open(path, "rb") as image_file:
+            content = image_file.read()
+        row["sha256"] = hashlib.sha256(content).hexdigest()
+        row["bytes"] = len(content)
+        image = Image.open(io.BytesIO(content))
+        row["width"], row["height"] = image.size
+        image = image.convert("RGB")
+
+        if ai_services_fixed.MODELS_AVAILABLE:
+            if "classification" in _analyses:
+                inputs["classification"] = _model_input([image], ai_services_fixed.VIT_PROCESSOR)
+            if "deepfake" in _analyses:
+                # As in the deepfake endpoint: every detected face, or the whole image without any
+                faces = extract_faces(np.asarray(image)) if FACE_DETECTION_ENABLED else []
+                row["face_count"] = len(faces)
+                inputs["deepfake"] = _model_input([crop for _, crop in faces] or [image], ai_services_fixed.DEEPFAKE_PROCESSOR)
+        else:
+            # Without the models both analyses fall back to heuristics, which are done here
+            if "classification" in _analyses:
+                result = _checked(_service._analyze_classification_sync(content))
+                row["classification_label"] = result["predicted_label"]
+                row["classification_confidence"] = result["confidence"]
+            if "deepfake" in _analyses:
+                result = _checked(_service._analyze_deepfake_sync(content))
+                row["deepfake_label"] = result["predicted_label"]
+                row["is_deepfake"] = bool(result["is_deepfake"])
+                row["deepfake_confidence"] = result["confidence"]
+
+        if "forgery" in _analyses:
+            result = _checked(_service._analyze_forgery_sync(content))
+            row["is_forged"] = bool(result["is_forged"])
+            row["forgery_confidence"] = result["confidence"]
+            row["forgery_risk_level"] = result["risk_level"]
+    except UnidentifiedImageError:
+        return {"row": {"path": path, "error": "Not a readable image"}, "inputs": {}}
+    except Exception as e:
+        return {"row": {"path": path, "error": str(e)}, "inputs": {}}
+    return {"row": row, "inputs": inputs}
+
+def _checked(result: Dict[str, Any]) -> Dict[str, Any]:
+    if not result.get("success"):
+        raise RuntimeError(result.get("error", "analysis failed"))
+    return result
+
+def prefetched(pool, paths: Iterator[str], window: int) -> Iterator[Dict[str, Any]]:
+    """Prepared images in walk order, with at most window of them in flight"""
+    pending = collections.deque()
+    for path in paths:
+        pending.append(pool.apply_async(_prepare, (path,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+class BatchScorer:
+    """Runs the ViT models over the inputs of a batch of prepared images"""
+
+    def __init__(self, service: ImageAnalysisService, batch_size: int):
+        self.service = service
+        self.batch_size = batch_size
+
+    def _probabilities(self, analysis: str, inputs: np.ndarray) -> "torch.Tensor":
+        torch = ai_services_fixed.torch
+        if analysis == "classification":
+            processor, model = ai_services_fixed.VIT_PROCESSOR, ai_services_fixed.VIT_MODEL
+        else:
+            processor, model = ai_services_fixed.DEEPFAKE_PROCESSOR, ai_services_fixed.DEEPFAKE_MODEL
+        rows = []
+        with torch.no_grad():
+            for start in range(0, len(inputs), self.batch_size):
+                pixel_values = torch.from_numpy(normalize_tiles(inputs[start:start + self.batch_size], processor))
+                logits = self.service._model_logits(model, {"pixel_values": pixel_values})
+                rows.append(torch.nn.functional.softmax(logits, dim=-1))
+        return torch.cat(rows)
+
+    def score(self, prepared: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for analysis in MODEL_ANALYSES:
+            items = [item for item in prepared if analysis in item["inputs"]]
+            if not items:
+                continue
+            probabilities = self._probabilities(analysis, np.concatenate([item["inputs"][analysis] for item in items]))
+            start = 0
+            for item in items:
+                count = len(item["inputs"][analysis])
+                rows, start = probabilities[start:start + count], start + count
+                if analysis == "classification":
+                    class_id = int(rows[0].argmax().item())
+                    item["row"]["classification_label"] = ai_services_fixed.VIT_MODEL.config.id2label[class_id]
+                    item["row"]["classification_confidence"] = float(rows[0][class_id].item())
+                else:
+                    # The image is as suspicious as its most suspicious face
+                    verdict = max(self.service._deepfake_scores(rows), key=lambda score: score["fake_probability"])
+                    item["row"]["deepfake_label"] = verdict["predicted_label"]
+                    item["row"]["is_deepfake"] = verdict["is_deepfake"]
+                    item["row"]["deepfake_confidence"] = verdict["confidence"]
+                    item["row"]["fake_probability"] = verdict["fake_probability"]
+        return [item["row"] for item in prepared]
+
+class Progress:
+    def __init__(self, done: int, interval: float = SCAN_PROGRESS_SECONDS):
+        self.started = time.perf_counter()
+        self.interval = interval
+        self.done_before = done
+        self.scanned = 0
+        self.errors = 0
+        self.last_time = self.started
+        self.last_scanned = 0
+
+    def update(self, rows: List[Dict[str, Any]]):
+        self.scanned += len(rows)
+        self.errors += sum(1 for row in rows if "error" in row)
+        now = time.perf_counter()
+        if now - self.last_time >= self.interval:
+            recent = (self.scanned - self.last_scanned) / (now - self.last_time)
+            print(
+                f"🔎 {self.done_before + self.scanned:,} images scanned, {recent:.1f} images/sec "
+                f"({self.rate():.1f} average), {self.errors} errors"
+            )
+            self.last_time, self.last_scanned = now, self.scanned
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.scanned / elapsed if elapsed else 0.0
+
+class StopRequest:
+    """Set by SIGINT/SIGTERM; the scan stops between batches so the checkpoint matches the output"""
+
+    def __init__(self):
+        self.requested = False
+
+    def __call__(self, signum, frame):
+        if self.requested:
+            # A second Ctrl-C stops at once, giving up the rows since the last checkpoint
+            raise KeyboardInterrupt
+        print("\n⏸️ Stopping after the current batch...")
+        self.requested = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every image under a directory, resumably")
+    parser.add_argument("root", help="Directory to scan (searched recursively)")
+    parser.add_argument("output", help="Output file (ndjson) or directory (parquet)")
+    parser.add_argument("--analyses", default=",".join(ANALYSES), help="Comma-separated analyses to run")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Decode worker processes")
+    parser.add_argument("--batch-size", type=int, default=SCAN_BATCH_SIZE, help="Model inputs per forward pass")
+    parser.add_argument("--checkpoint-every", type=int, default=SCAN_CHECKPOINT_EVERY, help="Images between checkpoints")
+    parser.add_argument("--restart", action="store_true", help="Discard any earlier output and checkpoint and start over")
+    args = parser.parse_args()
+
+    analyses = [analysis.strip() for analysis in args.analyses.split(",") if analysis.strip()]
+    unknown = set(analyses) - set(ANALYSES)
+    if unknown:
+        print(f"❌ Unknown analyses: {', '.join(sorted(unknown))} (choose from {', '.join(ANALYSES)})")
+        return 1
+    if args.format == "parquet" and not PYARROW_AVAILABLE:
+        print("❌ Parquet output needs pyarrow (pip install pyarrow)")
+        return 1
+
+    service = ImageAnalysisService()
+    # What a resumed scan has to match, so one output never mixes settings
+    scan = {
+        "root": os.path.abspath(args.root),
+        "analyses": analyses,
+        "format": args.format,
+        "model_versions": {analysis: asyncio.run(service.model_version(analysis)) for analysis in MODEL_ANALYSES if analysis in analyses}
+    }
+
+    checkpoint_file = checkpoint_path(args.output)
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_file)
+    if checkpoint is not None:
+        if any(checkpoint.get(key) != value for key, value in scan.items()):
+            print(f"❌ {checkpoint_file} is from a scan with other settings; pass --restart to start over")
+            return 1
+        if checkpoint.get("completed"):
+            print(f"✅ Scan already completed: {checkpoint['scanned']:,} images in {args.output}")
+            return 0
+        print(f"⏯️ Resuming after {checkpoint['scanned']:,} images ({checkpoint['last_path']})")
+    elif os.path.exists(args.output) and not args.restart:
+        print(f"❌ {args.output} exists without a checkpoint; pass --restart to overwrite it")
+        return 1
+
+    output = OUTPUTS[args.format](args.output, checkpoint)
+    state = checkpoint or {**scan, "scanned": 0, "errors": 0, "last_path": None, **output.flush()}
+    after = state["last_path"].split("/") if state["last_path"] else None
+    paths = iter_image_files(scan["root"], after)
+
+    scorer = BatchScorer(service, args.batch_size)
+    progress = Progress(state["scanned"])
+    workers = max(1, args.workers)
+    since_checkpoint = 0
+
+    stop = StopRequest()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    pool = multiprocessing.Pool(workers, _init_worker, (analyses,))
+    try:
+        batch: List[Dict[str, Any]] = []
+        for prepared in prefetched(pool, paths, workers * PREFETCH_PER_WORKER):
+            batch.append(prepared)
+            if len(batch) >= args.batch_size:
+                since_checkpoint += _write_batch(scorer, output, state, progress, batch)
+                batch = []
+                if since_checkpoint >= args.checkpoint_every:
+                    state.update(output.flush())
+                    save_checkpoint(checkpoint_file, state)
+                    since_checkpoint = 0
+            if stop.requested:
+                break
+        else:
+            if batch:
+                _write_batch(scorer, output, state, progress, batch)
+            state["completed"] = True
+        # Rows are written in walk order, so everything written so far is covered by the checkpoint
+        state.update(output.flush())
+        save_checkpoint(checkpoint_file, state)
+    finally:
+        pool.terminate()
+        pool.join()
+        output.close()
+
+    print(f"📊 Scanned {progress.scanned:,} images at {progress.rate():.1f} images/sec ({progress.errors} errors)")
+    print(f"   Total: {state['scanned']:,} images ({state['errors']} errors) in {args.output}")
+    if not state.get("completed"):
+        print("⏸️ Interrupted; run the same command again to resume")
+        return 130
+    print("✅ Scan completed")
+    return 0
+
+def _write_batch(scorer: BatchScorer, output, state: Dict[str, Any], progress: Progress, batch: List[Dict[str, Any]]) -> int:
+    rows = scorer.score(batch)
+    for row in rows:
+        row["path"] = os.path.relpath(row["path"], state["root"]).replace(os.sep, "/")
+    output.write(rows)
+    state["scanned"] += len(rows)
+    state["errors"] += sum(1 for row in rows if "error" in row)
+    state["last_path"] = rows[-1]["path"]
+    progress.update(rows)
+    return len(rows)
+
+if __name__ == "__main__":
+    sys.exit(main())
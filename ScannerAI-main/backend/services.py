@@ -1,5 +1,8 @@
 from sqlalchemy.orm import Session
-from models import User, AnalysisResult
+from models import User, AnalysisResult, ArchivedAnalysis
+from artifacts import count_references
+from maintenance import load_archived_result
+from write_behind import persistence
 from schemas import UserCreate
 from auth import generate_verification_code
 import smtplib
@@ -121,12 +124,15 @@ async def save_analysis_result(
 ):
     """Save analysis result to database"""
     analysis = AnalysisResult(
+        # Ids come from the same reserved blocks as the write-behind inserts, so they never collide
+        id=persistence.analysis_ids.allocate(),
         user_id=user_id,
         analysis_type=analysis_type,
         filename=filename,
         result=result
     )
     db.add(analysis)
+    count_references(db, [result], 1)
     db.commit()
     db.refresh(analysis)
     return analysis
@@ -137,6 +143,11 @@ async def get_user_history(db: Session, user_id: int) -> List[Dict[str, Any]]:
         AnalysisResult.user_id == user_id
     ).order_by(AnalysisResult.created_at.desc()).all()
     
+    # Archived analyses are listed with their summary; the full result is loaded on demand
+    archived = db.query(ArchivedAnalysis).filter(
+        ArchivedAnalysis.user_id == user_id
+    ).order_by(ArchivedAnalysis.created_at.desc()).all()
+    
     return [
         {
             "id": analysis.id,
@@ -146,6 +157,47 @@ async def get_user_history(db: Session, user_id: int) -> List[Dict[str, Any]]:
             "created_at": analysis.created_at
         }
         for analysis in analyses
+    ] + [
+        {
+            "id": analysis.id,
+            "analysis_type": analysis.analysis_type,
+            "filename": analysis.filename,
+            "result": analysis.summary,
+            "created_at": analysis.created_at,
+            "archived": True
+        }
+        for analysis in archived
     ]
 
+async def get_analysis(db: Session, user_id: int, analysis_id: int) -> Dict[str, Any]:
+    """Get one analysis with its full result, reading it back from the archive if needed"""
+    analysis = db.query(AnalysisResult).filter(
+        AnalysisResult.id == analysis_id,
+        AnalysisResult.user_id == user_id
+    ).first()
+    if analysis:
+        return {
+            "id": analysis.id,
+            "analysis_type": analysis.analysis_type,
+            "filename": analysis.filename,
+            "result": analysis.result,
+            "created_at": analysis.created_at
+        }
+    
+    archived = db.query(ArchivedAnalysis).filter(
+        ArchivedAnalysis.id == analysis_id,
+        ArchivedAnalysis.user_id == user_id
+    ).first()
+    if not archived:
+        raise Exception("Analysis not found")
+    record = load_archived_result(archived)
+    return {
+        "id": archived.id,
+        "analysis_type": archived.analysis_type,
+        "filename": archived.filename,
+        "result": record["result"],
+        "created_at": archived.created_at,
+        "archived": True
+    }
+
 
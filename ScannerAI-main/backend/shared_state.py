@@ -0,0 +1,254 @@
+"""
+State shared by every API node: daily quota counters, cached analysis results and
+single-flight locks.
+
+SHARED_STATE_URL picks the backend:
+    memory://            - this process only (default); right for a single worker
+    redis://[:password@]host:port[/db]
+                         - any server speaking the Redis protocol, so every node behind the
+                           load balancer sees the same counters, results and locks
+
+Both give the same guarantees: increment_within_limit is atomic (however many nodes race,
+no more than `limit` increments succeed), and entries expire after their TTL. The Redis
+client needs nothing beyond the standard library and uses only plain commands (SET NX/PX,
+INCR, DECR, WATCH/MULTI/EXEC), so no server-side scripting is required.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "memory://")
+# Entries kept by the in-process backend before the least recently used are dropped
+SHARED_STATE_MAX_ENTRIES = int(os.getenv("SHARED_STATE_MAX_ENTRIES", "4096"))
+SHARED_STATE_TIMEOUT_SECONDS = float(os.getenv("SHARED_STATE_TIMEOUT_SECONDS", "2"))
+
+class SharedStateError(Exception):
+    pass
+
+class InProcessState:
+    """Shared state of one process: a dict with expiry times behind a lock"""
+
+    def __init__(self, max_entries: int = SHARED_STATE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value: Any, ttl_seconds: Optional[float]):
+        self.entries[key] = (value, time.monotonic() + ttl_seconds if ttl_seconds else None)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            value = self._live(key)
+        return value if isinstance(value, bytes) else None
+
+    def counter(self, key: str) -> int:
+        with self.lock:
+            value = self._live(key)
+        return value if isinstance(value, int) else 0
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        with self.lock:
+            self._store(key, value, ttl_seconds)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def increment_within_limit(self, key: str, limit: int, ttl_seconds: float, initial: int = 0) -> Optional[int]:
+        """Add one to a counter (created at `initial`) unless that takes it past limit; the new value or None"""
+        with self.lock:
+            value = self._live(key)
+            if value is None:
+                value = initial
+                self._store(key, value, ttl_seconds)
+            if value >= limit:
+                return None
+            # Keeps the expiry set when the counter was created
+            self.entries[key] = (value + 1, self.entries[key][1])
+            return value + 1
+
+    def decrement(self, key: str):
+        with self.lock:
+            value = self._live(key)
+            if value is not None:
+                self.entries[key] = (max(0, value - 1), self.entries[key][1])
+
+    def acquire_lock(self, key: str, ttl_seconds: float) -> Optional[str]:
+        """Token for a lock nobody else holds, or None; the lock lapses after ttl_seconds"""
+        with self.lock:
+            if self._live(key) is not None:
+                return None
+            token = uuid.uuid4().hex
+            self._store(key, token, ttl_seconds)
+            return token
+
+    def release_lock(self, key: str, token: str) -> bool:
+        """Release a lock if it is still the one this token acquired"""
+        with self.lock:
+            if self._live(key) != token:
+                return False
+            del self.entries[key]
+            return True
+
+class _RedisConnection:
+    def __init__(self, host: str, port: int, password: Optional[str], db: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.execute(("AUTH", password))
+        if db:
+            self.execute(("SELECT", db))
+
+    def execute(self, *commands) -> List[Any]:
+        """Send the commands in one write and read their replies in order"""
+        payload = bytearray()
+        for command in commands:
+            payload += b"*%d\r\n" % len(command)
+            for part in command:
+                if not isinstance(part, bytes):
+                    part = str(part).encode()
+                payload += b"$%d\r\n%s\r\n" % (len(part), part)
+        self.sock.sendall(payload)
+        return [self._read_reply() for _ in commands]
+
+    def _read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the shared state server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise SharedStateError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise SharedStateError(f"Unexpected reply from the shared state server: {line!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class RedisState:
+    """Shared state on a Redis-protocol server, one connection per thread"""
+
+    def __init__(self, url: str, timeout: float = SHARED_STATE_TIMEOUT_SECONDS):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self) -> _RedisConnection:
+        connection = getattr(self.local, "connection", None)
+        # Connections are not shared with a forked child
+        if connection is None or self.local.pid != os.getpid():
+            connection = _RedisConnection(self.host, self.port, self.password, self.db, self.timeout)
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def _execute(self, *commands) -> List[Any]:
+        try:
+            return self._connection().execute(*commands)
+        except (OSError, ValueError) as e:
+            # A broken connection is replaced on the next call
+            connection = getattr(self.local, "connection", None)
+            if connection is not None:
+                connection.close()
+                self.local.connection = None
+            raise SharedStateError(f"Shared state server unavailable: {e}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._execute(("GET", key))[0]
+
+    def counter(self, key: str) -> int:
+        return int(self._execute(("GET", key))[0] or 0)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        self._execute(("SET", key, value, "PX", max(1, int(ttl_seconds * 1000))))
+
+    def delete(self, key: str):
+        self._execute(("DEL", key))
+
+    def increment_within_limit(self, key: str, limit: int, ttl_seconds: float, initial: int = 0) -> Optional[int]:
+        """Add one to a counter (created at `initial`) unless that takes it past limit; the new value or None"""
+        # INCR is atomic on the server, so exactly the increments that land at or below the
+        # limit succeed; the ones past it are taken back
+        _, value = self._execute(
+            ("SET", key, initial, "NX", "PX", max(1, int(ttl_seconds * 1000))),
+            ("INCR", key)
+        )
+        if value > limit:
+            self.decrement(key)
+            return None
+        return value
+
+    def decrement(self, key: str):
+        if self._execute(("DECR", key))[0] <= 0:
+            # A counter that expired in the meantime would otherwise live on without a TTL
+            self._execute(("DEL", key))
+
+    def acquire_lock(self, key: str, ttl_seconds: float) -> Optional[str]:
+        """Token for a lock nobody else holds, or None; the lock lapses after ttl_seconds"""
+        token = uuid.uuid4().hex
+        reply = self._execute(("SET", key, token, "NX", "PX", max(1, int(ttl_seconds * 1000))))[0]
+        return token if reply == "OK" else None
+
+    def release_lock(self, key: str, token: str) -> bool:
+        """Release a lock if it is still the one this token acquired"""
+        # WATCH makes the DEL fail if the lock lapsed and was taken by someone else after the GET
+        _, holder = self._execute(("WATCH", key), ("GET", key))
+        if holder != token.encode():
+            self._execute(("UNWATCH",))
+            return False
+        replies = self._execute(("MULTI",), ("DEL", key), ("EXEC",))
+        return replies[-1] is not None
+
+def open_shared_state(url: str = SHARED_STATE_URL):
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return InProcessState()
+    if scheme == "redis":
+        return RedisState(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {scheme}")
+
+shared_state = open_shared_state()
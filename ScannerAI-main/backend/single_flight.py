@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from admission import ANALYSIS_DEADLINE_SECONDS, AdmissionRejected
+from inference_protocol import dumps, loads
+from shared_state import SharedStateError
+
+load_dotenv()
+
+# Successful results are kept this long in the shared state, just long enough for the other
+# nodes waiting on the same analysis to pick them up; a later upload of the same image is
+# analyzed again. 0 disables the cache (and with it joining another node's analysis)
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "5"))
+# A node that dies mid-analysis holds its lock at most this long
+SINGLE_FLIGHT_LOCK_TTL_SECONDS = float(os.getenv("SINGLE_FLIGHT_LOCK_TTL_SECONDS", "60"))
+SINGLE_FLIGHT_POLL_SECONDS = 0.05
+
+def content_key(analysis_type: str, model_version: str, content: bytes, **options) -> str:
+    """Requests with equal keys are guaranteed to produce the same analysis result"""
+    option_text = ",".join(f"{name}={options[name]}" for name in sorted(options))
+    return f"{analysis_type}|{model_version}|{option_text}|{hashlib.sha256(content).hexdigest()}"
+
+class _Flight:
+    __slots__ = ("task", "callers")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.callers = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key starts the work; callers arriving while it is in flight
+    await the same result instead of running it again. The work is cancelled only when
+    every caller waiting for it has gone away.
+
+    With a shared state, the same holds across processes and nodes: a lock in the shared
+    state picks the one node that runs the work, and the others wait for its result to
+    appear in the shared result cache.
+    """
+
+    def __init__(self, state=None, result_ttl: float = RESULT_CACHE_TTL_SECONDS):
+        self.flights: Dict[str, _Flight] = {}
+        self.state = state
+        self.result_ttl = result_ttl
+        self.calls = 0
+        self.executions = 0
+        self.cache_hits = 0
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        """Result of work() for key; deadline bounds the wait for another node running it"""
+        self.calls += 1
+        flight = self.flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = _Flight(asyncio.ensure_future(self._across_nodes(key, work, deadline)))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+
+        flight.callers += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.callers == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.callers -= 1
+
+    async def _across_nodes(self, key: str, work: Callable[[], Awaitable[Any]], deadline: Optional[float]) -> Any:
+        if self.state is None:
+            return await work()
+        result_key, lock_key = f"result:{key}", f"lock:{key}"
+        expires_at = time.monotonic() + (deadline or ANALYSIS_DEADLINE_SECONDS)
+        try:
+            while True:
+                cached = self.state.get(result_key)
+                if cached is not None:
+                    self.cache_hits += 1
+                    return loads(cached)
+                token = self.state.acquire_lock(lock_key, SINGLE_FLIGHT_LOCK_TTL_SECONDS)
+                if token is not None:
+                    break
+                # Another node is running this analysis; its result lands in the cache, or
+                # its lock goes away and this node takes over
+                if time.monotonic() >= expires_at:
+                    raise AdmissionRejected(
+                        "Request deadline expired waiting for another node's analysis", SINGLE_FLIGHT_POLL_SECONDS
+                    )
+                await asyncio.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+        except SharedStateError as e:
+            print(f"⚠️ Shared state unavailable, analyzing without it: {e}")
+            return await work()
+
+        try:
+            result = await work()
+            # Failures are not cached, so the next request tries again
+            if self.result_ttl > 0 and isinstance(result, dict) and "error" not in result:
+                self.state.set(result_key, dumps(result), self.result_ttl)
+            return result
+        finally:
+            try:
+                self.state.release_lock(lock_key, token)
+            except SharedStateError:
+                pass
+
+    def _land(self, key: str, flight: _Flight):
+        # Later identical requests start a fresh execution
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        coalesced = self.calls - self.executions
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "coalescing_ratio": coalesced / self.calls if self.calls else 0.0,
+            "result_cache_hits": self.cache_hits,
+            "in_flight": len(self.flights)
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        return [f"clario_single_flight_{name} {value}" for name, value in self.metrics().items()]
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Frequency-domain detector for the periodic artifacts of GAN / diffusion upsampling.
+
+A fixed-size centre crop of the grayscale plane (never resampled, which would wipe the
+artifacts out) is windowed and transformed; features come from the azimuthally averaged
+power spectrum (its power-law slope and how the high band departs from it) and from the
+power at the frequencies of 2x, 4x and 8x upsampling grids. A logistic model fitted on
+local data turns them into a probability.
+
+Crops from concurrent requests are transformed together: a worker thread takes whatever
+crops are queued and runs one batched rfft2 over them.
+
+Usage:
+    python spectral_analysis.py fit DATASET_DIR [--output spectral_model.json]
+    python spectral_analysis.py score IMAGE [IMAGE ...]
+
+DATASET_DIR is laid out as <root>/<label>/.../<image>, with labels such as real/fake
+(see image_datasets.py).
+"""
+
+import json
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPECTRAL_ANALYSIS_ENABLED = os.getenv("SPECTRAL_ANALYSIS_ENABLED", "true").lower() == "true"
+SPECTRAL_CROP_SIZE = int(os.getenv("SPECTRAL_CROP_SIZE", "256"))
+SPECTRAL_MODEL_PATH = os.getenv(
+    "SPECTRAL_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spectral_model.json")
+)
+# Probability above which the spectrum counts as a deepfake indicator
+SPECTRAL_THRESHOLD = float(os.getenv("SPECTRAL_THRESHOLD", "0.5"))
+SPECTRAL_BATCH_SIZE = int(os.getenv("SPECTRAL_BATCH_SIZE", "8"))
+
+RADIAL_BINS = 64
+# Band (cycles/pixel) the power law is fitted on, and the high band checked against it
+FIT_BAND = (0.05, 0.35)
+HIGH_BAND = (0.35, 0.5)
+UPSAMPLING_PERIODS = (2, 4, 8)
+
+FEATURE_NAMES = ["slope", "high_band_mean_residual", "high_band_max_residual"] + [
+    f"peak_period_{period}" for period in UPSAMPLING_PERIODS
+]
+
+class _Geometry:
+    """Radial bins, fit matrices and peak positions for one crop size, computed once"""
+
+    def __init__(self, size: int):
+        fy = np.fft.fftfreq(size)[:, None]
+        fx = np.fft.rfftfreq(size)[None, :]
+        radius = np.sqrt(fx ** 2 + fy ** 2).ravel()
+        bins = np.minimum((radius / 0.5 * RADIAL_BINS).astype(np.int64), RADIAL_BINS)
+        # Drop the DC term and the corners beyond Nyquist
+        valid = np.flatnonzero((radius > 0) & (bins < RADIAL_BINS))
+        order = valid[np.argsort(bins[valid], kind="stable")]
+        sorted_bins = bins[order]
+        self.order = order
+        self.starts = np.searchsorted(sorted_bins, np.arange(RADIAL_BINS))
+        self.counts = np.bincount(sorted_bins, minlength=RADIAL_BINS).astype(np.float64)
+        self.window = np.outer(np.hanning(size), np.hanning(size)).astype(np.float32)
+
+        centres = (np.arange(RADIAL_BINS) + 0.5) / RADIAL_BINS * 0.5
+        self.log_frequency = np.log10(centres)
+        self.fit_bins = np.flatnonzero((centres >= FIT_BAND[0]) & (centres < FIT_BAND[1]))
+        self.high_bins = np.flatnonzero((centres >= HIGH_BAND[0]) & (centres <= HIGH_BAND[1]))
+        design = np.stack([self.log_frequency[self.fit_bins], np.ones(len(self.fit_bins))], axis=1)
+        self.fit_pinv = np.linalg.pinv(design)
+
+        self.peaks = []
+        for period in UPSAMPLING_PERIODS:
+            step = size // period
+            positions = [(0, step), (step, 0), (step, step), ((size - step) % size, step)]
+            rows = np.array([row for row, _ in positions])
+            columns = np.array([column for _, column in positions])
+            flat = rows * (size // 2 + 1) + columns
+            self.peaks.append((flat, bins[flat].clip(0, RADIAL_BINS - 1)))
+
+_geometries: Dict[int, _Geometry] = {}
+
+def _geometry(size: int) -> _Geometry:
+    if size not in _geometries:
+        _geometries[size] = _Geometry(size)
+    return _geometries[size]
+
+def prepare_crop(gray: np.ndarray, size: int = SPECTRAL_CROP_SIZE) -> np.ndarray:
+    """Windowed, zero-mean centre crop; smaller images are zero-padded rather than resized"""
+    height, width = gray.shape[:2]
+    side = min(size, height, width)
+    top, left = (height - side) // 2, (width - side) // 2
+    crop = gray[top:top + side, left:left + side].astype(np.float32)
+    crop -= crop.mean()
+    crop *= _geometry(side).window
+    if side < size:
+        crop = np.pad(crop, ((0, size - side), (0, size - side)))
+    return crop
+
+def spectral_features(crops: np.ndarray) -> np.ndarray:
+    """Feature matrix (batch, len(FEATURE_NAMES)) for a stack of prepared crops"""
+    batch, size = crops.shape[0], crops.shape[1]
+    geometry = _geometry(size)
+    spectrum = np.fft.rfft2(crops)
+    power = (spectrum.real ** 2 + spectrum.imag ** 2).reshape(batch, -1).astype(np.float64) + 1e-12
+
+    sums = np.add.reduceat(power[:, geometry.order], geometry.starts, axis=1)
+    profile = np.log10(sums / geometry.counts)
+
+    slope, intercept = (profile[:, geometry.fit_bins] @ geometry.fit_pinv.T).T
+    trend = intercept[:, None] + slope[:, None] * geometry.log_frequency[None, :]
+    residual = (profile - trend)[:, geometry.high_bins]
+
+    columns = [slope, residual.mean(axis=1), residual.max(axis=1)]
+    for flat, bins in geometry.peaks:
+        columns.append((np.log10(power[:, flat]) - profile[:, bins]).mean(axis=1))
+    return np.stack(columns, axis=1)
+
+def _sigmoid(values: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-values))
+
+class SpectralModel:
+    """Logistic regression on standardized spectral features"""
+
+    def __init__(self, mean, std, weights, bias: float, crop_size: int, info: Optional[Dict[str, Any]] = None):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.crop_size = int(crop_size)
+        self.info = info or {}
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return _sigmoid(((features - self.mean) / self.std) @ self.weights + self.bias)
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: np.ndarray, crop_size: int, l2: float = 1e-2, **info) -> "SpectralModel":
+        """Newton / IRLS fit with an L2 penalty on the weights"""
+        mean = features.mean(axis=0)
+        std = features.std(axis=0) + 1e-9
+        x = np.hstack([(features - mean) / std, np.ones((len(features), 1))])
+        penalty = np.eye(x.shape[1]) * l2
+        penalty[-1, -1] = 0.0
+        w = np.zeros(x.shape[1])
+        for _ in range(100):
+            p = _sigmoid(x @ w)
+            gradient = x.T @ (p - labels) + penalty @ w
+            hessian = (x * (p * (1 - p))[:, None]).T @ x + penalty
+            step = np.linalg.solve(hessian + 1e-9 * np.eye(len(w)), gradient)
+            w -= step
+            if np.abs(step).max() < 1e-8:
+                break
+        return cls(mean, std, w[:-1], w[-1], crop_size, info)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "features": FEATURE_NAMES,
+            "crop_size": self.crop_size,
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "weights": self.weights.tolist(),
+            "bias": self.bias,
+            **self.info
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "SpectralModel":
+        if data.get("features") != FEATURE_NAMES:
+            raise ValueError("Spectral model was fitted on a different feature set; fit it again")
+        info = {key: value for key, value in data.items() if key not in ("features", "crop_size", "mean", "std", "weights", "bias")}
+        return cls(data["mean"], data["std"], data["weights"], data["bias"], data["crop_size"], info)
+
+def load_model(path: str = SPECTRAL_MODEL_PATH) -> Optional[SpectralModel]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as model_file:
+            return SpectralModel.from_json(json.load(model_file))
+    except Exception as e:
+        print(f"Spectral model not loaded: {e}")
+        return None
+
+SPECTRAL_MODEL = load_model() if SPECTRAL_ANALYSIS_ENABLED else None
+
+class SpectralBatcher:
+    """Runs the FFTs of crops queued by concurrent requests as one batch"""
+
+    def __init__(self, batch_size: int = SPECTRAL_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.queue: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.thread_pid = None
+        self.start_lock = threading.Lock()
+        self.batches = 0
+        self.crops = 0
+
+    def _ensure_worker(self):
+        # Started lazily (and again after a fork), since threads do not survive fork()
+        if self.thread is not None and self.thread_pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.thread is None or self.thread_pid != os.getpid() or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="spectral-batcher", daemon=True)
+                self.thread_pid = os.getpid()
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            # No waiting: whatever queued up while the previous batch ran joins this one
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_size: Dict[int, List[Tuple[np.ndarray, Future]]] = {}
+            for item in items:
+                by_size.setdefault(item[0].shape[0], []).append(item)
+            for group in by_size.values():
+                try:
+                    features = spectral_features(np.stack([crop for crop, _ in group]))
+                    for row, (_, future) in zip(features, group):
+                        future.set_result(row)
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+            self.batches += 1
+            self.crops += len(items)
+
+    def features(self, crop: np.ndarray) -> np.ndarray:
+        """Feature vector of one prepared crop, computed in the next batch"""
+        self._ensure_worker()
+        future: Future = Future()
+        self.queue.put((crop, future))
+        return future.result()
+
+batcher = SpectralBatcher()
+
+def analyze_gray(gray: np.ndarray, model: Optional[SpectralModel] = None) -> Dict[str, Any]:
+    """Spectral features of a full-resolution grayscale plane and, with a fitted model, a GAN probability"""
+    model = model or SPECTRAL_MODEL
+    size = model.crop_size if model else SPECTRAL_CROP_SIZE
+    features = batcher.features(prepare_crop(gray, size))
+    score = float(model.predict(features[None, :])[0]) if model else None
+    return {
+        "features": {name: round(float(value), 4) for name, value in zip(FEATURE_NAMES, features)},
+        "gan_probability": score,
+        "is_synthetic": score >= SPECTRAL_THRESHOLD if score is not None else None,
+        "crop_size": size
+    }
+
+def _dataset_features(root: str, size: int, limit: Optional[int]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    from image_datasets import iter_labeled_images, is_positive_label
+    from image_metrics import MetricContext
+
+    rows, labels, paths = [], [], []
+    for path, label in iter_labeled_images(root):
+        positive = is_positive_label(label)
+        if positive is None:
+            continue
+        with open(path, "rb") as image_file:
+            # Same grayscale plane the API computes, so fitted and served features agree
+            gray = MetricContext(image_file.read()).get("gray")
+        rows.append(prepare_crop(gray, size))
+        labels.append(1.0 if positive else 0.0)
+        paths.append(path)
+        if limit and len(rows) >= limit:
+            break
+    features = np.concatenate([spectral_features(np.stack(rows[i:i + 64])) for i in range(0, len(rows), 64)]) if rows else np.empty((0, len(FEATURE_NAMES)))
+    return features, np.array(labels), paths
+
+def _accuracy(model: SpectralModel, features: np.ndarray, labels: np.ndarray) -> float:
+    return float(((model.predict(features) >= 0.5) == (labels == 1)).mean())
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Fit or apply the spectral GAN-artifact model")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit_parser = commands.add_parser("fit", help="Fit the logistic model on a labeled image folder")
+    fit_parser.add_argument("dataset", help="Folder laid out as <label>/.../<image>, e.g. real/ and fake/")
+    fit_parser.add_argument("--output", default=SPECTRAL_MODEL_PATH)
+    fit_parser.add_argument("--crop-size", type=int, default=SPECTRAL_CROP_SIZE)
+    fit_parser.add_argument("--l2", type=float, default=1e-2)
+    fit_parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    score_parser = commands.add_parser("score", help="Print the GAN probability of images")
+    score_parser.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        started = time.perf_counter()
+        features, labels, _ = _dataset_features(args.dataset, args.crop_size, args.limit)
+        positives = int(labels.sum())
+        if positives == 0 or positives == len(labels):
+            print("❌ Need images of both an authentic and a manipulated class")
+            sys.exit(1)
+        print(f"📊 Extracted features of {len(labels)} images ({positives} manipulated) in {time.perf_counter() - started:.1f}s")
+
+        # Hold out every fifth image to report how well the fit generalizes
+        holdout = np.arange(len(labels)) % 5 == 4
+        if holdout.any() and len(set(labels[~holdout])) == 2:
+            check = SpectralModel.fit(features[~holdout], labels[~holdout], args.crop_size, args.l2)
+            print(f"   Held-out accuracy: {_accuracy(check, features[holdout], labels[holdout]):.1%}")
+
+        model = SpectralModel.fit(
+            features, labels, args.crop_size, args.l2,
+            fitted_at=datetime.utcnow().isoformat(), images=len(labels), manipulated=positives
+        )
+        print(f"   Training accuracy: {_accuracy(model, features, labels):.1%}")
+        with open(args.output, "w") as output:
+            json.dump(model.to_json(), output, indent=2)
+        print(f"✅ Wrote {args.output}")
+    else:
+        from image_metrics import MetricContext
+
+        model = load_model()
+        if model is None:
+            print(f"⚠️ No spectral model at {SPECTRAL_MODEL_PATH}; printing features only")
+        for path in args.images:
+            with open(path, "rb") as image_file:
+                started = time.perf_counter()
+                result = analyze_gray(MetricContext(image_file.read()).get("gray"), model)
+            print(f"{path}: {result['gan_probability']} {result['features']} ({(time.perf_counter() - started) * 1000:.1f} ms)")
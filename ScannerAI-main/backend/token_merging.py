@@ -0,0 +1,122 @@
+"""
+Token merging (ToMe) for ViTForImageClassification at inference time.
+
+After the attention block of every layer, the most similar token pairs are merged
+(bipartite soft matching on the attention keys) so later layers run on fewer tokens.
+The forward pass reuses the loaded model's own weights, so no retraining is needed.
+"""
+
+from typing import List, Sequence, Tuple, Union
+
+import torch
+
+Ratios = Union[float, Sequence[float]]
+
+def parse_ratios(value: str) -> Ratios:
+    """Parse "0.1" (same ratio for every layer) or "0.1,0.1,0.05,..." (one per layer)"""
+    parts = [float(part) for part in value.split(",") if part.strip()]
+    if not parts:
+        return 0.0
+    return parts[0] if len(parts) == 1 else parts
+
+def _layer_ratio(ratios: Ratios, layer_index: int) -> float:
+    if isinstance(ratios, (int, float)):
+        return float(ratios)
+    return float(ratios[layer_index]) if layer_index < len(ratios) else 0.0
+
+def _encoder_layers(model) -> List[torch.nn.Module]:
+    vit = model.vit
+    return list(vit.encoder.layer) if hasattr(vit, "encoder") else list(vit.layers)
+
+def _layer_parts(layer):
+    """(query, key, value, attention output, mlp in, activation, mlp out, heads) for either ViT layout"""
+    if hasattr(layer.attention, "attention"):
+        self_attention = layer.attention.attention
+        return (
+            self_attention.query, self_attention.key, self_attention.value,
+            layer.attention.output.dense,
+            layer.intermediate.dense, layer.intermediate.intermediate_act_fn, layer.output.dense,
+            self_attention.num_attention_heads
+        )
+    attention = layer.attention
+    return (
+        attention.q_proj, attention.k_proj, attention.v_proj, attention.o_proj,
+        layer.mlp.fc1, layer.mlp.activation_fn, layer.mlp.fc2,
+        attention.num_attention_heads
+    )
+
+def _attention(layer_parts, hidden_states: torch.Tensor, size: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Self-attention with proportional attention for merged tokens; also returns the key metric"""
+    query, key, value, output, _, _, _, heads = layer_parts
+    batch, tokens, channels = hidden_states.shape
+    head_dim = channels // heads
+
+    q = query(hidden_states).view(batch, tokens, heads, head_dim).transpose(1, 2)
+    k = key(hidden_states).view(batch, tokens, heads, head_dim).transpose(1, 2)
+    v = value(hidden_states).view(batch, tokens, heads, head_dim).transpose(1, 2)
+
+    scores = (q @ k.transpose(-2, -1)) * head_dim ** -0.5
+    # A token standing for s merged tokens gets s times the attention mass
+    scores = scores + size.log()[:, None, None, :, 0]
+    attention_output = (scores.softmax(dim=-1) @ v).transpose(1, 2).reshape(batch, tokens, channels)
+
+    return output(attention_output), k.mean(dim=1)
+
+def _bipartite_soft_matching(metric: torch.Tensor, r: int):
+    """Return a merge function that folds r tokens of the even set into their closest odd tokens.
+
+    The class token (index 0) is never merged and stays at the front.
+    """
+    with torch.no_grad():
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        a, b = metric[..., ::2, :], metric[..., 1::2, :]
+        scores = a @ b.transpose(-1, -2)
+        scores[..., 0, :] = -float("inf")
+
+        node_max, node_idx = scores.max(dim=-1)
+        edge_idx = node_max.argsort(dim=-1, descending=True)[..., None]
+        unmerged_idx = edge_idx[..., r:, :].sort(dim=1)[0]
+        src_idx = edge_idx[..., :r, :]
+        dst_idx = node_idx[..., None].gather(dim=-2, index=src_idx)
+
+    def merge(x: torch.Tensor) -> torch.Tensor:
+        src, dst = x[..., ::2, :], x[..., 1::2, :]
+        batch, src_tokens, channels = src.shape
+        unmerged = src.gather(dim=-2, index=unmerged_idx.expand(batch, src_tokens - r, channels))
+        src = src.gather(dim=-2, index=src_idx.expand(batch, r, channels))
+        dst = dst.scatter_reduce(-2, dst_idx.expand(batch, r, channels), src, reduce="sum")
+        return torch.cat([unmerged, dst], dim=1)
+
+    return merge
+
+def tome_logits(model, pixel_values: torch.Tensor, ratios: Ratios) -> torch.Tensor:
+    """Classification logits of a ViTForImageClassification with token merging applied.
+
+    ratios is the fraction of the current tokens merged away after each layer, either one
+    value for every layer or a list with one value per layer. A ratio of 0 reproduces the
+    unmodified model.
+    """
+    with torch.no_grad():
+        hidden_states = model.vit.embeddings(pixel_values)
+        size = torch.ones_like(hidden_states[..., :1])
+
+        for layer_index, layer in enumerate(_encoder_layers(model)):
+            parts = _layer_parts(layer)
+            attention_output, metric = _attention(parts, layer.layernorm_before(hidden_states), size)
+            hidden_states = hidden_states + attention_output
+
+            tokens = hidden_states.shape[1]
+            # At most every even-set token except the class token can be merged
+            r = min(int(tokens * _layer_ratio(ratios, layer_index)), (tokens - 1) // 2)
+            if r > 0:
+                merge = _bipartite_soft_matching(metric, r)
+                # Size-weighted average so merged tokens keep their share of the image
+                hidden_states = merge(hidden_states * size)
+                size = merge(size)
+                hidden_states = hidden_states / size
+
+            _, _, _, _, mlp_in, activation, mlp_out, _ = parts
+            hidden_states = hidden_states + mlp_out(activation(mlp_in(layer.layernorm_after(hidden_states))))
+
+        hidden_states = model.vit.layernorm(hidden_states)
+        return model.classifier(hidden_states[:, 0, :])
@@ -0,0 +1,132 @@
+"""
+Upload negotiation between the frontend and the analysis endpoints.
+
+The ViT models only ever see a 224x224 resize, so uploading a 12 MP phone photo for
+classification spends seconds of mobile upload and a full-size server decode on pixels
+that are thrown away. GET /capabilities tells clients, per analysis type, the largest side
+worth sending and the formats to re-encode to; the frontend downscales on a canvas before
+uploading. Only the ViT-only paths (classification and heatmaps) are downscaled. Everything
+else is marked original_required and always receives the file as it is. That covers
+analyses that read the original bytes (JPEG quantization, EXIF, sensor noise, copy-move at
+full resolution, high-res tiling). It also covers deepfake detection: its spectral detector
+looks for upsampling artifacts that resampling wipes out, and its heuristic fallback is
+calibrated on full-resolution pixels.
+
+Clients describe what they did in an upload_info form field; each saved result records it
+under "upload", and /metrics counts uploads and bytes per path. The image properties of a
+downscaled upload's result report the size and format the user picked; metrics computed on
+pixels are marked as computed on the smaller copy.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CLIENT_DOWNSCALE_ENABLED = os.getenv("CLIENT_DOWNSCALE_ENABLED", "true").lower() == "true"
+# Headroom over the 224 model input keeps the browser's resize from aliasing
+CLASSIFICATION_UPLOAD_MAX_SIDE = int(os.getenv("CLASSIFICATION_UPLOAD_MAX_SIDE", "512"))
+# Preferred first; clients use the first one their canvas can encode
+UPLOAD_FORMATS = [value.strip() for value in os.getenv("UPLOAD_FORMATS", "image/webp,image/jpeg").split(",") if value.strip()]
+UPLOAD_QUALITY = float(os.getenv("UPLOAD_QUALITY", "0.9"))
+
+UPLOAD_PATHS = ("original", "client_downscaled")
+
+def _downscaled(max_side: int) -> Dict[str, Any]:
+    return {
+        "original_required": not CLIENT_DOWNSCALE_ENABLED,
+        "max_side": max_side,
+        "formats": UPLOAD_FORMATS,
+        "quality": UPLOAD_QUALITY
+    }
+
+def upload_capabilities() -> Dict[str, Any]:
+    """What each analysis needs from an upload; keys are analysis types or their admission queues"""
+    return {
+        "analyses": {
+            "classification": _downscaled(CLASSIFICATION_UPLOAD_MAX_SIDE),
+            "classification_high_res": {"original_required": True},
+            "deepfake": {"original_required": True},
+            "deepfake_high_res": {"original_required": True},
+            "forgery": {"original_required": True},
+            "heatmap": _downscaled(CLASSIFICATION_UPLOAD_MAX_SIDE)
+        }
+    }
+
+def describe_upload(upload_info: Optional[str], content: bytes, content_type: str) -> Dict[str, Any]:
+    """What was uploaded and how, from the bytes received and the client's upload_info"""
+    try:
+        info = json.loads(upload_info) if upload_info else {}
+    except ValueError:
+        info = {}
+    if not isinstance(info, dict):
+        info = {}
+    upload = {
+        "path": "client_downscaled" if info.get("downscaled") is True else "original",
+        "bytes": len(content),
+        "content_type": content_type
+    }
+    if upload["path"] == "client_downscaled":
+        # As reported by the client; only the received bytes are known for certain
+        for field in ("original_bytes", "original_width", "original_height", "width", "height", "client_ms"):
+            if isinstance(info.get(field), (int, float)):
+                upload[field] = info[field]
+        if isinstance(info.get("original_content_type"), str) and info["original_content_type"].startswith("image/"):
+            upload["original_content_type"] = info["original_content_type"]
+    upload_stats.record(upload)
+    return upload
+
+def with_original_properties(result: Dict[str, Any], upload: Dict[str, Any]) -> Dict[str, Any]:
+    """Result whose image properties describe the image the user picked rather than a client-downscaled copy"""
+    basic_analysis = result.get("basic_analysis")
+    if upload["path"] != "client_downscaled" or not isinstance(basic_analysis, dict):
+        return result
+    received = basic_analysis.get("image_properties") or {}
+    properties = {
+        **received,
+        # Sharpness, edge density and the other pixel metrics were computed on this copy
+        "downscaled": True,
+        "analyzed_width": received.get("width"),
+        "analyzed_height": received.get("height"),
+        "analyzed_format": received.get("format")
+    }
+    if "original_width" in upload and "original_height" in upload:
+        properties["width"] = upload["original_width"]
+        properties["height"] = upload["original_height"]
+    if "original_content_type" in upload:
+        properties["format"] = upload["original_content_type"].split("/", 1)[1].upper()
+    return {**result, "basic_analysis": {**basic_analysis, "image_properties": properties}}
+
+class UploadStats:
+    def __init__(self):
+        self.uploads = {path: 0 for path in UPLOAD_PATHS}
+        self.bytes = {path: 0 for path in UPLOAD_PATHS}
+        self.original_bytes = 0
+
+    def record(self, upload: Dict[str, Any]):
+        path = upload["path"]
+        self.uploads[path] += 1
+        self.bytes[path] += upload["bytes"]
+        # Bytes the client would have sent without downscaling
+        self.original_bytes += upload.get("original_bytes", upload["bytes"])
+
+    def metrics(self) -> Dict[str, Any]:
+        received = sum(self.bytes.values())
+        return {
+            "uploads": dict(self.uploads),
+            "bytes": dict(self.bytes),
+            "bytes_saved": self.original_bytes - received
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        lines = []
+        for path in UPLOAD_PATHS:
+            lines.append(f'clario_uploads_total{{path="{path}"}} {self.uploads[path]}')
+            lines.append(f'clario_upload_bytes_total{{path="{path}"}} {self.bytes[path]}')
+        lines.append(f"clario_upload_bytes_saved_total {self.metrics()['bytes_saved']}")
+        return lines
+
+upload_stats = UploadStats()
@@ -3,6 +3,16 @@ from sqlalchemy import and_, func
 from datetime import date, datetime, timedelta
 from typing import Dict, Any, Optional
 from models import User, DailyUsage, Subscription
+from write_behind import persistence
+from shared_state import shared_state, SharedStateError
+
+# Free users get 7 analyses per day
+FREE_DAILY_LIMIT = 7
+# Daily counters are keyed by date; the TTL only has to outlive the day
+USAGE_COUNTER_TTL_SECONDS = 2 * 24 * 3600
+
+def _usage_key(user_id: int, usage_date: date) -> str:
+    return f"usage:{user_id}:{usage_date.isoformat()}"
 
 class UsageService:
     def __init__(self, db: Session):
@@ -38,27 +48,25 @@ class UsageService:
             )
         ).first()
         
+        # Count increments still waiting in the write-behind queue too
+        current_usage = (daily_usage.analysis_count if daily_usage else 0) + persistence.pending_usage_count(user_id, today)
+        # The shared counter also sees analyses running or saved on other nodes
+        try:
+            current_usage = max(current_usage, shared_state.counter(_usage_key(user_id, today)))
+        except SharedStateError as e:
+            print(f"⚠️ Shared usage counter unavailable, using this node's count: {e}")
+        
         # If user has active subscription, unlimited usage
         if active_subscription:
             return {
                 "can_analyze": True,
                 "is_subscribed": True,
-                "usage_count": daily_usage.analysis_count if daily_usage else 0,
+                "usage_count": current_usage,
                 "limit": "unlimited"
             }
         
-        # Free users get 7 analyses per day
-        FREE_DAILY_LIMIT = 7
-        current_usage = daily_usage.analysis_count if daily_usage else 0
-        
         if current_usage >= FREE_DAILY_LIMIT:
-            return {
-                "can_analyze": False,
-                "is_subscribed": False,
-                "usage_count": current_usage,
-                "limit": FREE_DAILY_LIMIT,
-                "message": "You have reached your daily limit of 7 free analyses. Subscribe for unlimited access!"
-            }
+            return self._limit_reached(current_usage)
         
         return {
             "can_analyze": True,
@@ -68,6 +76,43 @@ class UsageService:
             "remaining": FREE_DAILY_LIMIT - current_usage
         }
     
+    def _limit_reached(self, current_usage: int) -> Dict[str, Any]:
+        return {
+            "can_analyze": False,
+            "is_subscribed": False,
+            "usage_count": current_usage,
+            "limit": FREE_DAILY_LIMIT,
+            "message": "You have reached your daily limit of 7 free analyses. Subscribe for unlimited access!"
+        }
+    
+    def reserve_analysis(self, user_id: int) -> Dict[str, Any]:
+        """check_usage_limit that also takes one of today's free analyses, atomically across all nodes"""
+        usage_check = self.check_usage_limit(user_id)
+        if not usage_check["can_analyze"] or usage_check.get("is_subscribed"):
+            return usage_check
+        
+        try:
+            # Concurrent requests all pass the check above; only the increment decides
+            count = shared_state.increment_within_limit(
+                _usage_key(user_id, date.today()), FREE_DAILY_LIMIT, USAGE_COUNTER_TTL_SECONDS,
+                initial=usage_check["usage_count"]
+            )
+        except SharedStateError as e:
+            print(f"⚠️ Shared usage counter unavailable, using this node's count: {e}")
+            return usage_check
+        if count is None:
+            return self._limit_reached(FREE_DAILY_LIMIT)
+        return {**usage_check, "usage_count": count - 1, "remaining": FREE_DAILY_LIMIT - count + 1, "reserved": True}
+    
+    def release_analysis(self, user_id: int, usage_check: Dict[str, Any]):
+        """Give back a reservation whose analysis was never saved"""
+        if not usage_check.get("reserved"):
+            return
+        try:
+            shared_state.decrement(_usage_key(user_id, date.today()))
+        except SharedStateError as e:
+            print(f"⚠️ Could not release usage reservation: {e}")
+    
     def increment_usage(self, user_id: int) -> bool:
         """Increment user's daily usage count"""
         today = date.today()
@@ -117,7 +162,11 @@ class UsageService:
             )
         ).first()
         
-        current_usage = daily_usage.analysis_count if daily_usage else 0
+        current_usage = (daily_usage.analysis_count if daily_usage else 0) + persistence.pending_usage_count(user_id, today)
+        try:
+            current_usage = max(current_usage, shared_state.counter(_usage_key(user_id, today)))
+        except SharedStateError:
+            pass
         
         return {
             "user_id": user_id,
@@ -0,0 +1,232 @@
+import os
+import threading
+from typing import Dict, Any, Iterator, Iterable, List, Callable, Optional
+
+import numpy as np
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VIDEO_FRAME_BUDGET = int(os.getenv("VIDEO_FRAME_BUDGET", "64"))
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "8"))
+VIDEO_SEGMENT_SECONDS = float(os.getenv("VIDEO_SEGMENT_SECONDS", "5"))
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.35"))
+VIDEO_KEYFRAME_INTERVAL = float(os.getenv("VIDEO_KEYFRAME_INTERVAL", "2"))
+VIDEO_MAX_SIDE = int(os.getenv("VIDEO_MAX_SIDE", "1280"))
+
+# Never sample two frames closer than this, whatever the scene detector says
+MIN_SAMPLE_INTERVAL = 0.25
+# Weight of the newest frame in the exponentially smoothed fake score
+SMOOTHING_ALPHA = 0.3
+
+def _frame_signature(frame_bgr: np.ndarray) -> np.ndarray:
+    """Normalized hue/saturation histogram of a thumbnail, used for scene change detection"""
+    thumb = cv2.resize(frame_bgr, (64, 36), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(thumb, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+def iter_sampled_frames(
+    video_path: str,
+    frame_budget: int = VIDEO_FRAME_BUDGET,
+    scene_threshold: float = VIDEO_SCENE_THRESHOLD,
+    keyframe_interval: float = VIDEO_KEYFRAME_INTERVAL
+) -> Iterator[Dict[str, Any]]:
+    """Decode a video incrementally and yield the frames worth analyzing.
+
+    A frame is sampled on a scene change or when keyframe_interval seconds have passed
+    since the last sample. Intervals are stretched so the budget covers the whole video,
+    and only one decoded frame is held in memory at a time.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError("Could not open video file")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        duration = frame_count / fps if frame_count > 0 else 0.0
+
+        min_interval = max(MIN_SAMPLE_INTERVAL, duration / frame_budget if frame_budget else 0.0)
+        keyframe_interval = max(keyframe_interval, min_interval)
+
+        previous_signature = None
+        last_sampled_at = None
+        sampled = 0
+        index = -1
+
+        while sampled < frame_budget:
+            # grab() skips the color conversion for frames we will not look at
+            if not capture.grab():
+                break
+            index += 1
+            timestamp = index / fps
+            if last_sampled_at is not None and timestamp - last_sampled_at < min_interval:
+                continue
+
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+
+            signature = _frame_signature(frame)
+            if previous_signature is None:
+                reason = "first_frame"
+            elif cv2.compareHist(previous_signature, signature, cv2.HISTCMP_BHATTACHARYYA) > scene_threshold:
+                reason = "scene_change"
+            elif timestamp - last_sampled_at >= keyframe_interval:
+                reason = "keyframe"
+            else:
+                continue
+
+            previous_signature = signature
+            last_sampled_at = timestamp
+            sampled += 1
+
+            height, width = frame.shape[:2]
+            scale = min(1.0, VIDEO_MAX_SIDE / float(max(height, width)))
+            if scale < 1.0:
+                frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+            yield {
+                "frame_index": index,
+                "timestamp": timestamp,
+                "reason": reason,
+                "image": cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),
+                "fps": fps,
+                "duration": duration
+            }
+    finally:
+        capture.release()
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """Group an iterator into lists of at most batch_size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _segment_record(segment_index: int, frames: List[Dict[str, Any]], segment_seconds: float) -> Dict[str, Any]:
+    scores = [frame["fake_probability"] for frame in frames]
+    return {
+        "type": "segment",
+        "segment": segment_index,
+        "start": segment_index * segment_seconds,
+        "end": (segment_index + 1) * segment_seconds,
+        "frames_analyzed": len(frames),
+        "mean_fake_probability": float(np.mean(scores)),
+        "max_fake_probability": float(np.max(scores)),
+        "flagged_frames": sum(1 for frame in frames if frame["is_deepfake"]),
+        "frames": [
+            {
+                "frame_index": frame["frame_index"],
+                "timestamp": frame["timestamp"],
+                "reason": frame["reason"],
+                "fake_probability": frame["fake_probability"],
+                "face_count": frame["face_count"]
+            }
+            for frame in frames
+        ]
+    }
+
+def analyze_video_frames(
+    video_path: str,
+    score_frames: Callable[[List[np.ndarray]], List[Dict[str, Any]]],
+    frame_budget: int = VIDEO_FRAME_BUDGET,
+    batch_size: int = VIDEO_BATCH_SIZE,
+    segment_seconds: float = VIDEO_SEGMENT_SECONDS,
+    stop: Optional[threading.Event] = None
+) -> Iterator[Dict[str, Any]]:
+    """Generator pipeline: sample frames -> batched scoring -> per-segment records -> summary.
+
+    score_frames receives a list of RGB frames and returns one dict per frame with at least
+    fake_probability, is_deepfake and face_count. A segment record is yielded as soon as
+    its time window is complete, followed by one summary record at the end. Setting stop
+    ends the pipeline at the next batch, without a summary.
+    """
+    smoothed = None
+    peak_smoothed = 0.0
+    total_frames = 0
+    score_sum = 0.0
+    flagged_segments = 0
+    segments = 0
+    duration = 0.0
+
+    current_segment = None
+    segment_frames: List[Dict[str, Any]] = []
+
+    frames = iter_sampled_frames(video_path, frame_budget)
+    try:
+        for batch in iter_batches(frames, batch_size):
+            # Set by a consumer that went away while this thread was busy decoding
+            if stop is not None and stop.is_set():
+                return
+            scores = score_frames([frame["image"] for frame in batch])
+            for frame, score in zip(batch, scores):
+                # Drop the pixels as soon as the frame is scored
+                frame.pop("image")
+                frame.update(score)
+                duration = frame["duration"]
+
+                segment_index = int(frame["timestamp"] // segment_seconds)
+                if current_segment is not None and segment_index != current_segment and segment_frames:
+                    record = _segment_record(current_segment, segment_frames, segment_seconds)
+                    segments += 1
+                    flagged_segments += 1 if record["mean_fake_probability"] > 0.5 else 0
+                    yield record
+                    segment_frames = []
+                current_segment = segment_index
+                segment_frames.append(frame)
+
+                # Exponential smoothing so one noisy frame cannot flip the verdict
+                probability = frame["fake_probability"]
+                smoothed = probability if smoothed is None else SMOOTHING_ALPHA * probability + (1 - SMOOTHING_ALPHA) * smoothed
+                peak_smoothed = max(peak_smoothed, smoothed)
+                score_sum += probability
+                total_frames += 1
+    finally:
+        # Releases the capture now rather than whenever the generator is collected
+        frames.close()
+
+    if segment_frames:
+        record = _segment_record(current_segment, segment_frames, segment_seconds)
+        segments += 1
+        flagged_segments += 1 if record["mean_fake_probability"] > 0.5 else 0
+        yield record
+
+    if total_frames == 0:
+        raise ValueError("No frames could be decoded from the video")
+
+    is_deepfake = peak_smoothed > 0.5
+    confidence = peak_smoothed if is_deepfake else 1.0 - peak_smoothed
+
+    if is_deepfake and confidence >= 0.8:
+        risk_level = "High Risk"
+    elif is_deepfake and confidence >= 0.6:
+        risk_level = "Medium Risk"
+    elif is_deepfake:
+        risk_level = "Low Risk"
+    else:
+        risk_level = "Very Low Risk"
+
+    yield {
+        "type": "summary",
+        "success": True,
+        "analysis_type": "deepfake_video",
+        "is_deepfake": is_deepfake,
+        "confidence": confidence,
+        "risk_level": risk_level,
+        "duration": duration,
+        "frames_analyzed": total_frames,
+        "frame_budget": frame_budget,
+        "budget_exhausted": total_frames >= frame_budget,
+        "segments": segments,
+        "flagged_segments": flagged_segments,
+        "mean_fake_probability": score_sum / total_frames,
+        "peak_smoothed_fake_probability": peak_smoothed,
+        "message": f"Video deepfake analysis completed - {risk_level} over {total_frames} sampled frames"
+    }
@@ -0,0 +1,328 @@
+"""
+Write-behind persistence for analysis results and daily usage counters.
+
+Analysis endpoints hand their writes to a background writer thread, which group-commits
+AnalysisResult inserts and DailyUsage increments in batches of up to PERSISTENCE_BATCH_SIZE
+writes or PERSISTENCE_FLUSH_MS milliseconds, one transaction (one fsync) per batch.
+
+PERSISTENCE_DURABILITY picks what a caller waits for:
+    sync   - its own transaction, committed before returning (the old behaviour)
+    group  - the batch containing its write, committed before returning (default)
+    async  - nothing; the write is committed within PERSISTENCE_FLUSH_MS, and is lost if the
+             process dies before that
+
+AnalysisResult ids are handed out up front from blocks reserved in the id_sequences table
+(hi/lo), so a response can carry its id before the row is written.
+"""
+
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from artifacts import count_references
+from database import SessionLocal
+from models import AnalysisResult, ArchivedAnalysis, DailyUsage, IdSequence
+
+load_dotenv()
+
+PERSISTENCE_DURABILITY = os.getenv("PERSISTENCE_DURABILITY", "group")
+PERSISTENCE_BATCH_SIZE = int(os.getenv("PERSISTENCE_BATCH_SIZE", "256"))
+PERSISTENCE_FLUSH_MS = float(os.getenv("PERSISTENCE_FLUSH_MS", "20"))
+PERSISTENCE_ID_BLOCK = int(os.getenv("PERSISTENCE_ID_BLOCK", "100"))
+# Attempts at committing a batch before its writes are given up
+PERSISTENCE_RETRIES = 3
+
+DURABILITY_MODES = ("sync", "group", "async")
+
+class IdAllocator:
+    """Hands out ids for a table from blocks reserved in id_sequences, one database round trip per block"""
+
+    def __init__(self, table, session_factory=SessionLocal, block_size: int = PERSISTENCE_ID_BLOCK, moved_to=()):
+        self.table = table
+        # Tables rows of `table` are moved to (e.g. by archival), whose ids must not be handed out again
+        self.moved_to = moved_to
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.block_end = 0
+
+    def _reserve_block(self) -> int:
+        name = self.table.__tablename__
+        while True:
+            db = self.session_factory()
+            try:
+                # The UPDATE takes the write lock, so no other process can reserve the same block
+                reserved = db.execute(
+                    update(IdSequence)
+                    .where(IdSequence.name == name)
+                    .values(next_value=IdSequence.next_value + self.block_size)
+                )
+                if reserved.rowcount:
+                    block_end = db.scalar(select(IdSequence.next_value).where(IdSequence.name == name))
+                    db.commit()
+                    return block_end - self.block_size
+                # First reservation for this table: continue after the rows already there
+                start = max(
+                    db.scalar(select(func.max(table.id))) or 0 for table in (self.table,) + tuple(self.moved_to)
+                ) + 1
+                db.add(IdSequence(name=name, next_value=start + self.block_size))
+                db.commit()
+                return start
+            except IntegrityError:
+                # Another process created the sequence first; reserve from it instead
+                db.rollback()
+            finally:
+                db.close()
+
+    def allocate(self) -> int:
+        with self.lock:
+            if self.next_id >= self.block_end:
+                self.next_id = self._reserve_block()
+                self.block_end = self.next_id + self.block_size
+            allocated = self.next_id
+            self.next_id += 1
+            return allocated
+
+class PendingAnalysis:
+    """What the caller gets back for a queued AnalysisResult insert"""
+    __slots__ = ("id", "created_at")
+
+    def __init__(self, id: int, created_at: datetime):
+        self.id = id
+        self.created_at = created_at
+
+class _Write:
+    __slots__ = ("analysis", "usage", "future", "loop")
+
+    def __init__(self, analysis: Optional[Dict[str, Any]], usage: Optional[Tuple[int, date]], future, loop):
+        self.analysis = analysis
+        self.usage = usage
+        self.future = future
+        self.loop = loop
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        durability: str = PERSISTENCE_DURABILITY,
+        batch_size: int = PERSISTENCE_BATCH_SIZE,
+        flush_ms: float = PERSISTENCE_FLUSH_MS
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"PERSISTENCE_DURABILITY must be one of {', '.join(DURABILITY_MODES)}")
+        self.session_factory = session_factory
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.analysis_ids = IdAllocator(AnalysisResult, session_factory, moved_to=(ArchivedAnalysis,))
+        self.queue: "queue.Queue[Optional[_Write]]" = queue.Queue()
+        self.pending_usage: Dict[Tuple[int, date], int] = {}
+        self.pending_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.thread_pid = None
+        self.start_lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+
+    def _ensure_writer(self):
+        # Started lazily (and again after a fork), since threads do not survive fork()
+        if self.thread is not None and self.thread_pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.thread is None or self.thread_pid != os.getpid() or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self.thread_pid = os.getpid()
+                self.thread.start()
+
+    def pending_usage_count(self, user_id: int, usage_date: date) -> int:
+        """Usage increments accepted but not yet committed, to be added to the stored count"""
+        return self.pending_usage.get((user_id, usage_date), 0)
+
+    async def save_analysis(
+        self,
+        user_id: int,
+        analysis_type: str,
+        filename: str,
+        result: Dict[str, Any],
+        count_usage: bool = True
+    ) -> PendingAnalysis:
+        """Insert an AnalysisResult (and count it against today's usage) in the next batch"""
+        pending = PendingAnalysis(
+            self.analysis_ids.allocate(),
+            # What server_default=func.now() would have stored on SQLite
+            datetime.now(timezone.utc).replace(tzinfo=None)
+        )
+        analysis = {
+            "id": pending.id,
+            "user_id": user_id,
+            "analysis_type": analysis_type,
+            "filename": filename,
+            "result": result,
+            "created_at": pending.created_at
+        }
+        await self._submit(analysis, (user_id, date.today()) if count_usage else None)
+        return pending
+
+    async def increment_usage(self, user_id: int):
+        """Add one to today's DailyUsage count of the user in the next batch"""
+        await self._submit(None, (user_id, date.today()))
+
+    async def _submit(self, analysis: Optional[Dict[str, Any]], usage: Optional[Tuple[int, date]]):
+        if usage is not None:
+            with self.pending_lock:
+                self.pending_usage[usage] = self.pending_usage.get(usage, 0) + 1
+
+        loop = asyncio.get_event_loop()
+        if self.durability == "sync":
+            write = _Write(analysis, usage, None, None)
+            await loop.run_in_executor(None, self._commit_with_retries, [write])
+            return
+
+        future = loop.create_future() if self.durability == "group" else None
+        self._ensure_writer()
+        self.queue.put(_Write(analysis, usage, future, loop))
+        if future is not None:
+            await future
+
+    def _run(self):
+        while True:
+            write = self.queue.get()
+            if write is None:
+                return
+            batch = [write]
+            flush_at = time.monotonic() + self.flush_seconds
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = flush_at - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    write = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if write is None:
+                    stop = True
+                    break
+                batch.append(write)
+            self._commit_with_retries(batch)
+            if stop:
+                return
+
+    def _commit_with_retries(self, batch: List[_Write]):
+        error = None
+        for attempt in range(PERSISTENCE_RETRIES):
+            try:
+                self._commit(batch)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                time.sleep(0.05 * (attempt + 1))
+
+        errors = [error] * len(batch)
+        if error is not None and len(batch) > 1:
+            # A single bad write (a result the JSON column cannot store, a constraint violation)
+            # fails the whole transaction; commit each on its own so only that write is lost
+            errors = [self._commit_alone(write) for write in batch]
+
+        with self.pending_lock:
+            for write in batch:
+                if write.usage is not None:
+                    remaining = self.pending_usage.get(write.usage, 0) - 1
+                    if remaining > 0:
+                        self.pending_usage[write.usage] = remaining
+                    else:
+                        self.pending_usage.pop(write.usage, None)
+
+        failures = [error for error in errors if error is not None]
+        if len(failures) < len(batch):
+            self.batches += 1
+            self.writes += len(batch) - len(failures)
+        if failures:
+            self.failed += len(failures)
+            print(f"❌ Failed to persist {len(failures)} of {len(batch)} writes: {failures[0]}")
+
+        for write, error in zip(batch, errors):
+            if write.future is not None:
+                write.loop.call_soon_threadsafe(_resolve, write.future, error)
+        if errors[0] is not None and self.durability == "sync":
+            raise errors[0]
+
+    def _commit_alone(self, write: _Write) -> Optional[Exception]:
+        try:
+            self._commit([write])
+            return None
+        except Exception as e:
+            return e
+
+    def _commit(self, batch: List[_Write]):
+        """All writes of the batch in one transaction"""
+        analyses = [write.analysis for write in batch if write.analysis is not None]
+        usage: Dict[Tuple[int, date], int] = {}
+        for write in batch:
+            if write.usage is not None:
+                usage[write.usage] = usage.get(write.usage, 0) + 1
+
+        db = self.session_factory()
+        try:
+            if analyses:
+                db.execute(AnalysisResult.__table__.insert(), analyses)
+                count_references(db, [analysis["result"] for analysis in analyses], 1)
+            for (user_id, usage_date), count in usage.items():
+                updated = db.execute(
+                    update(DailyUsage)
+                    .where(DailyUsage.user_id == user_id, DailyUsage.usage_date == usage_date)
+                    .values(analysis_count=DailyUsage.analysis_count + count)
+                )
+                if not updated.rowcount:
+                    db.add(DailyUsage(user_id=user_id, usage_date=usage_date, analysis_count=count))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def close(self):
+        """Flush everything still queued and stop the writer; call on shutdown"""
+        if self.thread is not None and self.thread_pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "durability": self.durability,
+            "queued": self.queue.qsize(),
+            "batches": self.batches,
+            "writes": self.writes,
+            "failed": self.failed,
+            "avg_batch_size": self.writes / self.batches if self.batches else 0.0
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        return [
+            f"clario_persistence_{name} {value}"
+            for name, value in self.metrics().items() if name != "durability"
+        ]
+
+def _resolve(future: asyncio.Future, error: Optional[Exception]):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+persistence = WriteBehindQueue()
+atexit.register(persistence.close)
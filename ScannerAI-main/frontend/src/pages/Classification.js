@@ -97,6 +97,12 @@ const Classification = () => {
     setUploadProgress(0);
   };
 
+  // Pixel metrics of a downscaled upload describe the copy the server received, not the original
+  const analyzedCopyLabel = (basicAnalysis) => {
+    const properties = basicAnalysis?.image_properties;
+    return properties?.downscaled ? ` (${properties.analyzed_width} x ${properties.analyzed_height} copy)` : '';
+  };
+
   const formatResult = (result) => {
     if (!result || !result.success) {
       return {
@@ -327,13 +333,13 @@ const Classification = () => {
                               <span className="text-white">{formattedResult.details.basic_analysis.image_properties?.mode}</span>
                             </div>
                             <div className="flex justify-between">
-                              <span className="text-gray-400">Sharpness:</span>
+                              <span className="text-gray-400">Sharpness{analyzedCopyLabel(formattedResult.details.basic_analysis)}:</span>
                               <span className="text-white">
                                 {formattedResult.details.basic_analysis.color_analysis?.sharpness?.toFixed(2)}
                               </span>
                             </div>
                             <div className="flex justify-between">
-                              <span className="text-gray-400">Edge Density:</span>
+                              <span className="text-gray-400">Edge Density{analyzedCopyLabel(formattedResult.details.basic_analysis)}:</span>
                               <span className="text-white">
                                 {(formattedResult.details.basic_analysis.color_analysis?.edge_density * 100).toFixed(1)}%
                               </span>
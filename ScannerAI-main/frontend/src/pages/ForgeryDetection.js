@@ -60,7 +60,9 @@ const ForgeryDetection = () => {
             (progressEvent.loaded * 100) / progressEvent.total
           );
           setUploadProgress(percentCompleted);
-        }
+        },
+        // Forensics reads the JPEG tables, metadata and sensor noise of the original bytes
+        { keepOriginal: true }
       );
 
       setResult(response.data);
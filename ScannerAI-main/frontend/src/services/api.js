@@ -46,9 +46,115 @@ api.interceptors.response.use(
   }
 );
 
-export const uploadFile = async (endpoint, file, onUploadProgress) => {
+// What each analysis needs from an upload, fetched once per page load
+let capabilitiesRequest = null;
+
+export const getCapabilities = () => {
+  if (!capabilitiesRequest) {
+    capabilitiesRequest = api.get('/capabilities')
+      .then((response) => response.data)
+      .catch(() => {
+        // Uploads fall back to the original file; ask again next time
+        capabilitiesRequest = null;
+        return null;
+      });
+  }
+  return capabilitiesRequest;
+};
+
+// Capability key of an endpoint: the analysis type, or its high-res queue
+const capabilityKey = (endpoint) => {
+  const [path, query = ''] = endpoint.split('?');
+  const analysisType = path.replace(/^\/analysis\//, '');
+  return new URLSearchParams(query).get('high_res') === 'true' ? `${analysisType}_high_res` : analysisType;
+};
+
+const canvasToBlob = (canvas, type, quality) => {
+  if (canvas.convertToBlob) {
+    return canvas.convertToBlob({ type, quality });
+  }
+  return new Promise((resolve) => canvas.toBlob(resolve, type, quality));
+};
+
+// Draw the image at most maxSide pixels long and re-encode it in the first format the browser
+// can produce; null when that would not make the upload smaller
+export const downscaleImage = async (file, { max_side: maxSide, formats = ['image/jpeg'], quality = 0.9 }) => {
+  if (!maxSide || typeof createImageBitmap !== 'function') {
+    return null;
+  }
+  // Applies the EXIF orientation, so the pixels come out the way the photo is viewed
+  const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+  try {
+    const scale = maxSide / Math.max(bitmap.width, bitmap.height);
+    if (scale >= 1) {
+      return null;
+    }
+    const width = Math.max(1, Math.round(bitmap.width * scale));
+    const height = Math.max(1, Math.round(bitmap.height * scale));
+    const canvas = typeof OffscreenCanvas !== 'undefined'
+      ? new OffscreenCanvas(width, height)
+      : Object.assign(document.createElement('canvas'), { width, height });
+    const context = canvas.getContext('2d');
+    context.imageSmoothingEnabled = true;
+    context.imageSmoothingQuality = 'high';
+    context.drawImage(bitmap, 0, 0, width, height);
+
+    for (const type of formats) {
+      const blob = await canvasToBlob(canvas, type, quality);
+      // Browsers that cannot encode a type quietly fall back to PNG
+      if (blob && blob.type === type) {
+        return blob.size < file.size
+          ? { blob, width, height, originalWidth: bitmap.width, originalHeight: bitmap.height }
+          : null;
+      }
+    }
+    return null;
+  } finally {
+    bitmap.close();
+  }
+};
+
+// Downscaled copy of file for the endpoint, as the server advertises, or null to send the original
+const prepareUpload = async (endpoint, file) => {
+  if (!file.type.startsWith('image/') || file.type === 'image/gif') {
+    return null;
+  }
+  const capabilities = await getCapabilities();
+  const wanted = capabilities?.analyses?.[capabilityKey(endpoint)];
+  if (!wanted || wanted.original_required) {
+    return null;
+  }
+  try {
+    return await downscaleImage(file, wanted);
+  } catch (error) {
+    // Undecodable in this browser (e.g. HEIC): the server gets the file as it is
+    return null;
+  }
+};
+
+// keepOriginal sends the file byte for byte, for forensic analyses that need it
+export const uploadFile = async (endpoint, file, onUploadProgress, { keepOriginal = false } = {}) => {
+  const started = performance.now();
+  const prepared = keepOriginal ? null : await prepareUpload(endpoint, file);
+
   const formData = new FormData();
-  formData.append('file', file);
+  if (prepared) {
+    // The original name is kept, so history shows what the user picked
+    formData.append('file', new File([prepared.blob], file.name, { type: prepared.blob.type }));
+    formData.append('upload_info', JSON.stringify({
+      downscaled: true,
+      original_bytes: file.size,
+      original_width: prepared.originalWidth,
+      original_height: prepared.originalHeight,
+      original_content_type: file.type,
+      width: prepared.width,
+      height: prepared.height,
+      client_ms: Math.round(performance.now() - started),
+    }));
+  } else {
+    formData.append('file', file);
+    formData.append('upload_info', JSON.stringify({ downscaled: false }));
+  }
   
   return api.post(endpoint, formData, {
     headers: {
@@ -57,5 +163,3 @@ export const uploadFile = async (endpoint, file, onUploadProgress) => {
     onUploadProgress,
   });
 };
-
-
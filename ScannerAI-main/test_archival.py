@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script to verify archival: results past retention move to the archive, history lists
+them as archived, the full result is loaded back from the archive, a second run changes
+nothing, and a run is skipped while another holds the maintenance lock
+"""
+import sys
+import os
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+
+# Point the backend at a scratch database and archive before it is imported
+SCRATCH_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'archival.db')}"
+os.environ["ARCHIVE_DIR"] = os.path.join(SCRATCH_DIR, "archive")
+os.environ["ARTIFACT_DIR"] = os.path.join(SCRATCH_DIR, "artifacts")
+
+# Add the backend to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from database import engine, SessionLocal
+from migrations import upgrade_schema
+from models import User, AnalysisResult, ArchivedAnalysis
+from maintenance import ARCHIVE_DIR, RETENTION_DAYS_FREE, maintenance_lock, run_maintenance
+from services import get_user_history, get_analysis
+
+EXPIRED_RESULTS = 150
+RECENT_RESULTS = 5
+
+def result_for(index):
+    return {
+        "success": True,
+        "analysis_type": "deepfake",
+        "predicted_label": "Deepfake" if index % 2 else "Realism",
+        "confidence": round(index / 1000, 4),
+        "is_deepfake": bool(index % 2),
+        "risk_level": "high" if index % 2 else "low",
+        # Not part of the summary; only the archive keeps it
+        "deepfake_indicators": [{"name": "noise", "score": index}]
+    }
+
+def create_history():
+    """One free user with EXPIRED_RESULTS results past retention and RECENT_RESULTS within it"""
+    upgrade_schema(engine)
+    db = SessionLocal()
+    user = User(email="archive@example.com", is_verified=True)
+    db.add(user)
+    db.commit()
+    now = datetime.utcnow()
+    for index in range(EXPIRED_RESULTS + RECENT_RESULTS):
+        age = RETENTION_DAYS_FREE + 30 + index if index < EXPIRED_RESULTS else 1
+        db.add(AnalysisResult(
+            user_id=user.id, analysis_type="deepfake", filename=f"image_{index}.jpg",
+            result=result_for(index), created_at=now - timedelta(days=age)
+        ))
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+def archive_state():
+    """Archived rows and the size of every archive partition"""
+    db = SessionLocal()
+    archived = db.query(ArchivedAnalysis).count()
+    db.close()
+    sizes = {}
+    for directory, _, files in os.walk(ARCHIVE_DIR):
+        for name in files:
+            if not name.startswith("."):
+                sizes[name] = os.path.getsize(os.path.join(directory, name))
+    return archived, sizes
+
+def check(ok, message):
+    print(f"{'✅' if ok else '❌'} {message}")
+    return ok
+
+def main():
+    print("🧪 Testing archival of expired analysis results...")
+    user_id = create_history()
+
+    report = run_maintenance(engine)
+    ok = check(
+        report is not None and report["archived_results"] == EXPIRED_RESULTS,
+        f"First run archived {report and report['archived_results']} of {EXPIRED_RESULTS} expired results "
+        f"into {report and report['partitions']} partitions"
+    )
+
+    db = SessionLocal()
+    history = asyncio.run(get_user_history(db, user_id))
+    archived = [item for item in history if item.get("archived")]
+    live = [item for item in history if not item.get("archived")]
+    ok = check(
+        len(archived) == EXPIRED_RESULTS and len(live) == RECENT_RESULTS,
+        f"History lists {len(live)} live and {len(archived)} archived results"
+    ) and ok
+    summary = archived[0]["result"]
+    ok = check(
+        "predicted_label" in summary and "deepfake_indicators" not in summary,
+        "Archived history entries carry only the summary"
+    ) and ok
+
+    mismatches = 0
+    for item in archived:
+        loaded = asyncio.run(get_analysis(db, user_id, item["id"]))
+        index = int(item["filename"].split("_")[1].split(".")[0])
+        if not loaded.get("archived") or loaded["result"] != result_for(index):
+            mismatches += 1
+    db.close()
+    ok = check(mismatches == 0, f"get_analysis loads every archived result in full ({mismatches} mismatches)") and ok
+
+    before = archive_state()
+    report = run_maintenance(engine)
+    ok = check(
+        report is not None and report["archived_results"] == 0 and archive_state() == before,
+        "Second run archives nothing and leaves the partitions untouched"
+    ) and ok
+
+    with maintenance_lock() as locked:
+        ok = check(locked and run_maintenance(engine) is None, "A run is skipped while another holds the lock") and ok
+
+    if ok:
+        print("🎉 Archival works!")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test script to verify history export runs in constant memory: exports 10% and 100% of
+a synthetic history (1M rows by default) and compares the exporting process's peak RSS
+"""
+import sys
+import os
+import json
+import time
+import random
+import resource
+import sqlite3
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+# Add the backend to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+START_DATE = datetime(2023, 1, 1)
+DAYS = 1000
+# Extra peak memory allowed for exporting ten times as many rows
+MAX_RSS_GROWTH_MB = 64
+
+def create_database(path, rows):
+    """Fill a scratch database with `rows` synthetic analyses of one user, spread over DAYS days"""
+    from database import engine
+    from migrations import upgrade_schema
+    upgrade_schema(engine)
+    engine.dispose()
+
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO users (id, email, is_verified) VALUES (1, 'export@example.com', 1)")
+    random.seed(0)
+    batch = []
+    for index in range(1, rows + 1):
+        created_at = START_DATE + timedelta(seconds=index * DAYS * 86400 // rows)
+        result = {
+            "success": True,
+            "analysis_type": "deepfake",
+            "predicted_label": random.choice(["Realism", "Deepfake"]),
+            "confidence": round(random.random(), 4),
+            "is_deepfake": random.random() > 0.5,
+            "risk_level": random.choice(["low", "medium", "high"]),
+            "deepfake_indicators": [{"name": "noise", "score": round(random.random(), 3)}]
+        }
+        batch.append((index, 1, "deepfake", f"image_{index}.jpg", json.dumps(result), created_at.isoformat(" ")))
+        if len(batch) == 50000:
+            connection.executemany("INSERT INTO analysis_results VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        connection.executemany("INSERT INTO analysis_results VALUES (?, ?, ?, ?, ?, ?)", batch)
+    connection.commit()
+    connection.close()
+
+def child(export_format, end):
+    """Run one export to nowhere and report rows, bytes, time and peak RSS"""
+    from database import SessionLocal
+    from export import iter_export_rows, stream_export
+
+    db = SessionLocal()
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    started = time.perf_counter()
+    written = 0
+    for chunk in stream_export(export_format, counted(iter_export_rows(db, 1, end=end))):
+        written += len(chunk)
+    seconds = time.perf_counter() - started
+    db.close()
+    print(json.dumps({
+        "rows": count,
+        "bytes": written,
+        "seconds": seconds,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+def run_export(export_format, end, environment):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", export_format, end.isoformat()],
+        env=environment, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print(f"🧪 Testing export memory with {rows} rows...")
+
+    path = os.environ["DATABASE_URL"][len("sqlite:///"):]
+    started = time.perf_counter()
+    create_database(path, rows)
+    print(f"✅ Created synthetic history in {time.perf_counter() - started:.0f}s")
+
+    from export import PYARROW_AVAILABLE
+    formats = ["ndjson", "csv"] + (["parquet"] if PYARROW_AVAILABLE else [])
+    failed = False
+    for export_format in formats:
+        small = run_export(export_format, START_DATE + timedelta(days=DAYS // 10), os.environ)
+        full = run_export(export_format, START_DATE + timedelta(days=DAYS + 1), os.environ)
+        growth = full["max_rss_mb"] - small["max_rss_mb"]
+        print(
+            f"   {export_format:<8} {small['rows']:>8} rows: {small['max_rss_mb']:>6.0f} MB peak | "
+            f"{full['rows']:>8} rows: {full['max_rss_mb']:>6.0f} MB peak, "
+            f"{full['rows'] / full['seconds']:>8.0f} rows/s, {full['bytes'] / 1024 / 1024:.0f} MB written"
+        )
+        if full["rows"] != rows:
+            print(f"❌ {export_format} exported {full['rows']} of {rows} rows")
+            failed = True
+        if growth > MAX_RSS_GROWTH_MB:
+            print(f"❌ {export_format} peak memory grew by {growth:.0f} MB")
+            failed = True
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+    if failed:
+        return 1
+    print("🎉 Export memory stays constant!")
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], datetime.fromisoformat(sys.argv[3]))
+        sys.exit(0)
+    # Point the backend (and the export subprocesses) at a scratch database
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    # The memory map and page cache fill up to their configured sizes on a long scan, whatever
+    # the row count; keep them small so the peak reflects the exporter's own memory
+    os.environ["SQLITE_MMAP_SIZE"] = "0"
+    os.environ["SQLITE_CACHE_SIZE_KB"] = "2000"
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test script to verify inference still matches after forking a preloaded service
+"""
+import sys
+import os
+import io
+import json
+import numpy as np
+from PIL import Image
+
+# Add the backend to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from ai_services_fixed import ImageAnalysisService, MODELS_AVAILABLE
+from model_sharing import prepare_for_fork, configure_worker_threads, memory_usage
+
+def create_test_image():
+    """Create a simple test image"""
+    img_array = np.random.RandomState(0).randint(0, 255, (224, 224, 3), dtype=np.uint8)
+    img_bytes = io.BytesIO()
+    Image.fromarray(img_array).save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+def summarize(result):
+    return {key: result.get(key) for key in ("predicted_label", "confidence", "is_deepfake")}
+
+def main():
+    print("🧪 Testing inference after fork...")
+    print(f"   Models available: {MODELS_AVAILABLE}")
+
+    service = ImageAnalysisService()
+    test_image = create_test_image()
+    before = summarize(service._analyze_deepfake_sync(test_image))
+    print(f"✅ Parent result: {before}")
+
+    prepare_for_fork()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        configure_worker_threads(2)
+        child_service = ImageAnalysisService()
+        after = summarize(child_service._analyze_deepfake_sync(test_image))
+        payload = {"result": after, "memory": memory_usage(os.getpid())}
+        with os.fdopen(write_end, "w") as pipe:
+            json.dump(payload, pipe)
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        payload = json.load(pipe)
+    os.waitpid(pid, 0)
+
+    after = payload["result"]
+    memory = payload["memory"]
+    print(f"✅ Child result:  {after}")
+    print(f"   Child memory: rss {memory['rss'] / 1024:.0f} MB, shared {memory['shared'] / 1024:.0f} MB, private {memory['private'] / 1024:.0f} MB")
+
+    if after == before:
+        print("🎉 Inference matches after fork!")
+        return 0
+    print("❌ Inference differs after fork")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script to verify migrating an old database adds the indexes, and that every query
+issued by services.py and usage_service.py then uses one
+"""
+import sys
+import os
+import asyncio
+import sqlite3
+import tempfile
+
+# Point the backend at a scratch database before it is imported
+DATABASE_PATH = tempfile.mktemp(suffix=".db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+
+# Add the backend to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from sqlalchemy import event
+from database import engine, SessionLocal
+from migrations import upgrade_schema
+from schemas import UserCreate
+from services import create_user, authenticate_user, save_analysis_result, get_user_history
+from usage_service import UsageService
+
+# Schema of databases created before the indexes were added, with a duplicated usage counter
+OLD_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR NOT NULL, is_verified BOOLEAN,
+    verification_code VARCHAR, is_subscribed BOOLEAN, subscription_start_date DATETIME,
+    subscription_end_date DATETIME, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE analysis_results (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id),
+    analysis_type VARCHAR NOT NULL, filename VARCHAR NOT NULL, result JSON NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP));
+CREATE INDEX ix_analysis_results_id ON analysis_results (id);
+CREATE TABLE daily_usage (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id),
+    usage_date DATE NOT NULL, analysis_count INTEGER, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    updated_at DATETIME);
+CREATE INDEX ix_daily_usage_id ON daily_usage (id);
+CREATE TABLE subscriptions (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id),
+    plan_type VARCHAR NOT NULL, amount FLOAT NOT NULL, payment_method VARCHAR NOT NULL, payment_id VARCHAR,
+    status VARCHAR, start_date DATETIME NOT NULL, end_date DATETIME NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME);
+CREATE INDEX ix_subscriptions_id ON subscriptions (id);
+INSERT INTO users (id, email, is_verified) VALUES (1, 'old@example.com', 1);
+INSERT INTO daily_usage (user_id, usage_date, analysis_count) VALUES (1, '2024-01-01', 3);
+INSERT INTO daily_usage (user_id, usage_date, analysis_count) VALUES (1, '2024-01-01', 2);
+"""
+
+def create_old_database():
+    connection = sqlite3.connect(DATABASE_PATH)
+    connection.executescript(OLD_SCHEMA)
+    connection.commit()
+    connection.close()
+
+def capture_selects():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    return statements
+
+async def exercise_services():
+    db = SessionLocal()
+    try:
+        user = await create_user(db, UserCreate(email="plan@example.com"))
+        await authenticate_user(db, "plan@example.com")
+        usage_service = UsageService(db)
+        usage_service.check_usage_limit(user.id)
+        usage_service.increment_usage(user.id)
+        usage_service.increment_usage(user.id)
+        usage_service.create_subscription(user.id, "visa", "payment-1")
+        usage_service.check_usage_limit(user.id)
+        usage_service.get_usage_stats(user.id)
+        await save_analysis_result(db, user.id, "deepfake", "image.jpg", {"success": True})
+        await get_user_history(db, user.id)
+    finally:
+        db.close()
+
+def unindexed_plans(statements):
+    """Query plan lines that read a whole table or sort without an index"""
+    problems = []
+    connection = sqlite3.connect(DATABASE_PATH)
+    for statement, parameters in statements:
+        for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+            detail = row[-1]
+            full_scan = detail.startswith("SCAN ") and " USING " not in detail
+            if full_scan or "TEMP B-TREE" in detail:
+                problems.append((detail, " ".join(statement.split())[:120]))
+    connection.close()
+    return problems
+
+def main():
+    print("🧪 Testing query plans...")
+
+    create_old_database()
+    created = upgrade_schema(engine)
+    print(f"✅ Migrated old database, added: {', '.join(created)}")
+
+    connection = sqlite3.connect(DATABASE_PATH)
+    counters = connection.execute("SELECT analysis_count FROM daily_usage WHERE user_id = 1").fetchall()
+    connection.close()
+    if counters != [(5,)]:
+        print(f"❌ Duplicate usage counters were not merged: {counters}")
+        return 1
+    print("✅ Duplicate usage counters merged")
+
+    if upgrade_schema(engine):
+        print("❌ Second migration run was not a no-op")
+        return 1
+
+    statements = capture_selects()
+    asyncio.run(exercise_services())
+    problems = unindexed_plans(statements)
+    print(f"   Checked {len(statements)} queries")
+
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.unlink(DATABASE_PATH + suffix)
+    if problems:
+        for detail, statement in problems:
+            print(f"❌ {detail}: {statement}")
+        return 1
+    print("🎉 Every query uses an index!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
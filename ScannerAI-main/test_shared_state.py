@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the shared-state backends, and that the free daily limit holds across
+several API nodes (processes with their own databases) sharing one Redis-protocol server.
+
+A small stand-in server speaking the subset of the Redis protocol the client uses runs in
+this process, so no Redis installation is needed.
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import socketserver
+import multiprocessing
+
+# Add the backend to the path
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.insert(0, BACKEND)
+
+NODES = 6
+ATTEMPTS_PER_NODE = 5
+FREE_DAILY_LIMIT = 7
+
+class StandInData:
+    """Keyspace of the stand-in server; every command runs under one lock, like Redis's single thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.expires = {}
+        self.versions = {}
+
+    def live(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.remove(key)
+        return self.values.get(key)
+
+    def remove(self, key):
+        if key in self.values:
+            del self.values[key]
+            self.expires.pop(key, None)
+            self.touch(key)
+
+    def touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+class Raw(bytes):
+    """A reply that is already encoded"""
+
+NIL_ARRAY = Raw(b"*-1\r\n")
+QUEUED = Raw(b"+QUEUED\r\n")
+
+def encode(reply):
+    if isinstance(reply, Raw):
+        return bytes(reply)
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-ERR " + str(reply).encode() + b"\r\n"
+    if reply == "OK":
+        return b"+OK\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def run(self, data, parts):
+        name, args = parts[0].upper(), parts[1:]
+        if name in (b"PING", b"AUTH", b"SELECT"):
+            return "OK"
+        if name == b"GET":
+            return data.live(args[0])
+        if name == b"SET":
+            key, value, options = args[0], args[1], [option.upper() for option in args[2:]]
+            if b"NX" in options and data.live(key) is not None:
+                return None
+            data.values[key] = value
+            data.expires.pop(key, None)
+            if b"PX" in options:
+                data.expires[key] = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            if b"EX" in options:
+                data.expires[key] = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            data.touch(key)
+            return "OK"
+        if name in (b"INCR", b"DECR"):
+            value = int(data.live(args[0]) or 0) + (1 if name == b"INCR" else -1)
+            data.values[args[0]] = str(value).encode()
+            data.touch(args[0])
+            return value
+        if name == b"DEL":
+            existed = data.live(args[0]) is not None
+            data.remove(args[0])
+            return int(existed)
+        return Exception(f"unknown command '{name.decode()}'")
+
+    def handle(self):
+        data = self.server.data
+        watched = {}
+        queued = None
+        while True:
+            parts = self.read_command()
+            if parts is None:
+                return
+            name = parts[0].upper()
+            with data.lock:
+                if name == b"WATCH":
+                    watched[parts[1]] = data.versions.get(parts[1], 0)
+                    reply = "OK"
+                elif name == b"UNWATCH":
+                    watched = {}
+                    reply = "OK"
+                elif name == b"MULTI":
+                    queued = []
+                    reply = "OK"
+                elif name == b"EXEC":
+                    # Runs only if no watched key changed since WATCH
+                    if any(data.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = NIL_ARRAY
+                    else:
+                        reply = [self.run(data, command) for command in queued]
+                    queued, watched = None, {}
+                elif queued is not None:
+                    queued.append(parts)
+                    reply = QUEUED
+                else:
+                    reply = self.run(data, parts)
+            self.wfile.write(encode(reply))
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.data = StandInData()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+def check_semantics(state, label):
+    """TTL expiry, increment-with-limit and lock ownership on one backend"""
+    failures = []
+    state.set("ttl", b"value", 0.2)
+    if state.get("ttl") != b"value":
+        failures.append("value not stored")
+    time.sleep(0.3)
+    if state.get("ttl") is not None:
+        failures.append("value outlived its TTL")
+
+    counts = [state.increment_within_limit("counter", 3, 60, initial=1) for _ in range(4)]
+    if counts != [2, 3, None, None] or state.counter("counter") != 3:
+        failures.append(f"increment_within_limit gave {counts}")
+    state.decrement("counter")
+    if state.increment_within_limit("counter", 3, 60) != 3:
+        failures.append("decrement did not free a slot")
+
+    token = state.acquire_lock("lock", 0.2)
+    if token is None or state.acquire_lock("lock", 0.2) is not None:
+        failures.append("lock not exclusive")
+    if state.release_lock("lock", "someone-else"):
+        failures.append("lock released with the wrong token")
+    time.sleep(0.3)
+    taken_over = state.acquire_lock("lock", 5)
+    if taken_over is None:
+        failures.append("expired lock not released")
+    if state.release_lock("lock", token):
+        failures.append("stale token released a lock taken over by another holder")
+    if not state.release_lock("lock", taken_over):
+        failures.append("holder could not release its lock")
+
+    for failure in failures:
+        print(f"❌ {label}: {failure}")
+    if not failures:
+        print(f"✅ {label}: TTL, increment-with-limit and locks behave")
+    return not failures
+
+def node(url, barrier, results):
+    """One API node: its own database, the shared counter server, as many reservations as it can get"""
+    os.environ["SHARED_STATE_URL"] = url
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    sys.path.insert(0, BACKEND)
+    from database import SessionLocal, engine
+    from migrations import upgrade_schema
+    from models import User
+    from usage_service import UsageService
+
+    upgrade_schema(engine)
+    db = SessionLocal()
+    db.add(User(id=1, email="shared@example.com", is_verified=True))
+    db.commit()
+
+    barrier.wait()
+    granted = 0
+    for _ in range(ATTEMPTS_PER_NODE):
+        if UsageService(db).reserve_analysis(1)["can_analyze"]:
+            granted += 1
+    db.close()
+    results.put(granted)
+
+def run_nodes(url):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(NODES)
+    results = context.Queue()
+    processes = [context.Process(target=node, args=(url, barrier, results)) for _ in range(NODES)]
+    for process in processes:
+        process.start()
+    granted = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join()
+    return granted
+
+async def check_shared_single_flight(url):
+    """Two nodes analyzing the same image: one runs it, the other gets its result; a later
+    upload is analyzed again, and a node waiting on a stuck one gives up at its deadline"""
+    from shared_state import RedisState
+    from single_flight import SingleFlight
+    from admission import AdmissionRejected
+
+    runs = []
+
+    async def analyze():
+        runs.append(1)
+        await asyncio.sleep(0.2)
+        return {"success": True, "label": "real"}
+
+    first, second = SingleFlight(RedisState(url), 0.5), SingleFlight(RedisState(url), 0.5)
+    results = await asyncio.gather(first.do("key", analyze), second.do("key", analyze))
+    ok = len(runs) == 1 and results[0] == results[1]
+    print(f"{'✅' if ok else '❌'} Shared single flight: {len(runs)} run(s) for 2 concurrent requests on 2 nodes")
+
+    await asyncio.sleep(0.6)
+    await SingleFlight(RedisState(url), 0.5).do("key", analyze)
+    repeated = len(runs) == 2
+    print(f"{'✅' if repeated else '❌'} A later request for the same image runs again instead of reusing the result")
+
+    # A node holding the lock that never finishes (e.g. stuck or partitioned away)
+    RedisState(url).acquire_lock("lock:stuck", 60)
+    started = time.perf_counter()
+    try:
+        await SingleFlight(RedisState(url)).do("stuck", analyze, deadline=0.3)
+        bounded = False
+    except AdmissionRejected:
+        bounded = time.perf_counter() - started < 1.0
+    print(f"{'✅' if bounded else '❌'} Waiting on another node gives up at the request deadline "
+          f"({time.perf_counter() - started:.2f}s for a 0.3s deadline)")
+    return ok and repeated and bounded
+
+def main():
+    print("🧪 Testing shared state...")
+    from shared_state import InProcessState, RedisState
+
+    server = StandInServer()
+    ok = check_semantics(InProcessState(), "In-process")
+    ok = check_semantics(RedisState(server.url), "Redis protocol") and ok
+    ok = asyncio.run(check_shared_single_flight(server.url)) and ok
+
+    started = time.perf_counter()
+    granted = run_nodes(server.url)
+    print(f"   {NODES} nodes x {ATTEMPTS_PER_NODE} attempts, shared counter: granted {granted} "
+          f"= {sum(granted)} in {time.perf_counter() - started:.1f}s")
+    if sum(granted) == FREE_DAILY_LIMIT:
+        print(f"✅ Free daily limit of {FREE_DAILY_LIMIT} held across all nodes")
+    else:
+        print(f"❌ Nodes granted {sum(granted)} analyses, limit is {FREE_DAILY_LIMIT}")
+        ok = False
+
+    granted = run_nodes("memory://")
+    print(f"   Without shared state each node enforces its own limit: granted {sum(granted)}")
+
+    if ok:
+        print("🎉 Shared state works!")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
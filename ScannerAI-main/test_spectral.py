@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the spectral GAN-artifact detector: a model fitted on nearest-upsampled
+versus natural-looking images tells held-out ones apart, and once fitted its score vetoes
+the cascade's fast stage and shows up among the deepfake indicators
+"""
+import sys
+import os
+import io
+import json
+import tempfile
+import numpy as np
+from PIL import Image
+
+MODEL_PATH = os.path.join(tempfile.mkdtemp(), "spectral_model.json")
+
+# Add the backend to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from image_metrics import MetricContext
+import spectral_analysis
+from spectral_analysis import SpectralModel, SPECTRAL_CROP_SIZE, load_model, prepare_crop, spectral_features
+
+SIDE = 512
+TRAIN_IMAGES = 40
+TEST_IMAGES = 20
+MIN_ACCURACY = 0.95
+
+def pink_noise(rng, side):
+    """Texture with the 1/f amplitude spectrum of natural images"""
+    frequency = np.sqrt(np.fft.fftfreq(side)[:, None] ** 2 + np.fft.fftfreq(side)[None, :] ** 2)
+    frequency[0, 0] = 1.0
+    texture = np.real(np.fft.ifft2(np.fft.fft2(rng.normal(size=(side, side))) / frequency))
+    return (texture - texture.mean()) / texture.std()
+
+def encode(gray):
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8)).convert("RGB").save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+def natural_image(rng):
+    return encode(128 + 40 * pink_noise(rng, SIDE) + rng.normal(0, 3, (SIDE, SIDE)))
+
+def upsampled_image(rng):
+    """A smaller texture blown up by nearest-neighbour upsampling, as a generator's last layers do"""
+    factor = int(rng.choice([2, 4]))
+    small = 128 + 40 * pink_noise(rng, SIDE // factor)
+    return encode(np.kron(small, np.ones((factor, factor))) + rng.normal(0, 1, (SIDE, SIDE)))
+
+def features_of(images):
+    return spectral_features(np.stack([prepare_crop(MetricContext(image).get("gray")) for image in images]))
+
+def main():
+    print("🧪 Testing the spectral GAN-artifact detector...")
+    rng = np.random.default_rng(0)
+    natural = [natural_image(rng) for _ in range(TRAIN_IMAGES + TEST_IMAGES)]
+    upsampled = [upsampled_image(rng) for _ in range(TRAIN_IMAGES + TEST_IMAGES)]
+
+    train = features_of(natural[:TRAIN_IMAGES] + upsampled[:TRAIN_IMAGES])
+    labels = np.array([0.0] * TRAIN_IMAGES + [1.0] * TRAIN_IMAGES)
+    model = SpectralModel.fit(train, labels, SPECTRAL_CROP_SIZE)
+    test = features_of(natural[TRAIN_IMAGES:] + upsampled[TRAIN_IMAGES:])
+    expected = np.array([False] * TEST_IMAGES + [True] * TEST_IMAGES)
+    accuracy = float(((model.predict(test) >= 0.5) == expected).mean())
+    ok = accuracy >= MIN_ACCURACY
+    print(f"{'✅' if ok else '❌'} Held-out accuracy {accuracy:.1%} on {2 * TEST_IMAGES} images")
+
+    # Loaded the way the service loads spectral_model.json at startup, before it is imported
+    with open(MODEL_PATH, "w") as model_file:
+        json.dump(model.to_json(), model_file)
+    spectral_analysis.SPECTRAL_MODEL = load_model(MODEL_PATH)
+    from ai_services_fixed import ImageAnalysisService, SPECTRAL_METRICS
+    if not SPECTRAL_METRICS:
+        print("❌ The service did not load the fitted model")
+        return 1
+    service = ImageAnalysisService()
+
+    result = service._analyze_deepfake_cascade_sync(upsampled[-1])
+    flagged = any("frequency spectrum" in indicator["indicator"] for indicator in result.get("deepfake_indicators", []))
+    escalated = result.get("cascade", {}).get("stage") == "full"
+    print(f"{'✅' if flagged and escalated else '❌'} Upsampled image: spectral indicator {flagged}, escalated {escalated}")
+    ok = ok and flagged and escalated
+
+    result = service._analyze_deepfake_cascade_sync(natural[-1])
+    cleared = not any("frequency spectrum" in indicator["indicator"] for indicator in result.get("deepfake_indicators", []))
+    print(f"{'✅' if cleared else '❌'} Natural image: no spectral indicator (cascade stage {result.get('cascade', {}).get('stage')})")
+    ok = ok and cleared
+
+    if ok:
+        print("🎉 Spectral detector works!")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,8 +4,15 @@ import torch
 from transformers import ViTImageProcessor, ViTForImageClassification
 import numpy as np
 import sys
+import os
+import io
+import hashlib
 import matplotlib.pyplot as plt
 
+# Rendered heatmaps are kept in the backend's content-addressed artifact store
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ScannerAI-main", "backend"))
+from artifact_store import artifact_store
+
 # -----------------------------------------------------------------------------
 # 🔹 استيراد Noiseprint من المسار الصحيح داخل مشروعك
 # -----------------------------------------------------------------------------
@@ -161,11 +168,25 @@ def forgery_detection_page():
     uploaded = st.file_uploader("Upload any image", type=["jpg","jpeg","png"])
     if uploaded:
         img = Image.open(uploaded).convert("L")  # grayscale
-        img_np = np.array(img)
-        img_np = img_np[np.newaxis, :, :, np.newaxis].astype(np.float32)
 
         try:
-            noise_map = genNoiseprint(img_np)
+            # Streamlit reruns the whole page on every interaction: render each upload once
+            key = f"noiseprint:{hashlib.sha256(uploaded.getvalue()).hexdigest()}"
+            name = artifact_store.lookup(key)
+            if name is None:
+                img_np = np.array(img)
+                img_np = img_np[np.newaxis, :, :, np.newaxis].astype(np.float32)
+                noise_map = genNoiseprint(img_np)
+
+                fig, ax = plt.subplots()
+                cax = ax.imshow(noise_map, cmap="jet")
+                ax.axis("off")
+                fig.colorbar(cax)
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format="png", bbox_inches="tight")
+                plt.close(fig)
+                name = artifact_store.put(buffer.getvalue(), "png")
+                artifact_store.remember(key, name)
 
             col1, col2 = st.columns(2)
 
@@ -173,11 +194,7 @@ def forgery_detection_page():
                 st.image(img, caption="Original Image", use_column_width=True, channels="GRAY")
 
             with col2:
-                fig, ax = plt.subplots()
-                cax = ax.imshow(noise_map, cmap="jet")
-                ax.axis("off")
-                fig.colorbar(cax)
-                st.pyplot(fig)
+                st.image(artifact_store.path(name), use_column_width=True)
                 st.caption("Noiseprint Heatmap")
 
             st.info("✅ تحقق من الخريطة: المناطق غير الطبيعية (ألوان حادة) قد تشير إلى تعديل أو تزوير.")